@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+链接替换基准测试
+生成模拟的中文章节内容树与映射表，分别用各种替换模式处理，报告吞吐量、
+单文件耗时分位数与峰值内存，结果保存为 JSON 以便在不同提交之间对比。
+
+用法:
+  python3 scripts/bench_link_rewrite.py --files 200 --file-kb 64 --mappings 500
+  python3 scripts/bench_link_rewrite.py --modes memory,stream --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from link_rewrite import FAILED, UPDATED, LinkRewriter, rewrite_file, run_file_jobs, stream_rewrite_file
+
+# 支持的替换模式
+MODES = ('memory', 'stream', 'parallel')
+
+# 常用汉字与标点，用于生成接近真实章节的正文
+_CJK_TEXT = (
+    "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏闰余成岁律吕调阳云腾致雨露结为霜"
+    "金生丽水玉出昆冈剑号巨阙珠称夜光果珍李柰菜重芥姜海咸河淡鳞潜羽翔龙师火帝鸟官人皇"
+    "文明演化地球液压传动系统传国玉玺止血机制大陆漂移三体遗产黑洞信息悖论引力熵"
+)
+_PUNCTUATION = "，。；：、！？"
+
+def _paragraph(rng, length):
+    chars = []
+    for _ in range(length):
+        chars.append(rng.choice(_PUNCTUATION) if rng.random() < 0.08 else rng.choice(_CJK_TEXT))
+    return ''.join(chars)
+
+def _link(rng, video_keys, link_keys):
+    """
+    随机生成一处链接：多数命中映射，少数为未映射的路径
+    """
+    roll = rng.random()
+    if roll < 0.1:
+        return f"[参考视频](/videos/unmapped/clip{rng.randrange(10 ** 6)}.mp4)"
+    if roll < 0.5 and video_keys:
+        key = rng.choice(video_keys)
+        style = rng.randrange(3)
+        if style == 0:
+            return f"[观看视频](/videos/{key})"
+        if style == 1:
+            return f'{{{{< video src="/videos/{key}" >}}}}'
+        return f"static/videos/{key}"
+    if link_keys:
+        return f"![插图]({rng.choice(link_keys)})"
+    return ""
+
+def generate_tree(root, files, file_kb, mappings, density, seed):
+    """
+    生成内容树与映射，返回 (视频映射, 字面映射)
+
+    density 为每 KB 正文中的链接数。
+    """
+    rng = random.Random(seed)
+    video_count = mappings // 2
+    video_mapping = {
+        f"chapter{i % 50}/clip{i}.mp4": f"https://cdn.example.com/videos/chapter{i % 50}/clip{i}.mp4"
+        for i in range(video_count)
+    }
+    link_mapping = {
+        f"media/inline/images/fig{i}.png": f"https://cdn.example.com/inline/images/fig{i}.png"
+        for i in range(mappings - video_count)
+    }
+    video_keys = list(video_mapping)
+    link_keys = list(link_mapping)
+
+    target_chars = file_kb * 1024 // 3  # 汉字按 UTF-8 三字节估算
+    for index in range(files):
+        directory = os.path.join(root, f"part{index % 10}")
+        os.makedirs(directory, exist_ok=True)
+        pieces = [f"# 第{index}章\n\n"]
+        size = 0
+        while size < target_chars:
+            paragraph = _paragraph(rng, rng.randint(80, 400))
+            links = [_link(rng, video_keys, link_keys) for _ in range(max(0, round(len(paragraph) * 3 / 1024 * density)))]
+            pieces.append(paragraph + ' ' + ' '.join(links) + "\n\n")
+            size += len(pieces[-1])
+        with open(os.path.join(directory, f"chapter{index}.md"), 'w', encoding='utf-8') as f:
+            f.write(''.join(pieces))
+
+    return video_mapping, link_mapping
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+# 进程池中每个工作进程持有一份替换器与模式
+_bench_rewriter = None
+_bench_chunk_size = None
+
+def _init_bench_worker(rewriter, chunk_size):
+    global _bench_rewriter, _bench_chunk_size
+    _bench_rewriter = rewriter
+    _bench_chunk_size = chunk_size
+
+def _timed_worker(file_path):
+    started = time.perf_counter()
+    if _bench_chunk_size:
+        status = stream_rewrite_file(file_path, _bench_rewriter, _bench_chunk_size)
+    else:
+        status = rewrite_file(file_path, _bench_rewriter)
+    return status, time.perf_counter() - started
+
+def run_mode(mode, tree, mapping_file, jobs, chunk_size):
+    """
+    在当前进程中运行一种模式（由 main 在独立子进程中调用，以便单独统计峰值内存）
+    """
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        mappings = json.load(f)
+    rewriter = LinkRewriter(mappings['video'], mappings['links'])
+
+    files = sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(tree) for name in names if name.endswith('.md')
+    )
+    total_bytes = sum(os.path.getsize(file_path) for file_path in files)
+
+    results, elapsed = run_file_jobs(
+        files, _timed_worker,
+        jobs=jobs if mode == 'parallel' else 1,
+        initializer=_init_bench_worker,
+        initargs=(rewriter, chunk_size if mode == 'stream' else None)
+    )
+    # _timed_worker 返回 (结果, 秒数)；抛出异常时 run_file_jobs 只记为 FAILED
+    latencies = [outcome[1] * 1000 for _, outcome in results if isinstance(outcome, tuple)]
+    statuses = [outcome[0] if isinstance(outcome, tuple) else outcome for _, outcome in results]
+
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        'files': len(files),
+        'bytes': total_bytes,
+        'seconds': round(elapsed, 4),
+        'files_per_sec': round(len(files) / elapsed, 2) if elapsed else 0.0,
+        'mb_per_sec': round(total_bytes / elapsed / (1 << 20), 2) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 0.50), 3),
+            'p90': round(_percentile(latencies, 0.90), 3),
+            'p99': round(_percentile(latencies, 0.99), 3),
+            'max': round(max(latencies), 3) if latencies else 0.0,
+        },
+        'peak_rss_kb': max(own, children),
+        'updated': statuses.count(UPDATED),
+        'failed': statuses.count(FAILED),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(current, baseline):
+    """
+    打印与基线结果的对比（吞吐量与 p50 耗时）
+    """
+    print(f"\n📊 与基线对比 ({baseline.get('commit')} → {current.get('commit')}):")
+    for mode, result in current['results'].items():
+        old = baseline.get('results', {}).get(mode)
+        if not old:
+            continue
+        speedup = result['files_per_sec'] / old['files_per_sec'] if old['files_per_sec'] else 0.0
+        print(f"  {mode:<9} 吞吐 {old['files_per_sec']:.1f} → {result['files_per_sec']:.1f} 文件/秒 ({speedup:.2f}x)，"
+              f"p50 {old['latency_ms']['p50']:.2f} → {result['latency_ms']['p50']:.2f} ms，"
+              f"峰值内存 {old['peak_rss_kb']} → {result['peak_rss_kb']} KB")
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="链接替换基准测试")
+    parser.add_argument('--files', type=int, default=200, help='生成的 Markdown 文件数')
+    parser.add_argument('--file-kb', type=int, default=64, help='单个文件大小（KB）')
+    parser.add_argument('--mappings', type=int, default=500, help='映射条数（视频与媒体各半）')
+    parser.add_argument('--density', type=float, default=2.0, help='每 KB 正文中的链接数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--modes', default=','.join(MODES), help=f"逗号分隔的模式: {', '.join(MODES)}")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='parallel 模式的进程数')
+    parser.add_argument('--chunk-size', type=int, default=1 << 16, help='stream 模式的分块大小（字符数）')
+    parser.add_argument('--output', default='link_rewrite_bench.json', help='结果 JSON 路径')
+    parser.add_argument('--compare', metavar='JSON', help='与之前保存的结果对比')
+    parser.add_argument('--run-mode', help=argparse.SUPPRESS)
+    parser.add_argument('--tree', help=argparse.SUPPRESS)
+    parser.add_argument('--mapping-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 子进程：只运行一种模式并输出 JSON
+    if args.run_mode:
+        result = run_mode(args.run_mode, args.tree, args.mapping_file, args.jobs, args.chunk_size)
+        print(json.dumps(result))
+        return
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"未知模式: {', '.join(unknown)}")
+
+    print("⏱️  链接替换基准测试")
+    print("=" * 50)
+
+    workdir = tempfile.mkdtemp(prefix='link-bench-')
+    try:
+        template = os.path.join(workdir, 'template')
+        video_mapping, link_mapping = generate_tree(
+            template, args.files, args.file_kb, args.mappings, args.density, args.seed
+        )
+        mapping_file = os.path.join(workdir, 'mapping.json')
+        with open(mapping_file, 'w', encoding='utf-8') as f:
+            json.dump({'video': video_mapping, 'links': link_mapping}, f, ensure_ascii=False)
+        print(f"📄 生成 {args.files} 个文件 × {args.file_kb} KB，{args.mappings} 条映射，每 KB {args.density} 处链接")
+
+        results = {}
+        for mode in modes:
+            tree = os.path.join(workdir, mode)
+            shutil.copytree(template, tree)
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run-mode', mode, '--tree', tree,
+                 '--mapping-file', mapping_file, '--jobs', str(args.jobs), '--chunk-size', str(args.chunk_size)],
+                capture_output=True, text=True, check=True
+            )
+            results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+            result = results[mode]
+            print(f"  {mode:<9} {result['files_per_sec']:>9.1f} 文件/秒 {result['mb_per_sec']:>7.1f} MB/s  "
+                  f"p50 {result['latency_ms']['p50']:.2f} ms  p99 {result['latency_ms']['p99']:.2f} ms  "
+                  f"峰值内存 {result['peak_rss_kb']} KB")
+            shutil.rmtree(tree)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'files': args.files, 'file_kb': args.file_kb, 'mappings': args.mappings,
+            'density': args.density, 'seed': args.seed, 'jobs': args.jobs, 'chunk_size': args.chunk_size,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📝 结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_results(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
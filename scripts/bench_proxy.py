@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理服务压测
+在回环地址上启动本地源站与 proxy_server.py，按不同引擎、负载类型、响应大小与并发数
+施加压力，报告请求/秒、MB/s、延迟分位数，以及代理进程的线程数、内存与 CPU 占用，
+结果保存为 JSON 以便在不同提交（或引擎改动）之间对比。
+
+负载类型:
+  http     keep-alive 连接上反复 GET（绝对 URI 形式，经代理转发）
+  connect  每个请求新建 CONNECT 隧道，在隧道内 GET 一次后关闭
+
+用法:
+  python3 scripts/bench_proxy.py --duration 5 --concurrency 16,128 --sizes 1k,64k,1m
+  python3 scripts/bench_proxy.py --engines asyncio --proxy-args "--cache" --output new.json --compare old.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from bench_link_rewrite import _git_commit, _percentile
+
+ENGINES = ('asyncio', 'threaded')
+WORKLOADS = ('http', 'connect')
+
+PROXY_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'proxy_server.py')
+
+_SIZE_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20}
+
+def parse_size(value):
+    """
+    解析 "512"、"64k"、"1m" 形式的字节数
+    """
+    value = value.strip().lower()
+    unit = value[-1] if value and value[-1] in 'km' else ''
+    return int(value[:len(value) - len(unit)]) * _SIZE_UNITS[unit]
+
+def format_size(size):
+    for suffix, unit in (('m', 1 << 20), ('k', 1 << 10)):
+        if size >= unit and size % unit == 0:
+            return f"{size // unit}{suffix}"
+    return str(size)
+
+# ---------------------------------------------------------------------------
+# 源站（独立子进程）
+# ---------------------------------------------------------------------------
+
+_PAYLOAD = memoryview(bytes(1 << 20))
+
+async def _origin_client(reader, writer):
+    """
+    GET /bytes/<n> 返回 n 字节；支持 keep-alive
+    """
+    try:
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            request_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+            path = request_line.split(' ')[1]
+            size = int(path.rsplit('/', 1)[-1]) if path.startswith('/bytes/') else 0
+            close = b'connection: close' in head.lower()
+            writer.write(
+                f"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nContent-Length: {size}\r\n"
+                f"{'Connection: close' if close else 'Connection: keep-alive'}\r\n\r\n".encode('latin-1')
+            )
+            remaining = size
+            while remaining:
+                block = _PAYLOAD[:min(len(_PAYLOAD), remaining)]
+                writer.write(block)
+                remaining -= len(block)
+                await writer.drain()
+            await writer.drain()
+            if close:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError, IndexError):
+        pass
+    finally:
+        writer.close()
+
+async def _serve_origin():
+    server = await asyncio.start_server(_origin_client, '127.0.0.1', 0, backlog=4096)
+    print(server.sockets[0].getsockname()[1], flush=True)
+    async with server:
+        await server.serve_forever()
+
+# ---------------------------------------------------------------------------
+# 负载（独立子进程，每个进程一个事件循环）
+# ---------------------------------------------------------------------------
+
+async def _read_response(reader, buffer_size=1 << 16):
+    """
+    读取一个定长响应，返回 (状态码, 响应体字节数)
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value.strip())
+    remaining = length
+    while remaining:
+        data = await reader.read(min(buffer_size, remaining))
+        if not data:
+            raise ConnectionError("响应体不完整")
+        remaining -= len(data)
+    return status, length
+
+async def _http_worker(proxy_port, origin_port, size, deadline, stats):
+    request = (f"GET http://127.0.0.1:{origin_port}/bytes/{size} HTTP/1.1\r\n"
+               f"Host: 127.0.0.1:{origin_port}\r\n\r\n").encode('latin-1')
+    writer = None
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', proxy_port)
+            writer.write(request)
+            status, length = await _read_response(reader)
+            if status != 200:
+                raise ConnectionError(f"状态码 {status}")
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats['errors'] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            continue
+        stats['latencies'].append((time.perf_counter() - started) * 1000)
+        stats['bytes'] += length
+    if writer is not None:
+        writer.close()
+
+async def _connect_worker(proxy_port, origin_port, size, deadline, stats):
+    connect = (f"CONNECT 127.0.0.1:{origin_port} HTTP/1.1\r\n"
+               f"Host: 127.0.0.1:{origin_port}\r\n\r\n").encode('latin-1')
+    request = (f"GET /bytes/{size} HTTP/1.1\r\nHost: 127.0.0.1:{origin_port}\r\n"
+               f"Connection: close\r\n\r\n").encode('latin-1')
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', proxy_port)
+            writer.write(connect)
+            head = await reader.readuntil(b'\r\n\r\n')
+            if b' 200 ' not in head.split(b'\r\n', 1)[0] + b' ':
+                raise ConnectionError("CONNECT 被拒绝")
+            writer.write(request)
+            status, length = await _read_response(reader)
+            if status != 200:
+                raise ConnectionError(f"状态码 {status}")
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats['errors'] += 1
+            continue
+        finally:
+            if writer is not None:
+                writer.close()
+        stats['latencies'].append((time.perf_counter() - started) * 1000)
+        stats['bytes'] += length
+
+async def _run_load(workload, proxy_port, origin_port, size, concurrency, duration):
+    stats = {'latencies': [], 'bytes': 0, 'errors': 0}
+    worker = _http_worker if workload == 'http' else _connect_worker
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(proxy_port, origin_port, size, deadline, stats) for _ in range(concurrency)))
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+# ---------------------------------------------------------------------------
+# 代理进程采样
+# ---------------------------------------------------------------------------
+
+class ProcessSampler:
+    """
+    定期读取 /proc/<pid> 记录峰值线程数与内存、累计 CPU 时间（仅 Linux）
+
+    代理以 --workers 运行时把 supervisor 与各 worker 子进程合计。
+    """
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss_kb = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.cpu_start = self._cpu_seconds()
+
+    @staticmethod
+    def _stat_fields(pid):
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            return f.read().rsplit(')', 1)[1].split()
+
+    def _pids(self):
+        pids = [self.pid]
+        for name in os.listdir('/proc'):
+            if not name.isdigit():
+                continue
+            try:
+                if int(self._stat_fields(name)[1]) == self.pid:
+                    pids.append(int(name))
+            except (OSError, IndexError, ValueError):
+                pass
+        return pids
+
+    def _cpu_seconds(self):
+        total = 0
+        try:
+            for pid in self._pids():
+                fields = self._stat_fields(pid)
+                total += int(fields[11]) + int(fields[12])
+                if pid == self.pid:
+                    # 已退出并被回收的 worker
+                    total += int(fields[13]) + int(fields[14])
+        except (OSError, IndexError, ValueError):
+            return None
+        return total / os.sysconf('SC_CLK_TCK')
+
+    def _sample(self):
+        threads = rss_kb = 0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/status", 'r') as f:
+                    for line in f:
+                        if line.startswith('Threads:'):
+                            threads += int(line.split()[1])
+                        elif line.startswith('VmRSS:'):
+                            rss_kb += int(line.split()[1])
+            except OSError:
+                pass
+        self.peak_threads = max(self.peak_threads, threads)
+        self.peak_rss_kb = max(self.peak_rss_kb, rss_kb)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        self._sample()
+        cpu_end = self._cpu_seconds()
+        self.cpu_seconds = (cpu_end - self.cpu_start
+                            if cpu_end is not None and self.cpu_start is not None else None)
+
+# ---------------------------------------------------------------------------
+# 编排
+# ---------------------------------------------------------------------------
+
+def _wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"端口 {port} 未就绪")
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_proxy(engine, proxy_args):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, PROXY_SERVER, str(port), '--host', '127.0.0.1', '--engine', engine] + proxy_args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    _wait_for_port(port)
+    return process, port
+
+def run_scenario(proxy, proxy_port, origin_port, workload, size, concurrency, duration, load_procs):
+    """
+    运行一个场景：把并发连接平均分配给 load_procs 个负载进程，汇总结果
+    """
+    procs = max(1, min(load_procs, concurrency))
+    shares = [concurrency // procs + (1 if index < concurrency % procs else 0) for index in range(procs)]
+    with ProcessSampler(proxy.pid) as sampler:
+        loaders = [
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--run-load', workload,
+                 '--proxy-port', str(proxy_port), '--origin-port', str(origin_port),
+                 '--size', str(size), '--concurrency', str(share), '--duration', str(duration)],
+                stdout=subprocess.PIPE, text=True
+            )
+            for share in shares
+        ]
+        outputs = [json.loads(loader.communicate()[0].strip().splitlines()[-1]) for loader in loaders]
+
+    latencies = [value for output in outputs for value in output['latencies']]
+    seconds = max(output['seconds'] for output in outputs)
+    total_bytes = sum(output['bytes'] for output in outputs)
+    return {
+        'requests': len(latencies),
+        'errors': sum(output['errors'] for output in outputs),
+        'seconds': round(seconds, 3),
+        'rps': round(len(latencies) / seconds, 1) if seconds else 0.0,
+        'mb_per_sec': round(total_bytes / seconds / (1 << 20), 2) if seconds else 0.0,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 0.50), 3),
+            'p95': round(_percentile(latencies, 0.95), 3),
+            'p99': round(_percentile(latencies, 0.99), 3),
+            'max': round(max(latencies), 3) if latencies else 0.0,
+        },
+        'proxy_threads': sampler.peak_threads,
+        'proxy_rss_kb': sampler.peak_rss_kb,
+        'proxy_cpu_seconds': round(sampler.cpu_seconds, 3) if sampler.cpu_seconds is not None else None,
+    }
+
+def compare_results(current, baseline):
+    """
+    打印与基线结果的对比（请求/秒、p99 与代理内存）
+    """
+    print(f"\n📊 与基线对比 ({baseline.get('commit')} → {current.get('commit')}):")
+    for key, result in current['results'].items():
+        old = baseline.get('results', {}).get(key)
+        if not old:
+            continue
+        speedup = result['rps'] / old['rps'] if old['rps'] else 0.0
+        print(f"  {key:<28} {old['rps']:>9.1f} → {result['rps']:>9.1f} 请求/秒 ({speedup:.2f}x)，"
+              f"p99 {old['latency_ms']['p99']:.2f} → {result['latency_ms']['p99']:.2f} ms，"
+              f"内存 {old['proxy_rss_kb']} → {result['proxy_rss_kb']} KB")
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="代理服务压测")
+    parser.add_argument('--engines', default=','.join(ENGINES), help=f"逗号分隔的引擎: {', '.join(ENGINES)}")
+    parser.add_argument('--workloads', default=','.join(WORKLOADS), help=f"逗号分隔的负载: {', '.join(WORKLOADS)}")
+    parser.add_argument('--sizes', default='1k,64k,1m', help='逗号分隔的响应大小（支持 k/m 后缀）')
+    parser.add_argument('--concurrency', default='16,128', help='逗号分隔的并发连接数')
+    parser.add_argument('--duration', type=float, default=5.0, help='每个场景的持续时间（秒）')
+    parser.add_argument('--load-procs', type=int, default=2, help='产生负载的进程数')
+    parser.add_argument('--proxy-args', default='', help='传给 proxy_server.py 的额外参数')
+    parser.add_argument('--output', default='proxy_bench.json', help='结果 JSON 路径')
+    parser.add_argument('--compare', metavar='JSON', help='与之前保存的结果对比')
+    parser.add_argument('--run-origin', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--run-load', choices=WORKLOADS, help=argparse.SUPPRESS)
+    parser.add_argument('--proxy-port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--origin-port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # 子进程：源站或一份负载
+    if args.run_origin:
+        asyncio.run(_serve_origin())
+        return
+    if args.run_load:
+        stats = asyncio.run(_run_load(args.run_load, args.proxy_port, args.origin_port, args.size,
+                                      int(args.concurrency), args.duration))
+        print(json.dumps(stats))
+        return
+
+    engines = _split(args.engines)
+    workloads = _split(args.workloads)
+    unknown = [name for name in engines if name not in ENGINES] + [name for name in workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"未知引擎或负载: {', '.join(unknown)}")
+    sizes = [parse_size(value) for value in _split(args.sizes)]
+    concurrencies = [int(value) for value in _split(args.concurrency)]
+    proxy_args = shlex.split(args.proxy_args)
+
+    print("⏱️  代理服务压测")
+    print("=" * 50)
+    print(f"🔧 引擎 {', '.join(engines)}，负载 {', '.join(workloads)}，"
+          f"大小 {', '.join(format_size(size) for size in sizes)}，并发 {', '.join(map(str, concurrencies))}，"
+          f"每场景 {args.duration:g} 秒")
+
+    origin = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--run-origin'],
+                              stdout=subprocess.PIPE, text=True)
+    results = {}
+    try:
+        origin_port = int(origin.stdout.readline())
+        for engine in engines:
+            proxy, proxy_port = start_proxy(engine, proxy_args)
+            try:
+                for workload in workloads:
+                    for size in sizes:
+                        for concurrency in concurrencies:
+                            key = f"{engine}/{workload}/{format_size(size)}/c{concurrency}"
+                            result = run_scenario(proxy, proxy_port, origin_port, workload, size,
+                                                  concurrency, args.duration, args.load_procs)
+                            results[key] = result
+                            print(f"  {key:<28} {result['rps']:>9.1f} 请求/秒 {result['mb_per_sec']:>8.1f} MB/s  "
+                                  f"p50 {result['latency_ms']['p50']:.2f} p95 {result['latency_ms']['p95']:.2f} "
+                                  f"p99 {result['latency_ms']['p99']:.2f} ms  "
+                                  f"线程 {result['proxy_threads']} 内存 {result['proxy_rss_kb']} KB"
+                                  + (f"  ❌ 错误 {result['errors']}" if result['errors'] else ''))
+            finally:
+                proxy.terminate()
+                proxy.wait()
+    finally:
+        origin.terminate()
+        origin.wait()
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'engines': engines, 'workloads': workloads, 'sizes': sizes, 'concurrency': concurrencies,
+            'duration': args.duration, 'load_procs': args.load_procs, 'proxy_args': proxy_args,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📝 结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_results(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件工具
+链接替换、映射库、上传脚本与代理缓存共用的原子写入与内容哈希。
+"""
+
+import hashlib
+import os
+import tempfile
+
+def file_digest(file_path, block_size=1 << 20):
+    """
+    计算文件内容的 SHA-256（分块读取）
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def open_temp_for(file_path, mode='w'):
+    """
+    在目标文件同目录创建临时文件，返回 (文件对象, 临时路径)；mode 为 'w' 或 'wb'
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(file_path) + '.', suffix='.tmp', dir=directory)
+    if 'b' in mode:
+        return os.fdopen(fd, mode), tmp_path
+    return os.fdopen(fd, mode, encoding='utf-8'), tmp_path
+
+def commit_temp(tmp_file, tmp_path, file_path):
+    """
+    落盘临时文件并重命名覆盖目标文件（保留原文件权限）
+    """
+    tmp_file.flush()
+    os.fsync(tmp_file.fileno())
+    tmp_file.close()
+    try:
+        os.chmod(tmp_path, os.stat(file_path).st_mode & 0o7777)
+    except FileNotFoundError:
+        pass
+    os.replace(tmp_path, file_path)
+
+def discard_temp(tmp_file, tmp_path):
+    """
+    关闭并删除未提交的临时文件
+    """
+    tmp_file.close()
+    try:
+        os.unlink(tmp_path)
+    except FileNotFoundError:
+        pass
+
+def atomic_write_text(file_path, text):
+    """
+    原子写入文本文件：先写入同目录临时文件，再重命名覆盖原文件，
+    中途崩溃不会留下写了一半的文件
+    """
+    file_path = str(file_path)
+    tmp_file, tmp_path = open_temp_for(file_path)
+    try:
+        tmp_file.write(text)
+        commit_temp(tmp_file, tmp_path, file_path)
+    except BaseException:
+        discard_temp(tmp_file, tmp_path)
+        raise
@@ -0,0 +1,703 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+链接替换公共库
+合并任意数量的映射表（管道分隔 txt / CSV / JSON / SQLite 映射库），对每个 Markdown 文件
+只做一次 读取-替换-写回；提供增量处理清单、原子写入与多进程并行处理。
+replace_video_links.py 与 update-links.py 均为本模块之上的命令行封装。
+
+用法:
+  python3 scripts/link_rewrite.py --video video_url_mapping.txt \
+      --links media/inline-mapping.csv --links media/notebooklm-mapping.csv \
+      --content-dir content --content-dir hugo/content
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from fileutil import atomic_write_text, commit_temp, discard_temp, file_digest, open_temp_for
+
+# 单个文件的处理结果
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+
+# 普通文件路径中不会出现的分隔字符：空白、括号，以及中文标点（中文正文没有空格，
+# 标点是路径与正文之间唯一的边界）
+_PATH_DELIMITERS = r'\s<>()\[\]，。、；：！？「」『』《》（）【】'
+
+# 匹配视频链接的正则表达式（顺序即优先级）
+VIDEO_PATTERNS = [
+    # 标准 Markdown 语法
+    r'\[([^\]]*(?:视频|video|播放)[^\]]*)\]\(([^)]+\.(?:mp4|webm|mov|avi|mkv))\)',
+    # 直接的文件路径
+    r'(?:src|href)="([^"]+\.(?:mp4|webm|mov|avi|mkv))"',
+    # 普通的文件路径引用
+    rf'([^{_PATH_DELIMITERS}]+\.(?:mp4|webm|mov|avi|mkv))',
+]
+
+# 各模式中承载视频地址的分组（在合并后的正则中的编号）
+_URL_GROUPS = (2, 3, 4)
+
+# 普通路径模式的分组：其中可能带有路径前面没有分隔的正文
+_BARE_PATH_GROUP = 4
+
+# 普通路径中映射键之前仍属于同一路径的字符（如 ../static/、/、已替换过的 https://cdn/）
+_PATH_PREFIX_RE = re.compile(r'[A-Za-z0-9._~%+:/-]*$')
+
+# 普通文件路径只可能从一段非分隔字符的开头匹配（见 VideoLinkRewriter.finditer）
+_RUN_START = rf'(?<![^{_PATH_DELIMITERS}])'
+
+# 流式模式的默认分块大小（字符数）
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# 流式模式下单个视频链接的最大长度；超过该长度的链接可能跨块而无法匹配
+STREAM_LINK_WINDOW = 8192
+
+def parse_pipe_lines(lines):
+    """
+    解析管道分隔的映射行
+    格式: 本地路径|CDN链接（不含 | 的行会被忽略，重复路径以最后一条为准）
+    """
+    mapping = {}
+    for line in lines:
+        line = line.strip()
+        if '|' in line:
+            local_path, cdn_url = line.split('|', 1)
+            mapping[local_path] = cdn_url
+    return mapping
+
+def load_pipe_mapping(mapping_file):
+    """
+    加载管道分隔的映射文件
+    """
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        return parse_pipe_lines(f)
+
+def load_csv_mapping(mapping_file):
+    """
+    加载 CSV 映射文件
+    格式: 本地路径,CDN链接
+    """
+    mapping = {}
+    with open(mapping_file, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) >= 2:
+                mapping[row[0]] = row[1]
+    return mapping
+
+def load_json_mapping(mapping_file):
+    """
+    加载 JSON 映射文件
+    格式: {"本地路径": "CDN链接"} 或 [["本地路径", "CDN链接"], ...]
+    """
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return {str(key): str(value) for key, value in data.items()}
+    return {str(row[0]): str(row[1]) for row in data if len(row) >= 2}
+
+def load_store_mapping(source):
+    """
+    加载映射库（mapping_store.py）中的映射，格式: 库文件#命名空间
+
+    整个命名空间一次读入内存：替换器需要全部键来编译匹配正则，清单也需要全部条目。
+    """
+    from mapping_store import load_store_mapping as _load_store_mapping
+    return _load_store_mapping(source)
+
+# 映射库（SQLite）文件扩展名
+STORE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+# 按扩展名选择映射加载器
+MAPPING_LOADERS = {
+    '.txt': load_pipe_mapping,
+    '.csv': load_csv_mapping,
+    '.json': load_json_mapping,
+    '.db': load_store_mapping,
+    '.sqlite': load_store_mapping,
+    '.sqlite3': load_store_mapping,
+}
+
+def load_mapping_source(mapping_file):
+    """
+    按扩展名加载一个映射来源，文件不存在时返回空映射
+
+    映射库可以用 "link_mapping.db#video" 的形式指定命名空间。
+    """
+    path = mapping_file
+    if '#' in mapping_file:
+        head = mapping_file.rsplit('#', 1)[0]
+        if os.path.splitext(head)[1].lower() in STORE_SUFFIXES:
+            path = head
+
+    if not os.path.exists(path):
+        print(f"⚠️  未找到映射文件: {path}")
+        return {}
+
+    suffix = os.path.splitext(path)[1].lower()
+    loader = MAPPING_LOADERS.get(suffix)
+    if loader is None:
+        raise ValueError(f"不支持的映射文件格式: {mapping_file}")
+    return loader(mapping_file)
+
+def merge_mapping_sources(mapping_files):
+    """
+    依次加载并合并多个映射来源，后出现的条目覆盖先出现的
+    """
+    mapping = {}
+    for mapping_file in mapping_files:
+        mapping.update(load_mapping_source(mapping_file))
+    return mapping
+
+class VideoLinkRewriter:
+    """
+    单次扫描的视频链接替换器
+
+    三种视频链接模式合并为一个正则，映射中的所有本地路径合并为另一个
+    正则（长路径优先），每个文件只需扫描一遍即可完成全部替换。
+    """
+
+    def __init__(self, mapping):
+        self.mapping = dict(mapping)
+        self.link_re = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in VIDEO_PATTERNS),
+            re.IGNORECASE
+        )
+        self.search_re = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in VIDEO_PATTERNS[:-1] + [_RUN_START + VIDEO_PATTERNS[-1]]),
+            re.IGNORECASE
+        )
+        keys = sorted(self.mapping, key=len, reverse=True)
+        self.key_re = re.compile('|'.join(re.escape(key) for key in keys)) if keys else None
+
+    def _replace(self, match):
+        full_match = match.group(0)
+        for index in _URL_GROUPS:
+            url = match.group(index)
+            if url is not None:
+                break
+
+        found = self.key_re.search(url)
+        if not found:
+            return full_match
+
+        # 保持原有的格式，只替换 URL 部分。Markdown 链接与 src/href 的分组恰好是整个地址，
+        # 整体替换；普通路径模式在中文正文里会把路径前面没有分隔的文字一起捕获，只替换
+        # 从路径开头到映射键结尾的部分（已替换为 CDN 链接的路径再次处理时结果不变）
+        start, end = 0, len(url)
+        if index == _BARE_PATH_GROUP:
+            start = _PATH_PREFIX_RE.search(url, 0, found.start()).start()
+            end = found.end()
+        offset = match.start(index) - match.start()
+        return full_match[:offset + start] + self.mapping[found.group(0)] + full_match[offset + end:]
+
+    def finditer(self, content):
+        """
+        与 link_re.finditer 结果完全相同，但避免了中文长句上的二次方回溯
+
+        普通路径模式的贪婪前缀在没有空白的中文段落里，会从每个位置扫到段尾
+        再回溯。它若在一段连续字符中的某个位置失败，在其后任何位置也必然失败，
+        因此只需在段首或上一个匹配的结束处尝试（后者用不带限制的 link_re）。
+        """
+        pos = 0
+        length = len(content)
+        while pos < length:
+            match = self.link_re.match(content, pos)
+            if match is None:
+                match = self.search_re.search(content, pos + 1)
+                if match is None:
+                    return
+            yield match
+            pos = match.end()
+
+    def rewrite(self, content):
+        """
+        替换文本中的视频链接，返回 (新文本, 替换次数)
+        """
+        if self.key_re is None:
+            return content, 0
+
+        count = 0
+        pieces = []
+        pos = 0
+        for match in self.finditer(content):
+            result = self._replace(match)
+            if result != match.group(0):
+                count += 1
+            pieces.append(content[pos:match.start()])
+            pieces.append(result)
+            pos = match.end()
+        pieces.append(content[pos:])
+        return ''.join(pieces), count
+
+    def stages(self):
+        """
+        流式模式的替换阶段: [(匹配迭代函数, 替换函数, 跨块保留窗口)]
+        """
+        if self.key_re is None:
+            return []
+        longest = max(len(key) for key in self.mapping)
+        return [(self.finditer, self._replace, max(STREAM_LINK_WINDOW, longest))]
+
+class LiteralLinkRewriter:
+    """
+    字面替换器：文本中出现的本地路径直接替换为 CDN 链接
+
+    所有路径合并为一个正则（长路径优先），一次扫描完成全部替换。
+    与逐条 str.replace 不同：互相重叠的路径按最长的那个替换一次，替换结果
+    也不会在同一次运行中再被其它映射改写（a→b、b→c 时原文的 a 只变成 b）。
+    """
+
+    def __init__(self, mapping):
+        self.mapping = dict(mapping)
+        keys = sorted(self.mapping, key=len, reverse=True)
+        self.key_re = re.compile('|'.join(re.escape(key) for key in keys)) if keys else None
+
+    def rewrite(self, content):
+        """
+        替换文本中的本地路径，返回 (新文本, 替换次数)
+        """
+        if self.key_re is None:
+            return content, 0
+
+        count = 0
+
+        def replacer(match):
+            nonlocal count
+            result = self._replace(match)
+            if result != match.group(0):
+                count += 1
+            return result
+
+        return self.key_re.sub(replacer, content), count
+
+    def _replace(self, match):
+        return self.mapping[match.group(0)]
+
+    def stages(self):
+        """
+        流式模式的替换阶段: [(匹配迭代函数, 替换函数, 跨块保留窗口)]
+        """
+        if self.key_re is None:
+            return []
+        return [(self.key_re.finditer, self._replace, max(len(key) for key in self.mapping))]
+
+class LinkRewriter:
+    """
+    合并后的链接替换器
+
+    视频映射按视频链接模式替换，其余映射按字面替换；两者在内存中依次
+    执行，与先后运行两个脚本的结果一致，但每个文件只读写一次。
+    """
+
+    def __init__(self, video_mapping=None, link_mapping=None):
+        self.video = VideoLinkRewriter(video_mapping or {})
+        self.links = LiteralLinkRewriter(link_mapping or {})
+
+    def __len__(self):
+        return len(self.video.mapping) + len(self.links.mapping)
+
+    def rewrite(self, content):
+        """
+        替换文本中的所有链接，返回 (新文本, 替换次数)
+        """
+        content, video_count = self.video.rewrite(content)
+        content, link_count = self.links.rewrite(content)
+        return content, video_count + link_count
+
+    def stages(self):
+        """
+        流式模式的替换阶段（视频阶段在前）
+        """
+        return self.video.stages() + self.links.stages()
+
+    def manifest_mapping(self):
+        """
+        用于清单版本计算的映射（值中带上替换方式）
+        """
+        entries = {key: 'video|' + url for key, url in self.video.mapping.items()}
+        for key, url in self.links.mapping.items():
+            entries[key] = entries.get(key, '') + 'link|' + url
+        return entries
+
+def rewrite_file(file_path, rewriter):
+    """
+    对单个文件执行一次 读取-替换-写回，返回 UPDATED / UNCHANGED / FAILED
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception as e:
+        print(f"❌ 读取文件失败 {file_path}: {e}")
+        return FAILED
+
+    content, replaced = rewriter.rewrite(content)
+    if not replaced:
+        return UNCHANGED
+
+    try:
+        atomic_write_text(file_path, content)
+    except Exception as e:
+        print(f"❌ 写入文件失败 {file_path}: {e}")
+        return FAILED
+
+    print(f"✅ 更新: {file_path} ({replaced} 处链接)")
+    return UPDATED
+
+def _stream_stage(chunks, finditer, replace, window, counter):
+    """
+    对分块文本流执行一个替换阶段，逐块产出替换后的文本
+
+    缓冲区末尾保留 window 个字符：起点早于 (缓冲区长度 - window) 的匹配
+    在完整文本中必然相同，可以立即输出；其余部分等待下一块。只要任何
+    匹配都不超过 window 个字符，结果与整体替换逐字节一致。
+    """
+    buffer = ''
+    finished = False
+    chunks = iter(chunks)
+    while not finished:
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+            limit = len(buffer)
+        else:
+            buffer += chunk
+            limit = len(buffer) - window
+            if limit <= 0:
+                continue
+
+        pieces = []
+        pos = 0
+        for match in finditer(buffer):
+            if match.start() >= limit and not finished:
+                break
+            pieces.append(buffer[pos:match.start()])
+            result = replace(match)
+            if result != match.group(0):
+                counter[0] += 1
+            pieces.append(result)
+            pos = match.end()
+
+        if finished:
+            pieces.append(buffer[pos:])
+            buffer = ''
+        elif pos < limit:
+            pieces.append(buffer[pos:limit])
+            buffer = buffer[limit:]
+        else:
+            buffer = buffer[pos:]
+
+        output = ''.join(pieces)
+        if output:
+            yield output
+
+def stream_rewrite(reader, writer, rewriter, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    从 reader 分块读取、经各替换阶段处理后写入 writer，返回替换次数
+
+    峰值内存约为 chunk_size 加各阶段的保留窗口，与文件大小无关。
+    """
+    counter = [0]
+    stream = iter(lambda: reader.read(chunk_size), '')
+    for finditer, replace, window in rewriter.stages():
+        stream = _stream_stage(stream, finditer, replace, window, counter)
+    for piece in stream:
+        writer.write(piece)
+    return counter[0]
+
+def stream_rewrite_file(file_path, rewriter, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    流式版本的 rewrite_file：边读边写入同目录临时文件，有替换时原子替换原文件
+    """
+    file_path = str(file_path)
+    try:
+        tmp_file, tmp_path = open_temp_for(file_path)
+    except Exception as e:
+        print(f"❌ 写入文件失败 {file_path}: {e}")
+        return FAILED
+
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            replaced = stream_rewrite(f, tmp_file, rewriter, chunk_size)
+    except Exception as e:
+        discard_temp(tmp_file, tmp_path)
+        print(f"❌ 处理文件失败 {file_path}: {e}")
+        return FAILED
+
+    if not replaced:
+        discard_temp(tmp_file, tmp_path)
+        return UNCHANGED
+
+    try:
+        commit_temp(tmp_file, tmp_path, file_path)
+    except Exception as e:
+        discard_temp(tmp_file, tmp_path)
+        print(f"❌ 写入文件失败 {file_path}: {e}")
+        return FAILED
+
+    print(f"✅ 更新: {file_path} ({replaced} 处链接)")
+    return UPDATED
+
+def find_markdown_files(content_dirs):
+    """
+    递归查找多个内容目录下的 Markdown 文件（不存在的目录会被跳过）
+    """
+    markdown_files = []
+    for content_dir in content_dirs:
+        content_path = Path(content_dir)
+        if not content_path.exists():
+            print(f"⚠️  内容目录不存在: {content_dir}")
+            continue
+        markdown_files.extend(str(md_file) for md_file in content_path.rglob('*.md'))
+    return markdown_files
+
+# 进程池中每个工作进程持有一份替换器；chunk_size 非空时使用流式模式
+_worker_rewriter = None
+_worker_chunk_size = None
+
+def _init_worker(rewriter, chunk_size=None):
+    global _worker_rewriter, _worker_chunk_size
+    _worker_rewriter = rewriter
+    _worker_chunk_size = chunk_size
+
+def _rewrite_worker(file_path):
+    if _worker_chunk_size:
+        return stream_rewrite_file(file_path, _worker_rewriter, _worker_chunk_size)
+    return rewrite_file(file_path, _worker_rewriter)
+
+def rewrite_files(files, rewriter, manifest_path=None, full=False, jobs=1, stream=False,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    增量、并行地处理一批文件，返回 ([(文件, 结果)], 耗时秒数, 跳过文件数)
+
+    manifest_path 为 None 时不使用清单，所有文件都会被处理；
+    stream 为 True 时按 chunk_size 分块流式处理，内存占用与文件大小无关。
+    """
+    files = [str(file_path) for file_path in files]
+    manifest = None
+    if manifest_path:
+        mapping = rewriter.manifest_mapping() if hasattr(rewriter, 'manifest_mapping') else rewriter.mapping
+        manifest = LinkManifest(manifest_path, mapping, full=full)
+        pending_files = [file_path for file_path in files if manifest.needs_update(file_path)]
+    else:
+        pending_files = files
+
+    results, elapsed = run_file_jobs(
+        pending_files, _rewrite_worker, jobs=jobs,
+        initializer=_init_worker, initargs=(rewriter, chunk_size if stream else None)
+    )
+
+    if manifest is not None:
+        for file_path, status in results:
+            if status != FAILED:
+                manifest.record(file_path)
+        manifest.save()
+
+    return results, elapsed, len(files) - len(pending_files)
+
+def run_file_jobs(files, worker, jobs=1, initializer=None, initargs=()):
+    """
+    处理一批文件，返回 ([(文件, 结果)], 耗时秒数)
+
+    jobs > 1 时使用进程池并行处理；worker 与 initializer 必须是模块级函数。
+    worker 返回 UPDATED / UNCHANGED / FAILED，抛出的异常记为 FAILED。
+    """
+    files = list(files)
+    started = time.perf_counter()
+
+    if jobs <= 1 or len(files) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        statuses = [_call_worker(worker, file_path) for file_path in files]
+    else:
+        chunksize = max(1, len(files) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as executor:
+            statuses = list(executor.map(_call_worker, [worker] * len(files), files, chunksize=chunksize))
+
+    return list(zip(files, statuses)), time.perf_counter() - started
+
+def _call_worker(worker, file_path):
+    try:
+        return worker(file_path)
+    except Exception as e:
+        print(f"❌ 处理失败 {file_path}: {e}")
+        return FAILED
+
+def format_summary(results, elapsed):
+    """
+    生成处理结果汇总行（含耗时与吞吐量）
+    """
+    counts = {UPDATED: 0, UNCHANGED: 0, FAILED: 0}
+    for _, status in results:
+        counts[status] = counts.get(status, 0) + 1
+    rate = len(results) / elapsed if elapsed > 0 else 0.0
+    return (f"更新 {counts[UPDATED]} / 未变化 {counts[UNCHANGED]} / 失败 {counts[FAILED]}，"
+            f"耗时 {elapsed:.2f}s ({rate:.1f} 文件/秒)")
+
+def _file_contains_any(file_path, keys, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    分块检查文件中是否出现任一字符串（块之间保留最长字符串长度的重叠）
+    """
+    if not keys:
+        return False
+    overlap = max(len(key) for key in keys) - 1
+    tail = ''
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            text = tail + chunk
+            if any(key in text for key in keys):
+                return True
+            tail = text[-overlap:] if overlap > 0 else ''
+    return False
+
+def _text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def mapping_digest(mapping):
+    """
+    计算映射表的版本哈希（与条目顺序无关）
+    """
+    payload = json.dumps(sorted(mapping.items()), ensure_ascii=False)
+    return _text_digest(payload)
+
+class LinkManifest:
+    """
+    链接替换清单
+
+    记录每个文件上次成功处理后的状态（大小、修改时间、内容哈希）以及
+    当时使用的映射版本。再次运行时，只有内容变化、或新增/修改的映射
+    条目出现在文件中的文件才需要重新处理。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, mapping, full=False):
+        self.path = path
+        self.mapping_version = mapping_digest(mapping)
+        self.entries = {key: _text_digest(url) for key, url in mapping.items()}
+        self.files = {}
+        previous_entries = {}
+        previous_version = None
+
+        if not full and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == self.VERSION:
+                    self.files = data.get('files', {})
+                    previous_entries = data.get('mapping', {})
+                    previous_version = data.get('mapping_version')
+            except (OSError, ValueError) as e:
+                print(f"⚠️  清单文件无法读取，将全量处理: {path} ({e})")
+
+        self.previous_version = previous_version
+        # 新增或 CDN 链接发生变化的映射条目；删除的条目不会影响已替换的内容
+        self.changed_keys = [
+            key for key, digest in self.entries.items()
+            if previous_entries.get(key) != digest
+        ]
+
+    def needs_update(self, file_path):
+        """
+        判断文件是否需要重新处理
+        """
+        file_path = str(file_path)
+        entry = self.files.get(file_path)
+        if entry is None:
+            return True
+
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return True
+
+        same_stat = entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns
+        if same_stat and entry.get('mapping') == self.mapping_version:
+            return False
+
+        if file_digest(file_path) != entry.get('sha256'):
+            return True
+
+        if entry.get('mapping') != self.mapping_version:
+            # 文件上次处理时使用的映射早于上一次快照，无法只比较差异
+            if entry.get('mapping') != self.previous_version:
+                return True
+            if _file_contains_any(file_path, self.changed_keys):
+                return True
+
+        # 内容未变且没有相关映射变化：刷新记录即可
+        entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, mapping=self.mapping_version)
+        return False
+
+    def record(self, file_path):
+        """
+        记录文件处理成功后的状态
+        """
+        file_path = str(file_path)
+        stat = os.stat(file_path)
+        self.files[file_path] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_digest(file_path),
+            'mapping': self.mapping_version,
+        }
+
+    def save(self):
+        """
+        保存清单（已删除的文件不再保留记录）
+        """
+        self.files = {path: entry for path, entry in self.files.items() if os.path.exists(path)}
+        data = {
+            'version': self.VERSION,
+            'mapping_version': self.mapping_version,
+            'mapping': self.entries,
+            'files': self.files,
+        }
+        atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=1, sort_keys=True))
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="合并映射表，一次性替换文章中的视频与媒体链接")
+    parser.add_argument('--video', action='append', default=[], metavar='FILE',
+                        help='按视频链接模式替换的映射来源（txt/csv/json/映射库#命名空间，可重复）')
+    parser.add_argument('--links', action='append', default=[], metavar='FILE',
+                        help='按字面替换的映射来源（txt/csv/json/映射库#命名空间，可重复）')
+    parser.add_argument('--content-dir', action='append', default=[], metavar='DIR',
+                        help='Markdown 内容目录（可重复，默认 content）')
+    parser.add_argument('--full', action='store_true', help='忽略清单，全量处理所有文件')
+    parser.add_argument('--manifest', default='.links_manifest.json', help='增量处理清单路径')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='并行处理的进程数')
+    parser.add_argument('--stream', action='store_true', help='分块流式处理，内存占用与文件大小无关')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='流式模式的分块大小（字符数）')
+    args = parser.parse_args()
+
+    rewriter = LinkRewriter(merge_mapping_sources(args.video), merge_mapping_sources(args.links))
+    if not len(rewriter):
+        print("❌ 没有找到任何映射")
+        sys.exit(1)
+    print(f"✅ 加载了 {len(rewriter.video.mapping)} 个视频映射、{len(rewriter.links.mapping)} 个媒体映射")
+
+    markdown_files = find_markdown_files(args.content_dir or ['content'])
+    print(f"📄 找到 {len(markdown_files)} 个 Markdown 文件")
+
+    results, elapsed, skipped = rewrite_files(
+        markdown_files, rewriter, manifest_path=args.manifest, full=args.full, jobs=args.jobs,
+        stream=args.stream, chunk_size=args.chunk_size
+    )
+    print(f"\n🎉 完成! {format_summary(results, elapsed)}，跳过 {skipped} 个")
+    if any(status == FAILED for _, status in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒体链接映射库
+用 SQLite 保存 本地路径 → CDN 链接 的映射，替代不断追加的 txt/CSV 文件。
+同一命名空间内同一路径只保留一条（upsert），按主键 B 树查找为 O(log n)。
+
+注意：O(log n) 只适用于 get（单条查找，如 CLI 的 get 与上传脚本的查询）。链接替换
+（link_rewrite / replace_video_links.py / update-links.py）仍通过 load 一次读入整个
+命名空间并编译成一个正则：字面映射的键可以出现在正文任意位置，无法按主键查找；
+增量清单也要对全部条目计算版本。映射库带来的是去重与一次 SELECT 的加载，
+替换时的加载成本仍随条目数线性增长。
+
+命名空间约定:
+  video       static/videos 下的视频（原 video_url_mapping.txt）
+  inline      辅助性图片与 PDF（原 media/inline-mapping.csv）
+  notebooklm  NotebookLM 内容（原 media/notebooklm-mapping.csv）
+
+用法:
+  python3 scripts/mapping_store.py put video tian/a.mp4 https://cdn/videos/tian/a.mp4
+  python3 scripts/mapping_store.py get video tian/a.mp4
+  python3 scripts/mapping_store.py import video video_url_mapping.txt
+  python3 scripts/mapping_store.py export video video_url_mapping.txt
+  python3 scripts/mapping_store.py stats
+"""
+
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import sys
+import time
+
+from fileutil import atomic_write_text
+from link_rewrite import load_mapping_source, parse_pipe_lines
+
+DEFAULT_STORE = "link_mapping.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mappings (
+    namespace  TEXT NOT NULL,
+    local_path TEXT NOT NULL,
+    cdn_url    TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, local_path)
+) WITHOUT ROWID
+"""
+
+_UPSERT = """
+INSERT INTO mappings (namespace, local_path, cdn_url, updated_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (namespace, local_path) DO UPDATE SET
+    cdn_url = excluded.cdn_url,
+    updated_at = excluded.updated_at
+WHERE cdn_url != excluded.cdn_url
+"""
+
+class MappingStore:
+    """
+    SQLite 映射库
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def upsert(self, namespace, local_path, cdn_url):
+        """
+        写入或更新一条映射
+        """
+        self.upsert_many(namespace, [(local_path, cdn_url)])
+
+    def upsert_many(self, namespace, items):
+        """
+        批量写入或更新映射（单个事务），返回实际变化的条数
+        """
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.executemany(
+                _UPSERT,
+                ((namespace, local_path, cdn_url, now) for local_path, cdn_url in items)
+            )
+        return cursor.rowcount
+
+    def get(self, namespace, local_path):
+        """
+        按路径查找 CDN 链接，不存在时返回 None
+        """
+        row = self.conn.execute(
+            "SELECT cdn_url FROM mappings WHERE namespace = ? AND local_path = ?",
+            (namespace, local_path)
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, namespace, local_path):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM mappings WHERE namespace = ? AND local_path = ?",
+                (namespace, local_path)
+            )
+
+    def load(self, namespace=None):
+        """
+        读取一个命名空间（或全部）的映射为字典
+        """
+        if namespace is None:
+            rows = self.conn.execute("SELECT local_path, cdn_url FROM mappings ORDER BY namespace, local_path")
+        else:
+            rows = self.conn.execute(
+                "SELECT local_path, cdn_url FROM mappings WHERE namespace = ? ORDER BY local_path",
+                (namespace,)
+            )
+        return dict(rows)
+
+    def counts(self):
+        """
+        各命名空间的映射条数
+        """
+        return dict(self.conn.execute("SELECT namespace, COUNT(*) FROM mappings GROUP BY namespace"))
+
+    def import_file(self, namespace, mapping_file):
+        """
+        导入 txt/CSV/JSON 映射文件（重复条目以最后一条为准），返回变化的条数
+        """
+        if mapping_file == '-':
+            mapping = parse_pipe_lines(sys.stdin)
+        else:
+            mapping = load_mapping_source(mapping_file)
+        return self.upsert_many(namespace, mapping.items())
+
+    def export_file(self, namespace, output_file):
+        """
+        导出为去重后的 txt（管道分隔）或 CSV 文件，返回条数
+        """
+        mapping = self.load(namespace)
+        buffer = io.StringIO()
+        if output_file.lower().endswith('.csv'):
+            csv.writer(buffer, lineterminator='\n').writerows(mapping.items())
+        else:
+            for local_path, cdn_url in mapping.items():
+                buffer.write(f"{local_path}|{cdn_url}\n")
+        atomic_write_text(output_file, buffer.getvalue())
+        return len(mapping)
+
+def load_store_mapping(source):
+    """
+    加载 "库文件#命名空间" 形式的映射来源（省略命名空间时读取全部）
+
+    返回整个命名空间的字典，不经过 get 的索引查找（见模块说明）。
+    """
+    path, _, namespace = source.partition('#')
+    with MappingStore(path) as store:
+        return store.load(namespace or None)
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="媒体链接映射库")
+    parser.add_argument('--db', default=os.environ.get('LINK_MAPPING_DB', DEFAULT_STORE), help='映射库路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    put_parser = subparsers.add_parser('put', help='写入或更新一条映射')
+    put_parser.add_argument('namespace')
+    put_parser.add_argument('local_path')
+    put_parser.add_argument('cdn_url')
+
+    get_parser = subparsers.add_parser('get', help='查找一条映射')
+    get_parser.add_argument('namespace')
+    get_parser.add_argument('local_path')
+
+    import_parser = subparsers.add_parser('import', help='导入 txt/CSV/JSON 映射文件（- 表示从标准输入读取管道分隔行）')
+    import_parser.add_argument('namespace')
+    import_parser.add_argument('files', nargs='+')
+
+    export_parser = subparsers.add_parser('export', help='导出为 txt 或 CSV 文件')
+    export_parser.add_argument('namespace')
+    export_parser.add_argument('output')
+
+    subparsers.add_parser('stats', help='查看各命名空间条数')
+
+    args = parser.parse_args()
+
+    with MappingStore(args.db) as store:
+        if args.command == 'put':
+            store.upsert(args.namespace, args.local_path, args.cdn_url)
+        elif args.command == 'get':
+            cdn_url = store.get(args.namespace, args.local_path)
+            if cdn_url is None:
+                sys.exit(1)
+            print(cdn_url)
+        elif args.command == 'import':
+            for mapping_file in args.files:
+                changed = store.import_file(args.namespace, mapping_file)
+                print(f"✅ 导入 {mapping_file}: {changed} 条新增或更新")
+        elif args.command == 'export':
+            count = store.export_file(args.namespace, args.output)
+            print(f"📝 导出 {count} 条映射到 {args.output}")
+        elif args.command == 'stats':
+            for namespace, count in sorted(store.counts().items()):
+                print(f"{namespace}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MP4 快速启动（faststart）预处理
+把位于文件末尾的 moov 原子移到 mdat 之前，并修正 stco/co64 中的块偏移，
+浏览器无需先请求文件尾部即可开始播放。纯 Python 实现，不依赖 ffmpeg。
+
+处理结果按原文件内容哈希缓存，同一内容只处理一次。
+
+用法:
+  python3 scripts/mp4_faststart.py input.mp4 output.mp4
+  python3 scripts/mp4_faststart.py --check static/videos/**/*.mp4
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import struct
+import sys
+
+from fileutil import commit_temp, discard_temp, file_digest, open_temp_for
+
+DEFAULT_CACHE_DIR = ".faststart_cache"
+
+# 可以处理的扩展名
+FASTSTART_EXTENSIONS = ('mp4', 'm4v', 'mov')
+
+# 需要向下解析才能找到 stco/co64 的容器原子
+_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+_UINT32_MAX = 0xFFFFFFFF
+
+# 缓存文件名中的处理版本；修正偏移计算后递增，避免复用旧版本生成的错误结果
+FASTSTART_VERSION = 2
+
+class FaststartError(Exception):
+    """
+    文件无法做 faststart 处理（格式错误、压缩的 moov 等）
+    """
+
+def read_top_level_atoms(f):
+    """
+    读取顶层原子列表 [(类型, 起始偏移, 总大小)]
+    """
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    atoms = []
+    offset = 0
+    while offset < file_size:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            raise FaststartError(f"原子头不完整 (偏移 {offset})")
+        size, kind = struct.unpack('>I4s', header)
+        if size == 1:
+            extended = f.read(8)
+            if len(extended) < 8:
+                raise FaststartError(f"64 位原子头不完整 (偏移 {offset})")
+            size = struct.unpack('>Q', extended)[0]
+        elif size == 0:
+            size = file_size - offset
+        if size < 8 or offset + size > file_size:
+            raise FaststartError(f"原子 {kind!r} 大小无效 (偏移 {offset})")
+        atoms.append((kind, offset, size))
+        offset += size
+    return atoms
+
+def _parse_atoms(data):
+    """
+    把一段原子数据解析为节点列表 [类型, 子节点列表或负载字节]
+    """
+    nodes = []
+    offset = 0
+    while offset < len(data):
+        if offset + 8 > len(data):
+            raise FaststartError("moov 内原子头不完整")
+        size, kind = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = len(data) - offset
+        if size < header or offset + size > len(data):
+            raise FaststartError(f"moov 内原子 {kind!r} 大小无效")
+        payload = data[offset + header:offset + size]
+        if kind == b'cmov':
+            raise FaststartError("moov 已压缩 (cmov)，不支持")
+        nodes.append([kind, _parse_atoms(payload) if kind in _CONTAINERS else payload])
+        offset += size
+    return nodes
+
+def _serialize(nodes):
+    parts = []
+    for kind, body in nodes:
+        payload = _serialize(body) if isinstance(body, list) else body
+        size = len(payload) + 8
+        if size > _UINT32_MAX:
+            parts.append(struct.pack('>I4sQ', 1, kind, size + 8))
+        else:
+            parts.append(struct.pack('>I4s', size, kind))
+        parts.append(payload)
+    return b''.join(parts)
+
+def _chunk_offset_atoms(nodes):
+    """
+    遍历所有 stco/co64 节点
+    """
+    for node in nodes:
+        kind, body = node
+        if isinstance(body, list):
+            yield from _chunk_offset_atoms(body)
+        elif kind in (b'stco', b'co64'):
+            yield node
+
+def _read_offsets(kind, payload):
+    if len(payload) < 8:
+        raise FaststartError(f"{kind.decode()} 原子过短")
+    version_flags, count = struct.unpack_from('>II', payload, 0)
+    width = 'Q' if kind == b'co64' else 'I'
+    if len(payload) < 8 + count * struct.calcsize(width):
+        raise FaststartError(f"{kind.decode()} 条目数与大小不符")
+    return version_flags, list(struct.unpack_from(f'>{count}{width}', payload, 8))
+
+def _encode_offsets(node, version_flags, offsets, relocate, co64):
+    """
+    把块偏移按 relocate 换算到新布局并写回节点；32 位放不下时返回 False
+    """
+    patched = [relocate(offset) for offset in offsets]
+    if not co64 and patched and max(patched) > _UINT32_MAX:
+        return False
+    width = 'Q' if co64 else 'I'
+    node[0] = b'co64' if co64 else b'stco'
+    node[1] = struct.pack(f'>II{len(patched)}{width}', version_flags, len(patched), *patched)
+    return True
+
+def _relocator(mdat_start, moov_offset, moov_size, new_moov_size):
+    """
+    旧文件偏移 → 新文件偏移
+
+    新布局为 [mdat 之前的原子][新 moov][原 mdat_start 起除旧 moov 外的原子]：
+    位于第一个 mdat 之前的数据不动，位于第一个 mdat 与旧 moov 之间的数据后移
+    新 moov 的大小，位于旧 moov 之后的数据（如 moov 后面的第二个 mdat）还要
+    减去被移走的旧 moov 的大小。
+    """
+    moov_end = moov_offset + moov_size
+
+    def relocate(offset):
+        if offset < mdat_start:
+            return offset
+        if offset < moov_offset:
+            return offset + new_moov_size
+        if offset >= moov_end:
+            return offset + new_moov_size - moov_size
+        raise FaststartError(f"块偏移 {offset} 指向 moov 内部")
+
+    return relocate
+
+def build_faststart_moov(moov_data, mdat_start, moov_offset):
+    """
+    生成移动到 mdat 之前后的新 moov 原子字节（moov_data 为位于 moov_offset 的旧 moov）
+
+    各块偏移按新布局逐个换算（见 _relocator）。如果某个 stco 因此超出
+    32 位，就把所有 stco 升级为 co64（moov 变大），再重新计算一次偏移。
+    """
+    nodes = _parse_atoms(moov_data)
+    tables = []
+    for node in _chunk_offset_atoms(nodes):
+        version_flags, offsets = _read_offsets(*node)
+        tables.append((node, node[0] == b'co64', version_flags, offsets))
+
+    upgrade = False
+    while True:
+        # moov 的大小只取决于各偏移表的宽度，与偏移值无关
+        for node, is_co64, version_flags, offsets in tables:
+            _encode_offsets(node, version_flags, offsets, lambda offset: 0, is_co64 or upgrade)
+        relocate = _relocator(mdat_start, moov_offset, len(moov_data), len(_serialize(nodes)))
+        if all(_encode_offsets(node, version_flags, offsets, relocate, is_co64 or upgrade)
+               for node, is_co64, version_flags, offsets in tables):
+            return _serialize(nodes)
+        upgrade = True
+
+def faststart(input_path, output_path):
+    """
+    对 input_path 做 faststart 处理并写入 output_path
+
+    返回 True 表示已生成新文件；moov 已在 mdat 之前（无需处理）时返回 False。
+    """
+    with open(input_path, 'rb') as f:
+        atoms = read_top_level_atoms(f)
+        kinds = [kind for kind, _, _ in atoms]
+        if b'moov' not in kinds or b'mdat' not in kinds:
+            raise FaststartError("缺少 moov 或 mdat 原子")
+        moov_index = kinds.index(b'moov')
+        first_mdat = kinds.index(b'mdat')
+        if moov_index < first_mdat:
+            return False
+
+        _, moov_offset, moov_size = atoms[moov_index]
+        f.seek(moov_offset)
+        moov_data = f.read(moov_size)
+        mdat_start = atoms[first_mdat][1]
+        new_moov = build_faststart_moov(moov_data, mdat_start, moov_offset)
+
+        # 新布局：第一个 mdat 之前的原子（ftyp 等）、moov、其余原子按原顺序
+        order = atoms[:first_mdat]
+        rest = [atom for index, atom in enumerate(atoms) if index >= first_mdat and index != moov_index]
+
+        directory = os.path.dirname(os.path.abspath(output_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_file, tmp_path = open_temp_for(output_path, 'wb')
+        try:
+            for _, offset, size in order:
+                _copy_range(f, tmp_file, offset, size)
+            tmp_file.write(new_moov)
+            for _, offset, size in rest:
+                _copy_range(f, tmp_file, offset, size)
+            commit_temp(tmp_file, tmp_path, output_path)
+        except BaseException:
+            discard_temp(tmp_file, tmp_path)
+            raise
+    return True
+
+def _copy_range(src, dst, offset, size, block_size=1 << 20):
+    src.seek(offset)
+    remaining = size
+    while remaining:
+        block = src.read(min(block_size, remaining))
+        if not block:
+            raise FaststartError("读取原子数据时文件意外结束")
+        dst.write(block)
+        remaining -= len(block)
+
+def needs_faststart(file_path):
+    """
+    判断文件是否为 moov 在 mdat 之后的 MP4
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            kinds = [kind for kind, _, _ in read_top_level_atoms(f)]
+    except (OSError, FaststartError):
+        return False
+    return b'moov' in kinds and b'mdat' in kinds and kinds.index(b'moov') > kinds.index(b'mdat')
+
+def faststart_cached(file_path, sha256=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    返回应上传的文件路径：需要处理时返回缓存中的 faststart 版本，否则返回原文件
+
+    缓存以原文件内容的 SHA-256 与处理版本命名；无法处理的文件（如 cmov）原样返回。
+    """
+    extension = os.path.splitext(file_path)[1][1:].lower()
+    if extension not in FASTSTART_EXTENSIONS or not needs_faststart(file_path):
+        return file_path
+
+    sha256 = sha256 or file_digest(file_path)
+    cached = os.path.join(cache_dir, f"{sha256}.v{FASTSTART_VERSION}.{extension}")
+    if os.path.exists(cached):
+        return cached
+    try:
+        faststart(file_path, cached)
+    except FaststartError as e:
+        print(f"⚠️  无法做 faststart 处理，按原文件上传: {file_path} ({e})")
+        return file_path
+    return cached
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="MP4 快速启动（moov 前置）预处理")
+    parser.add_argument('paths', nargs='+', help='输入文件（--check 时可为多个文件或通配符）')
+    parser.add_argument('--check', action='store_true', help='只列出需要处理的文件')
+    args = parser.parse_args()
+
+    if args.check:
+        files = sorted({path for pattern in args.paths for path in glob.glob(pattern, recursive=True)})
+        pending = [path for path in files if needs_faststart(path)]
+        for path in pending:
+            print(f"🐢 moov 在文件末尾: {path}")
+        print(f"共 {len(files)} 个文件，{len(pending)} 个需要 faststart 处理")
+        return
+
+    if len(args.paths) != 2:
+        parser.error("需要输入与输出两个路径")
+    input_path, output_path = args.paths
+    try:
+        changed = faststart(input_path, output_path)
+    except FaststartError as e:
+        print(f"❌ {input_path}: {e}")
+        sys.exit(1)
+    if changed:
+        print(f"✅ 已生成: {output_path}")
+    else:
+        if os.path.abspath(input_path) != os.path.abspath(output_path):
+            shutil.copyfile(input_path, output_path)
+        print(f"⏭️  moov 已在 mdat 之前，无需处理: {input_path}")
+
+if __name__ == "__main__":
+    main()
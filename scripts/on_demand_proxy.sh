@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # 按需启动 AWS 爱尔兰代理服务
-# 使用方法: ./on_demand_proxy.sh [start|stop|status|restart]
+# 使用方法: ./on_demand_proxy.sh [start|activate|stop|status|restart]
 
 set -e
 
@@ -11,6 +11,16 @@ PROXY_PORT="1083"
 HEALTH_CHECK_URL="http://${AWS_INSTANCE}:${PROXY_PORT}"
 LOG_FILE="on_demand_proxy.log"
 PID_FILE="proxy_server.pid"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+PROXY_SERVER="${SCRIPT_DIR}/proxy_server.py"
+PROXY_ACTIVATOR="${SCRIPT_DIR}/proxy_activator.py"
+PROXY_ENGINE=${PROXY_ENGINE:-"asyncio"}
+# PROXY_CACHE=1 时缓存 GET 响应（见 scripts/proxy_cache.py）
+PROXY_CACHE=${PROXY_CACHE:-"0"}
+# worker 进程数（1 为单进程，0 表示每个 CPU 核心一个，见 scripts/proxy_workers.py）
+PROXY_WORKERS=${PROXY_WORKERS:-"1"}
+# activate 模式下代理连续无流量多少秒后退出（见 scripts/proxy_activator.py）
+PROXY_IDLE_EXIT=${PROXY_IDLE_EXIT:-"300"}
 
 # 颜色输出
 GREEN='\033[0;32m'
@@ -72,141 +82,18 @@ start_service() {
     # 模拟启动过程（实际应该是SSH命令或API调用）
     # ssh -i key.pem user@${AWS_INSTANCE} "sudo systemctl start proxy-service"
     
-    # 这里创建一个模拟的代理服务进程用于演示
+    # 在本机启动代理服务进程
     echo "启动代理服务监听端口 ${PROXY_PORT}..."
     
-    # 创建一个简单的HTTP代理服务作为示例
-    cat > proxy_server.py << 'EOF'
-#!/usr/bin/env python3
-import http.server
-import socketserver
-import threading
-import urllib.request
-import urllib.parse
-import sys
-
-class ProxyHandler(http.server.BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.proxy_request()
-    
-    def do_POST(self):
-        self.proxy_request()
-    
-    def do_CONNECT(self):
-        # 处理HTTPS连接
-        try:
-            host, port = self.path.split(':')
-            port = int(port)
-            
-            # 建立到目标服务器的连接
-            target_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            target_socket.connect((host, port))
-            
-            # 发送200响应表示连接建立
-            self.send_response(200, 'Connection established')
-            self.end_headers()
-            
-            # 开始双向数据转发
-            self.relay_data(target_socket)
-            
-        except Exception as e:
-            print(f"CONNECT error: {e}")
-            self.send_error(500, f"Proxy error: {e}")
-    
-    def proxy_request(self):
-        try:
-            if self.path.startswith('http://'):
-                url = self.path
-            else:
-                url = f"http://{self.headers.get("Host")}{self.path}"
-            
-            # 获取请求数据
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length) if content_length > 0 else None
-            
-            # 创建代理请求
-            req = urllib.request.Request(url, post_data, dict(self.headers))
-            req.get_method = self.command
-            
-            # 发送请求并获取响应
-            try:
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    self.send_response(response.getcode())
-                    
-                    # 复制响应头
-                    for header, value in response.headers.items():
-                        if header.lower() not in ['connection', 'transfer-encoding']:
-                            self.send_header(header, value)
-                    self.end_headers()
-                    
-                    # 复制响应体
-                    self.wfile.write(response.read())
-                    
-            except urllib.error.HTTPError as e:
-                self.send_response(e.code)
-                for header, value in e.headers.items():
-                    self.send_header(header, value)
-                self.end_headers()
-                
-        except Exception as e:
-            print(f"Proxy error: {e}")
-            self.send_error(500, f"Proxy error: {e}")
-    
-    def relay_data(self, target_socket):
-        # 创建两个线程进行双向数据转发
-        def forward_data(src, dst, direction):
-            try:
-                while True:
-                    data = src.recv(4096)
-                    if not data:
-                        break
-                    dst.send(data)
-            except:
-                pass
-            finally:
-                dst.close()
-                src.close()
-        
-        thread1 = threading.Thread(target=forward_data, 
-                                args=(self.connection, target_socket, "client->server"))
-        thread2 = threading.Thread(target=forward_data, 
-                                args=(target_socket, self.connection, "server->client"))
-        
-        thread1.daemon = True
-        thread2.daemon = True
-        
-        thread1.start()
-        thread2.start()
-        
-        # 等待任一线程结束
-        thread1.join()
-        thread2.join()
-
-if __name__ == "__main__":
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1083
-    print(f"Starting proxy server on port {port}")
-    
-    try:
-        with socketserver.ThreadingHTTPServer(('0.0.0.0', port), ProxyHandler) as httpd:
-            httpd.serve_forever()
-    except KeyboardInterrupt:
-        print("\nShutting down proxy server...")
-    except Exception as e:
-        print(f"Server error: {e}")
-EOF
-    
-    # 启动代理服务
-    python3 proxy_server.py $PROXY_PORT &
+    # 启动代理服务（scripts/proxy_server.py，引擎可用 PROXY_ENGINE=asyncio|threaded 选择）
+    python3 "$PROXY_SERVER" $PROXY_PORT $(proxy_args) >> $LOG_FILE 2>&1 &
     local pid=$!
     echo $pid > $PID_FILE
     
     log "代理服务启动成功 (PID: $pid)"
     echo -e "${GREEN}✅ 代理服务启动成功${NC}"
     
-    # 等待服务完全启动
-    sleep 3
-    
-    # 验证服务
+    # 验证服务（端口就绪后立即通过，不再固定等待）
     if check_health; then
         log "服务健康检查通过"
         echo -e "${GREEN}🎉 服务已就绪并正常工作${NC}"
@@ -219,18 +106,56 @@ EOF
     fi
 }
 
+# 传给 proxy_server.py / proxy_activator.py 的公共参数
+proxy_args() {
+    echo -n "--engine $PROXY_ENGINE --workers $PROXY_WORKERS"
+    if [ "$PROXY_CACHE" = "1" ]; then
+        echo -n " --cache"
+    fi
+}
+
+# socket 激活：只持有端口，第一个连接到来时才启动代理，空闲后代理自行退出
+activate_service() {
+    echo -e "${BLUE}🔌 以 socket 激活方式启动代理...${NC}"
+    log "尝试以 socket 激活方式启动代理"
+    
+    if check_status > /dev/null 2>&1; then
+        echo -e "${YELLOW}⚠️  服务已在运行，无需重复启动${NC}"
+        log "激活尝试: 服务已在运行"
+        return 0
+    fi
+    
+    python3 "$PROXY_ACTIVATOR" $PROXY_PORT --idle-exit "$PROXY_IDLE_EXIT" $(proxy_args) >> $LOG_FILE 2>&1 &
+    local pid=$!
+    echo $pid > $PID_FILE
+    
+    # 不做健康检查：任何连接都会拉起代理，只确认激活器已绑定端口
+    sleep 0.5
+    if ps -p $pid > /dev/null 2>&1; then
+        log "激活器已启动 (PID: $pid)，代理空闲 ${PROXY_IDLE_EXIT} 秒后退出"
+        echo -e "${GREEN}✅ 端口 ${PROXY_PORT} 已就绪，代理将在第一个连接到来时启动${NC}"
+    else
+        echo -e "${RED}❌ 激活器启动失败，详见 $LOG_FILE${NC}"
+        log "激活器启动失败"
+        cleanup_service
+        return 1
+    fi
+}
+
 # 健康检查
 check_health() {
-    local max_attempts=30
+    local max_attempts=150
     local attempt=1
     
     while [ $attempt -le $max_attempts ]; do
-        if curl -s --connect-timeout 2 $HEALTH_CHECK_URL > /dev/null 2>&1; then
+        if curl -s --connect-timeout 1 $HEALTH_CHECK_URL > /dev/null 2>&1; then
             echo -e "${GREEN}✅ 健康检查通过 (尝试 $attempt/$max_attempts)${NC}"
             return 0
         else
-            echo -e "${YELLOW}⏳ 健康检查中... (尝试 $attempt/$max_attempts)${NC}"
-            sleep 1
+            if [ $((attempt % 10)) -eq 1 ]; then
+                echo -e "${YELLOW}⏳ 健康检查中... (尝试 $attempt/$max_attempts)${NC}"
+            fi
+            sleep 0.2
             ((attempt++))
         fi
     done
@@ -271,7 +196,7 @@ stop_service() {
             local count=0
             while ps -p $pid > /dev/null 2>&1 && [ $count -lt 10 ]; do
                 sleep 1
-                ((count++))
+                count=$((count + 1))
             done
             
             if ps -p $pid > /dev/null 2>&1; then
@@ -300,7 +225,6 @@ stop_service() {
 # 清理资源
 cleanup_service() {
     rm -f $PID_FILE
-    rm -f proxy_server.py
     log "资源清理完成"
 }
 
@@ -322,6 +246,7 @@ show_help() {
     echo ""
     echo "命令:"
     echo "  start     - 启动代理服务"
+    echo "  activate  - 以 socket 激活方式启动（端口常驻，有连接时才启动代理）"
     echo "  stop      - 停止代理服务"
     echo "  status    - 检查服务状态"
     echo "  restart   - 重启代理服务"
@@ -333,6 +258,10 @@ show_help() {
     echo "  代理地址: ${AWS_INSTANCE}:${PROXY_PORT}"
     echo "  日志文件: $LOG_FILE"
     echo "  PID文件: $PID_FILE"
+    echo "  代理引擎: $PROXY_ENGINE (环境变量 PROXY_ENGINE)"
+    echo "  响应缓存: $PROXY_CACHE (环境变量 PROXY_CACHE=1 开启)"
+    echo "  worker 数: $PROXY_WORKERS (环境变量 PROXY_WORKERS，0 表示 CPU 核心数)"
+    echo "  空闲退出: ${PROXY_IDLE_EXIT} 秒 (环境变量 PROXY_IDLE_EXIT，仅 activate)"
     echo ""
     echo "示例:"
     echo "  $0 start      # 启动服务"
@@ -345,6 +274,9 @@ case "${1:-help}" in
     "start")
         start_service
         ;;
+    "activate")
+        activate_service
+        ;;
     "stop")
         stop_service
         ;;
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理的 socket 激活
+本进程只负责绑定并一直持有代理端口，自身不处理任何请求：
+
+  1. 空闲时没有代理进程，新连接由内核排在监听队列里（客户端不会遇到 connection refused）
+  2. 监听 socket 一旦可读，就启动 proxy_server.py --listen-fd，把同一个监听 socket 交给它，
+     排队的连接直接由代理 accept，不经过本进程转发
+  3. 代理连续 --idle-exit 秒没有流量后自行退出，本进程回到第 1 步
+
+冷启动延迟因此只有代理进程自身的启动时间（约 0.1 秒），而不是 on_demand_proxy.sh start
+的 sleep + 健康检查轮询。未识别的参数原样传给 proxy_server.py。
+
+注意：激活模式下任何连接（包括健康检查）都会拉起代理，不要再让 smart_monitor.py
+定时探测该端口，代理的空闲退出由 --idle-exit 负责。
+
+用法:
+  python3 scripts/proxy_activator.py 1083
+  python3 scripts/proxy_activator.py 1083 --idle-exit 600 --engine threaded --cache
+"""
+
+import argparse
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from proxy_server import DEFAULT_PORT
+
+PROXY_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'proxy_server.py')
+
+DEFAULT_IDLE_EXIT = 300
+
+# 代理启动后很快就异常退出时的重试退避（秒）
+_RESTART_BACKOFF_MAX = 30.0
+_CRASH_WINDOW = 1.0
+
+def drop_pending(listener):
+    """
+    拒绝排队中的连接（代理无法启动时，避免客户端一直挂起）
+    """
+    listener.setblocking(False)
+    dropped = 0
+    try:
+        while True:
+            conn, _ = listener.accept()
+            conn.close()
+            dropped += 1
+    except (BlockingIOError, InterruptedError):
+        pass
+    finally:
+        listener.setblocking(True)
+    return dropped
+
+def run_activator(host, port, idle_exit, backend_args):
+    """
+    持有监听端口，按需启动代理进程，直到收到 SIGTERM/SIGINT
+    """
+    listener = socket.create_server((host, port), backlog=1024)
+    listener.set_inheritable(True)
+    fd = listener.fileno()
+    command = [sys.executable, PROXY_SERVER, str(port), '--host', host, '--listen-fd', str(fd),
+               '--idle-exit', str(idle_exit), *backend_args]
+    state = {'stopping': False, 'proc': None}
+
+    def stop(signum, frame):
+        state['stopping'] = True
+        if state['proc'] is not None:
+            state['proc'].terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"🔌 已绑定 {host}:{port}，等待第一个连接 (PID: {os.getpid()})", flush=True)
+
+    backoff = 0.0
+    while not state['stopping']:
+        readable, _, _ = select.select([listener], [], [], 1.0)
+        if not readable or state['stopping']:
+            continue
+        started = time.monotonic()
+        state['proc'] = subprocess.Popen(command, pass_fds=(fd,))
+        print(f"🚀 收到连接，已启动代理 (PID: {state['proc'].pid})", flush=True)
+        code = state['proc'].wait()
+        state['proc'] = None
+        if state['stopping']:
+            break
+        if code == 0:
+            backoff = 0.0
+            print("💤 代理空闲退出，继续等待连接", flush=True)
+            continue
+        # 代理启动即失败时排队的连接不会被处理：拒绝它们并退避，避免反复拉起
+        if time.monotonic() - started < _CRASH_WINDOW:
+            backoff = min(_RESTART_BACKOFF_MAX, backoff * 2 or 1.0)
+            dropped = drop_pending(listener)
+            print(f"❌ 代理异常退出（退出码 {code}），已拒绝 {dropped} 个排队连接，{backoff:g} 秒后再试",
+                  flush=True)
+            time.sleep(backoff)
+        else:
+            backoff = 0.0
+            print(f"⚠️  代理异常退出（退出码 {code}），继续等待连接", flush=True)
+
+    listener.close()
+    print("👋 激活器已退出", flush=True)
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="代理 socket 激活：空闲时只持有端口，有连接时再启动代理",
+                                     epilog="其余参数原样传给 proxy_server.py")
+    parser.add_argument('port', nargs='?', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--idle-exit', type=float, default=DEFAULT_IDLE_EXIT,
+                        help='代理连续无流量这么多秒后退出，等待下一个连接再启动')
+    args, backend_args = parser.parse_known_args()
+    run_activator(args.host, args.port, args.idle_exit, backend_args)
+
+if __name__ == "__main__":
+    main()
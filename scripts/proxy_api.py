@@ -3,6 +3,19 @@
 """
 按需代理 Web API
 提供 RESTful API 来管理代理服务
+
+启动/停止/重启在后台任务中执行（见 proxy_jobs.py）：POST 立即返回 202 与任务 ID，
+通过 GET /api/jobs/<id> 查询进度、耗时与输出；同一动作的并发请求合并到同一个任务。
+
+代理健康状态由后台探测线程每 PROXY_HEALTH_TTL 秒（环境变量，默认 5）刷新一次，
+/api/health、/api/proxy/status 直接返回最近一次的快照，不随请求阻塞；带 ?refresh=1
+或调用 /api/proxy/test 时立即探测，并发的强制探测合并为一次。
+代理以 socket 激活方式运行（on_demand_proxy.sh activate，或设置 PROXY_ACTIVATE_MODE=1）
+时不做后台探测：每次探测都是一个新连接，会拉起代理并重置其空闲计时，使代理永远无法
+空闲退出；此时只在 ?refresh=1 与 /api/proxy/test 时按需探测。
+
+GET /api/events 以 Server-Sent Events 推送状态变化、健康状态转换与任务进度
+（见 proxy_events.py），管理页面只在浏览器不支持或连接断开时才退回轮询。
 """
 
 import os
@@ -10,38 +23,144 @@ import json
 import subprocess
 import requests
 from datetime import datetime
-from flask import Flask, jsonify, request
-from threading import Thread
+from flask import Flask, Response, jsonify, request
+from threading import Thread, Event, Lock
 import time
 
+from proxy_events import EventBroker
+from proxy_jobs import JobManager
+
 app = Flask(__name__)
 
 # 配置
 PROXY_HOST = "192.168.31.147"
 PROXY_PORT = 1083
 HEALTH_CHECK_URL = f"http://{PROXY_HOST}:{PROXY_PORT}"
+HEALTH_CHECK_TIMEOUT = 5
+# 健康快照的有效期（秒），后台探测线程按此间隔刷新
+HEALTH_TTL = float(os.environ.get("PROXY_HEALTH_TTL", "5"))
+# on_demand_proxy.sh 的 PID 文件（相对于运行目录，与 execute_command 一致）
+PID_FILE = "proxy_server.pid"
+# 强制按 socket 激活方式处理（代理不由本机的 on_demand_proxy.sh 管理时使用）
+ACTIVATE_MODE = os.environ.get("PROXY_ACTIVATE_MODE", "").lower() in ("1", "true", "yes")
+# 这些字段变化时推送 status 事件（last_check、latency_ms 每次探测都变，不推送）
+STATUS_EVENT_FIELDS = ("active", "health_status", "start_time", "stop_time")
+
+def activator_running(pid_file=PID_FILE):
+    """on_demand_proxy.sh activate 时 PID 文件指向 proxy_activator.py 进程"""
+    try:
+        with open(pid_file) as f:
+            pid = int(f.read().strip())
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read()
+    except (OSError, ValueError):
+        return False
+    return b"proxy_activator.py" in cmdline
 
 class ProxyManager:
-    def __init__(self):
+    def __init__(self, health_ttl=HEALTH_TTL, on_change=None):
         self.status = {
             "active": False,
             "last_check": None,
             "start_time": None,
             "stop_time": None,
-            "health_status": "unknown"
+            "health_status": "unknown",
+            "response_code": None,
+            "latency_ms": None,
+            "error": None
         }
+        self.health_ttl = health_ttl
+        self.on_change = on_change
+        self.lock = Lock()
+        self.probing = None
+        self.probed_at = None
+        self.probes = 0
+        self.prober = None
     
-    def check_health(self):
-        """检查代理健康状态"""
+    def _probe(self):
+        """实际发起一次健康探测并更新快照"""
+        started = time.monotonic()
+        update = {"response_code": None, "error": None}
         try:
-            response = requests.get(HEALTH_CHECK_URL, timeout=5)
-            self.status["health_status"] = "healthy"
-            self.status["active"] = True
-            return True
-        except:
-            self.status["health_status"] = "unhealthy"
-            self.status["active"] = False
-            return False
+            response = requests.get(HEALTH_CHECK_URL, timeout=HEALTH_CHECK_TIMEOUT)
+            update.update(active=True, health_status="healthy", response_code=response.status_code)
+        except Exception as e:
+            update.update(active=False, health_status="unhealthy", error=str(e))
+        update["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        update["last_check"] = datetime.now().isoformat()
+        with self.lock:
+            self.probed_at = time.monotonic()
+            self.probes += 1
+        self.set_status(**update)
+    
+    def check_health(self):
+        """立即检查代理健康状态；已有探测在进行时等待其结果，不重复探测"""
+        with self.lock:
+            probing = self.probing
+            owner = probing is None
+            if owner:
+                probing = self.probing = Event()
+        if owner:
+            try:
+                self._probe()
+            finally:
+                with self.lock:
+                    self.probing = None
+                probing.set()
+        else:
+            probing.wait()
+        return self.status["active"]
+    
+    def is_running(self):
+        """代理在运行，或激活器持有端口（此时快照不会被后台探测刷新）"""
+        return activator_running() or self.snapshot()["active"]
+    
+    def on_demand_only(self):
+        """socket 激活模式下只能按需探测（见模块说明）"""
+        return ACTIVATE_MODE or activator_running()
+    
+    def _probe_loop(self):
+        while True:
+            if not self.on_demand_only():
+                self.check_health()
+            time.sleep(self.health_ttl)
+    
+    def start_prober(self):
+        """启动后台探测线程（重复调用无副作用）"""
+        with self.lock:
+            if self.prober is not None:
+                return
+            self.prober = Thread(target=self._probe_loop, daemon=True)
+        self.prober.start()
+    
+    def snapshot(self, refresh=False):
+        """返回健康快照；refresh 时（或尚无快照且允许后台探测时）先探测一次"""
+        self.start_prober()
+        if refresh or (self.probed_at is None and not self.on_demand_only()):
+            self.check_health()
+        with self.lock:
+            status = dict(self.status)
+        return self.describe(status)
+    
+    def describe(self, status):
+        """给状态附上快照年龄与探测方式（不触发探测）"""
+        on_demand = self.on_demand_only()
+        with self.lock:
+            probed_at = self.probed_at
+        status = dict(status)
+        status["age_seconds"] = round(time.monotonic() - probed_at, 3) if probed_at is not None else None
+        status["ttl_seconds"] = None if on_demand else self.health_ttl
+        status["probe_mode"] = "on_demand" if on_demand else "background"
+        return status
+    
+    def set_status(self, **fields):
+        """更新状态，并以 (变化前, 变化后) 调用 on_change"""
+        with self.lock:
+            before = dict(self.status)
+            self.status.update(fields)
+            after = dict(self.status)
+        if self.on_change is not None:
+            self.on_change(before, after)
     
     def execute_command(self, action):
         """执行代理管理命令"""
@@ -70,71 +189,120 @@ class ProxyManager:
                 "error": str(e)
             }
 
-proxy_manager = ProxyManager()
+    def _run_step(self, job, action):
+        """在任务中执行一个命令，输出追加到任务上"""
+        job.progress(f"执行 on_demand_proxy.sh {action}")
+        result = self.execute_command(action)
+        job.output += result["output"]
+        job.error += result["error"]
+        return result["success"]
+
+    def run_start(self, job):
+        """后台任务: 启动代理"""
+        if not self._run_step(job, "start"):
+            return False, "代理服务启动失败"
+        # on_demand_proxy.sh start 在健康检查通过后才返回成功，无需再等待
+        job.progress("检查代理健康状态")
+        self.check_health()
+        self.set_status(start_time=datetime.now().isoformat())
+        return True, "代理服务启动成功"
+
+    def run_stop(self, job):
+        """后台任务: 停止代理"""
+        if not self._run_step(job, "stop"):
+            return False, "代理服务停止失败"
+        self.set_status(active=False, health_status="stopped", stop_time=datetime.now().isoformat())
+        return True, "代理服务停止成功"
+
+    def run_restart(self, job):
+        """后台任务: 重启代理（stop 会等待旧进程退出，无需额外等待）"""
+        # 停止失败时旧进程可能仍占用端口，不能再启动新进程与之争抢
+        success, message = self.run_stop(job)
+        if not success:
+            return False, message
+        success, _ = self.run_start(job)
+        return success, "代理服务重启" + ("成功" if success else "失败")
+
+def status_event(status):
+    return {
+        "proxy": status,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def publish_status_change(before, after):
+    """状态变化时推送 health / status 事件"""
+    if before["health_status"] != after["health_status"]:
+        event_broker.publish("health", {
+            "from": before["health_status"],
+            "to": after["health_status"],
+            "timestamp": datetime.now().isoformat()
+        })
+    # 用变化后的状态本身，不能调用 snapshot()：那里可能在任务线程中同步探测
+    if any(before[field] != after[field] for field in STATUS_EVENT_FIELDS):
+        event_broker.publish("status", status_event(proxy_manager.describe(after)))
+
+event_broker = EventBroker()
+proxy_manager = ProxyManager(on_change=publish_status_change)
+job_manager = JobManager({
+    "start": proxy_manager.run_start,
+    "stop": proxy_manager.run_stop,
+    "restart": proxy_manager.run_restart,
+}, on_update=lambda job: event_broker.publish("job", job.to_dict()))
+
+def wants_refresh():
+    """?refresh=1 时强制重新探测"""
+    return request.args.get("refresh", "").lower() in ("1", "true", "yes")
+
+def submit_job(action):
+    """提交后台任务，立即返回 202 与任务信息"""
+    job, coalesced = job_manager.submit(action)
+    return jsonify({
+        "success": True,
+        "message": "已有相同任务在执行" if coalesced else "任务已提交",
+        "job_id": job.id,
+        "coalesced": coalesced,
+        "status_url": f"/api/jobs/{job.id}",
+        "job": job.to_dict()
+    }), 202
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查 API"""
-    is_healthy = proxy_manager.check_health()
-    proxy_manager.status["last_check"] = datetime.now().isoformat()
+    status = proxy_manager.snapshot(refresh=wants_refresh())
     
     return jsonify({
-        "status": "ok" if is_healthy else "error",
-        "proxy": proxy_manager.status,
+        "status": "ok" if status["active"] else "error",
+        "proxy": status,
         "timestamp": datetime.now().isoformat()
     })
 
 @app.route('/api/proxy/start', methods=['POST'])
 def start_proxy():
     """启动代理服务"""
-    if proxy_manager.status["active"]:
+    if proxy_manager.is_running():
         return jsonify({
             "success": False,
             "message": "代理服务已在运行"
         })
     
-    result = proxy_manager.execute_command("start")
-    if result["success"]:
-        time.sleep(3)  # 等待启动
-        proxy_manager.check_health()
-        proxy_manager.status["start_time"] = datetime.now().isoformat()
-    
-    return jsonify({
-        "success": result["success"],
-        "message": "代理服务启动" + ("成功" if result["success"] else "失败"),
-        "output": result["output"],
-        "error": result["error"]
-    })
+    return submit_job("start")
 
 @app.route('/api/proxy/stop', methods=['POST'])
 def stop_proxy():
     """停止代理服务"""
-    if not proxy_manager.status["active"]:
+    if not proxy_manager.is_running():
         return jsonify({
             "success": False,
             "message": "代理服务未运行"
         })
     
-    result = proxy_manager.execute_command("stop")
-    if result["success"]:
-        proxy_manager.status["active"] = False
-        proxy_manager.status["health_status"] = "stopped"
-        proxy_manager.status["stop_time"] = datetime.now().isoformat()
-    
-    return jsonify({
-        "success": result["success"],
-        "message": "代理服务停止" + ("成功" if result["success"] else "失败"),
-        "output": result["output"],
-        "error": result["error"]
-    })
+    return submit_job("stop")
 
 @app.route('/api/proxy/status', methods=['GET'])
 def get_status():
     """获取代理状态"""
-    proxy_manager.check_health()
-    
     return jsonify({
-        "proxy": proxy_manager.status,
+        "proxy": proxy_manager.snapshot(refresh=wants_refresh()),
         "config": {
             "host": PROXY_HOST,
             "port": PROXY_PORT,
@@ -146,41 +314,58 @@ def get_status():
 @app.route('/api/proxy/restart', methods=['POST'])
 def restart_proxy():
     """重启代理服务"""
-    stop_result = proxy_manager.execute_command("stop")
-    time.sleep(2)
-    start_result = proxy_manager.execute_command("start")
-    
-    if start_result["success"]:
-        time.sleep(3)
-        proxy_manager.check_health()
-        proxy_manager.status["start_time"] = datetime.now().isoformat()
-    
+    return submit_job("restart")
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询后台任务的进度、耗时与输出"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "message": "任务不存在或已过期"
+        }), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """最近的后台任务"""
     return jsonify({
-        "success": start_result["success"],
-        "message": "代理服务重启" + ("成功" if start_result["success"] else "失败"),
-        "stop_result": stop_result["success"],
-        "start_result": start_result["success"]
+        "jobs": [job.to_dict() for job in job_manager.recent()],
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.route('/api/events', methods=['GET'])
+def events():
+    """Server-Sent Events：连接后先收到当前状态与进行中的任务，之后只推送变化"""
+    # 先订阅再取快照，避免漏掉两者之间发生的变化
+    subscriber = event_broker.subscribe()
+    initial = [("status", status_event(proxy_manager.snapshot()))]
+    initial += [("job", job.to_dict()) for job in job_manager.recent() if not job.done]
+    return Response(event_broker.stream(subscriber, initial), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
     })
 
 @app.route('/api/proxy/test', methods=['POST'])
 def test_proxy():
     """测试代理功能"""
-    proxy_manager.check_health()
+    # 主动测试总是重新探测（与并发的其它探测合并）
+    status = proxy_manager.snapshot(refresh=True)
     
     test_results = {
-        "health_check": proxy_manager.status["active"],
-        "connection_test": False,
+        "health_check": status["active"],
+        "connection_test": status["response_code"] is not None,
         "proxy_test": False,
+        "latency_ms": status["latency_ms"],
         "timestamp": datetime.now().isoformat()
     }
     
     # 连接测试
-    try:
-        response = requests.get(HEALTH_CHECK_URL, timeout=10)
-        test_results["connection_test"] = True
-        test_results["response_code"] = response.status_code
-    except Exception as e:
-        test_results["connection_error"] = str(e)
+    if status["response_code"] is not None:
+        test_results["response_code"] = status["response_code"]
+    else:
+        test_results["connection_error"] = status["error"]
     
     # 可以添加更多测试...
     
@@ -272,39 +457,99 @@ def index():
             }
         }
         
-        async function startProxy() {
-            log('启动代理服务...');
-            const result = await apiCall('/api/proxy/start');
-            if (result.success) {
-                log('✅ 代理服务启动成功');
-            } else {
-                log(`❌ 启动失败: ${result.message}`);
+        const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+        
+        // 轮询后台任务直到结束，逐条输出新的进度
+        async function waitForJob(jobId, label, seen = 0) {
+            while (true) {
+                let job;
+                try {
+                    const response = await fetch(`/api/jobs/${jobId}`);
+                    job = await response.json();
+                    if (!response.ok) {
+                        log(`❌ ${label}失败: ${job.message}`);
+                        return;
+                    }
+                } catch (error) {
+                    log(`任务查询失败: ${error.message}`);
+                    return;
+                }
+                job.steps.slice(seen).forEach(step => log(`… ${step.message}`));
+                seen = job.steps.length;
+                if (job.state === 'succeeded' || job.state === 'failed') {
+                    const ok = job.state === 'succeeded';
+                    log(`${ok ? '✅' : '❌'} ${job.message}（耗时 ${job.duration_seconds}s）`);
+                    if (!ok && job.error) {
+                        log(job.error);
+                    }
+                    return;
+                }
+                await sleep(1000);
             }
-            checkStatus();
         }
         
-        async function stopProxy() {
-            log('停止代理服务...');
-            const result = await apiCall('/api/proxy/stop');
-            if (result.success) {
-                log('✅ 代理服务停止成功');
-            } else {
-                log(`❌ 停止失败: ${result.message}`);
+        // 通过 SSE 的 job 事件等待任务结束
+        const jobs = {};
+        const jobWaiters = {};
+        
+        function handleJobEvent(job) {
+            jobs[job.id] = job;
+            const waiter = jobWaiters[job.id];
+            if (!waiter) {
+                return;
             }
-            checkStatus();
+            job.steps.slice(waiter.seen).forEach(step => log(`… ${step.message}`));
+            waiter.seen = job.steps.length;
+            if (job.state === 'succeeded' || job.state === 'failed') {
+                const ok = job.state === 'succeeded';
+                log(`${ok ? '✅' : '❌'} ${job.message}（耗时 ${job.duration_seconds}s）`);
+                if (!ok && job.error) {
+                    log(job.error);
+                }
+                delete jobWaiters[job.id];
+                waiter.resolve();
+            }
+        }
+        
+        function waitForJobEvents(jobId) {
+            return new Promise(resolve => {
+                jobWaiters[jobId] = { seen: 0, resolve };
+                if (jobs[jobId]) {
+                    handleJobEvent(jobs[jobId]);
+                }
+            });
         }
         
-        async function restartProxy() {
-            log('重启代理服务...');
-            const result = await apiCall('/api/proxy/restart');
-            if (result.success) {
-                log('✅ 代理服务重启成功');
+        async function runAction(action, label) {
+            log(`${label}代理服务...`);
+            const result = await apiCall(`/api/proxy/${action}`);
+            if (result.job_id) {
+                if (result.coalesced) {
+                    log(`已有${label}任务在执行，等待其完成`);
+                }
+                if (eventsConnected) {
+                    await waitForJobEvents(result.job_id);
+                } else {
+                    await waitForJob(result.job_id, label);
+                }
             } else {
-                log(`❌ 重启失败: ${result.message}`);
+                log(`❌ ${label}失败: ${result.message || result.error}`);
             }
             checkStatus();
         }
         
+        function startProxy() {
+            return runAction('start', '启动');
+        }
+        
+        function stopProxy() {
+            return runAction('stop', '停止');
+        }
+        
+        function restartProxy() {
+            return runAction('restart', '重启');
+        }
+        
         async function testProxy() {
             log('测试代理连接...');
             const result = await apiCall('/api/proxy/test');
@@ -325,9 +570,54 @@ def index():
             }
         }
         
-        // 定期状态检查
-        checkStatus();
-        setInterval(checkStatus, 10000);
+        // 状态由 SSE 推送；浏览器不支持或连接断开时退回定期轮询
+        let eventsConnected = false;
+        let pollTimer = null;
+        
+        function startPolling() {
+            if (pollTimer === null) {
+                checkStatus();
+                pollTimer = setInterval(checkStatus, 10000);
+            }
+        }
+        
+        function stopPolling() {
+            if (pollTimer !== null) {
+                clearInterval(pollTimer);
+                pollTimer = null;
+            }
+        }
+        
+        function connectEvents() {
+            if (!window.EventSource) {
+                startPolling();
+                return;
+            }
+            const source = new EventSource('/api/events');
+            source.onopen = () => {
+                eventsConnected = true;
+                stopPolling();
+            };
+            source.onerror = () => {
+                // EventSource 会自动重连，重连成功前先轮询
+                eventsConnected = false;
+                startPolling();
+                // 断线期间可能错过任务结束事件，等待中的任务改为轮询
+                Object.keys(jobWaiters).forEach(jobId => {
+                    const waiter = jobWaiters[jobId];
+                    delete jobWaiters[jobId];
+                    waitForJob(jobId, '任务', waiter.seen).then(waiter.resolve);
+                });
+            };
+            source.addEventListener('status', event => updateStatus(JSON.parse(event.data)));
+            source.addEventListener('health', event => {
+                const data = JSON.parse(event.data);
+                log(`健康状态: ${data.from} → ${data.to}`);
+            });
+            source.addEventListener('job', event => handleJobEvent(JSON.parse(event.data)));
+        }
+        
+        connectEvents();
         
         // 清理日志
         setInterval(() => {
@@ -351,7 +641,10 @@ if __name__ == '__main__':
     print("  POST /api/proxy/start  - 启动代理")
     print("  POST /api/proxy/stop   - 停止代理")
     print("  POST /api/proxy/restart - 重启代理")
+    print("  GET  /api/jobs/<id>    - 查询任务进度")
+    print("  GET  /api/events       - 状态与任务事件 (SSE)")
     print("  GET  /api/proxy/status - 查看状态")
     print("  POST /api/proxy/test   - 测试代理")
     
+    proxy_manager.start_prober()
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,626 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理响应缓存
+按 Cache-Control / Expires / ETag / Last-Modified 缓存 GET 响应，重复请求直接由
+代理返回，CDN 静态资源和团队反复拉取的视频不必每次都回源。
+
+  内存 LRU   不超过 memory_object_size 的小对象，总量受 memory_size 限制
+  磁盘存储   更大的对象写入 cache_dir，总量受 disk_size 限制，按 LRU 淘汰，重启后保留
+
+过期的条目带着 If-None-Match / If-Modified-Since 回源验证，源站返回 304 时只更新
+头部并继续使用缓存的响应体。命中时支持单段 Range 请求与客户端条件请求（304）。
+
+作为共享缓存，以下情况不存储：no-store、private、带 Authorization 的请求、
+带 Set-Cookie 的响应、Vary: *。
+"""
+
+import collections
+import email.utils
+import hashlib
+import io
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+from fileutil import atomic_write_text
+
+DEFAULT_CACHE_DIR = ".proxy_cache"
+DEFAULT_MEMORY_SIZE = 64 << 20
+DEFAULT_MEMORY_OBJECT_SIZE = 1 << 20
+DEFAULT_DISK_SIZE = 2 << 30
+DEFAULT_MAX_OBJECT_SIZE = 512 << 20
+
+# 可以缓存的状态码
+CACHEABLE_STATUS = {200, 203, 300, 301, 308, 404, 410}
+
+# 只有 Last-Modified 时按 (Date - Last-Modified) 的 10% 估算有效期，最多一天
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX = 24 * 3600
+
+# 不随缓存条目保存的响应头
+_UNSTORED_HEADERS = {
+    'connection', 'keep-alive', 'proxy-connection', 'proxy-authenticate', 'te', 'trailer',
+    'transfer-encoding', 'upgrade', 'age', 'content-length', 'x-cache',
+}
+
+# 304 响应中不用于更新缓存条目的头
+_NOT_MODIFIED_SKIP = _UNSTORED_HEADERS | {'content-encoding', 'content-range', 'content-type'}
+
+# 给客户端返回 304 时携带的头
+_NOT_MODIFIED_HEADERS = {'cache-control', 'content-location', 'date', 'etag', 'expires', 'last-modified', 'vary'}
+
+def parse_cache_control(value):
+    """
+    解析 Cache-Control，返回 {指令: 值或 True}（指令名小写）
+    """
+    directives = {}
+    for part in (value or '').split(','):
+        name, sep, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip().strip('"') if sep else True
+    return directives
+
+def _parse_seconds(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+def _parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def _header(headers, name, default=None):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return default
+
+def freshness_lifetime(status, headers, now=None):
+    """
+    响应的有效期（秒）：s-maxage > max-age > Expires > 基于 Last-Modified 的估算
+    """
+    now = time.time() if now is None else now
+    directives = parse_cache_control(_header(headers, 'Cache-Control'))
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            return _parse_seconds(directives[name]) or 0
+
+    date = _parse_http_date(_header(headers, 'Date')) or now
+    expires = _header(headers, 'Expires')
+    if expires is not None:
+        # 无法解析的 Expires（如 "0"）视为已过期
+        expires_at = _parse_http_date(expires)
+        return max(0, expires_at - date) if expires_at is not None else 0
+
+    last_modified = _parse_http_date(_header(headers, 'Last-Modified'))
+    if last_modified is not None and status in CACHEABLE_STATUS:
+        return min(max(0, date - last_modified) * HEURISTIC_FRACTION, HEURISTIC_MAX)
+    return 0
+
+def parse_range(value, size):
+    """
+    解析单段 Range 头，返回 (起始, 长度)；不支持或无需处理时返回 None，
+    无法满足时返回 False
+    """
+    if not value or not value.startswith('bytes=') or ',' in value:
+        return None
+    first, sep, last = value[6:].strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            start = max(0, size - suffix)
+            end = size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, end - start + 1
+
+def _etag_matches(condition, etag):
+    """
+    If-None-Match 的弱比较
+    """
+    if condition.strip() == '*':
+        return True
+    strip = lambda tag: tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip()
+    return strip(etag) in {strip(tag) for tag in condition.split(',')}
+
+class CacheEntry:
+    """
+    一个缓存的响应：状态、头部与响应体（内存中的 bytes 或磁盘文件）
+    """
+
+    def __init__(self, url, status, reason, headers, vary=None, stored_at=None, initial_age=0,
+                 lifetime=0, no_cache=False, size=0, body=None, path=None):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = [tuple(header) for header in headers]
+        self.vary = vary or {}
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.initial_age = initial_age
+        self.lifetime = lifetime
+        self.no_cache = no_cache
+        self.size = size
+        self.body = body
+        self.path = path
+
+    def header(self, name, default=None):
+        return _header(self.headers, name, default)
+
+    def age(self, now=None):
+        now = time.time() if now is None else now
+        return self.initial_age + max(0, now - self.stored_at)
+
+    def is_fresh(self, now=None):
+        return not self.no_cache and self.age(now) < self.lifetime
+
+    def has_validators(self):
+        return self.header('ETag') is not None or self.header('Last-Modified') is not None
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'status': self.status,
+            'reason': self.reason,
+            'headers': self.headers,
+            'vary': self.vary,
+            'stored_at': self.stored_at,
+            'initial_age': self.initial_age,
+            'lifetime': self.lifetime,
+            'no_cache': self.no_cache,
+            'size': self.size,
+            'body_file': os.path.basename(self.path) if self.path else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data, cache_dir):
+        return cls(
+            data['url'], data['status'], data['reason'], data['headers'], data.get('vary'),
+            data['stored_at'], data.get('initial_age', 0), data.get('lifetime', 0),
+            data.get('no_cache', False), data['size'], path=os.path.join(cache_dir, data['body_file'])
+        )
+
+class CacheWriter:
+    """
+    在转发响应体的同时写入缓存；先写内存，超过小对象上限后转存到磁盘临时文件
+    """
+
+    def __init__(self, cache, entry, expected_length=None):
+        self.cache = cache
+        self.entry = entry
+        self.expected_length = expected_length
+        self.chunks = []
+        self.size = 0
+        self.file = None
+        self.tmp_path = None
+        self.failed = False
+
+    def write(self, data):
+        if self.failed:
+            return
+        self.size += len(data)
+        if self.size > self.cache.max_object_size:
+            self.abort()
+            return
+        try:
+            if self.file is None and self.size > self.cache.memory_object_size:
+                if not self.cache.cache_dir:
+                    self.abort()
+                    return
+                fd, self.tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache.cache_dir)
+                self.file = os.fdopen(fd, 'wb')
+                for chunk in self.chunks:
+                    self.file.write(chunk)
+                self.chunks = []
+            if self.file is not None:
+                self.file.write(data)
+            else:
+                self.chunks.append(bytes(data))
+        except OSError as e:
+            print(f"⚠️  缓存写入失败: {e}")
+            self.abort()
+
+    def commit(self):
+        """
+        响应体完整转发后调用，返回是否已存入缓存
+        """
+        if self.failed:
+            return False
+        if self.expected_length is not None and self.size != self.expected_length:
+            self.abort()
+            return False
+        self.entry.size = self.size
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                self.abort()
+                return False
+            self.cache._store_disk(self.entry, self.tmp_path)
+            self.tmp_path = None
+        else:
+            self.cache._store_memory(self.entry, b''.join(self.chunks))
+        self.chunks = []
+        return True
+
+    def abort(self):
+        self.failed = True
+        self.chunks = []
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+        if self.tmp_path:
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+            self.tmp_path = None
+
+class ResponseCache:
+    """
+    线程安全的响应缓存（内存 LRU + 可选的磁盘存储）
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_size=DEFAULT_MEMORY_SIZE,
+                 memory_object_size=DEFAULT_MEMORY_OBJECT_SIZE, disk_size=DEFAULT_DISK_SIZE,
+                 max_object_size=DEFAULT_MAX_OBJECT_SIZE):
+        self.cache_dir = cache_dir if disk_size > 0 else None
+        self.memory_size = memory_size
+        self.memory_object_size = min(memory_object_size, memory_size)
+        self.disk_size = disk_size
+        self.max_object_size = max_object_size if self.cache_dir else self.memory_object_size
+        self.lock = threading.Lock()
+        self.memory = collections.OrderedDict()
+        self.disk = collections.OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.counters = collections.Counter()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_disk()
+
+    @staticmethod
+    def cache_key(host, port, path):
+        return f"http://{host}:{port}{path}"
+
+    def _meta_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def _load_disk(self):
+        """
+        从 cache_dir 恢复磁盘条目，清理残留的临时文件与无主的响应体
+        """
+        entries = []
+        referenced = set()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = CacheEntry.from_dict(json.load(f), self.cache_dir)
+                if os.path.getsize(entry.path) != entry.size:
+                    raise ValueError("响应体大小不符")
+            except (OSError, ValueError, KeyError, TypeError):
+                os.remove(path)
+                continue
+            entries.append(entry)
+            referenced.add(os.path.basename(entry.path))
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.body') and name not in referenced:
+                os.remove(os.path.join(self.cache_dir, name))
+        for entry in sorted(entries, key=lambda entry: entry.stored_at):
+            self.disk[entry.url] = entry
+            self.disk_bytes += entry.size
+        self._evict_disk()
+
+    # ------------------------------------------------------------------
+    # 查找与回源验证
+    # ------------------------------------------------------------------
+
+    def lookup(self, method, url, request_headers):
+        """
+        查找缓存，返回 (条目或 None, 是否新鲜)
+
+        request_headers 为 {小写名称: 值}。不新鲜的条目需要回源验证
+        （见 upstream_headers / freshen）；非 GET/HEAD 请求会使该 URL 的缓存失效。
+        """
+        if method not in ('GET', 'HEAD'):
+            self.invalidate(url)
+            self._count('bypass')
+            return None, False
+        directives = parse_cache_control(request_headers.get('cache-control'))
+        if 'no-store' in directives or 'authorization' in request_headers:
+            self._count('bypass')
+            return None, False
+
+        with self.lock:
+            entry = self.memory.get(url) or self.disk.get(url)
+            if entry is not None:
+                (self.memory if url in self.memory else self.disk).move_to_end(url)
+        if entry is not None and any(request_headers.get(name) != value for name, value in entry.vary.items()):
+            entry = None
+        if entry is None:
+            self._count('misses')
+            return None, False
+
+        now = time.time()
+        fresh = entry.is_fresh(now)
+        if fresh and ('no-cache' in directives or 'no-cache' in request_headers.get('pragma', '')):
+            fresh = False
+        if fresh and 'max-age' in directives:
+            fresh = entry.age(now) <= (_parse_seconds(directives['max-age']) or 0)
+        if not fresh and not entry.has_validators():
+            self._count('misses')
+            return None, False
+        return entry, fresh
+
+    def upstream_headers(self, method, request_headers, entry):
+        """
+        回源时需要去掉的请求头（小写名称集合）与追加的请求头列表
+
+        有待验证的条目时用它的 ETag / Last-Modified 发条件请求；没有缓存时把
+        浏览器播放视频常用的 Range: bytes=0- 去掉，以取得可缓存的完整响应。
+        """
+        drop = set()
+        extra = []
+        if entry is not None:
+            drop.update(('if-none-match', 'if-modified-since', 'if-match', 'if-unmodified-since', 'if-range', 'range'))
+            if entry.header('ETag') is not None:
+                extra.append(('If-None-Match', entry.header('ETag')))
+            if entry.header('Last-Modified') is not None:
+                extra.append(('If-Modified-Since', entry.header('Last-Modified')))
+        elif method == 'GET' and request_headers.get('range', '').replace(' ', '') == 'bytes=0-':
+            drop.add('range')
+        return drop, extra
+
+    def freshen(self, entry, response_headers):
+        """
+        源站返回 304：用新的头部更新条目并重新计时，返回更新后的条目
+        """
+        updates = [(name, value) for name, value in response_headers
+                   if name.lower() not in _NOT_MODIFIED_SKIP]
+        names = {name.lower() for name, _ in updates}
+        with self.lock:
+            entry.headers = [header for header in entry.headers if header[0].lower() not in names] + updates
+            entry.stored_at = time.time()
+            entry.initial_age = _parse_seconds(_header(response_headers, 'Age')) or 0
+            entry.lifetime = freshness_lifetime(entry.status, entry.headers, entry.stored_at)
+            entry.no_cache = 'no-cache' in parse_cache_control(entry.header('Cache-Control'))
+            on_disk = self.disk.get(entry.url) is entry
+        if on_disk:
+            self._write_meta(entry)
+        self._count('revalidated')
+        return entry
+
+    def invalidate(self, url):
+        with self.lock:
+            entry = self.memory.pop(url, None)
+            if entry is not None:
+                self.memory_bytes -= entry.size
+            removed = self.disk.pop(url, None)
+            if removed is not None:
+                self.disk_bytes -= removed.size
+        if removed is not None:
+            self._remove_files(removed)
+
+    # ------------------------------------------------------------------
+    # 存储
+    # ------------------------------------------------------------------
+
+    def open_writer(self, method, url, request_headers, status, reason, response_headers):
+        """
+        响应可以缓存时返回 CacheWriter，否则返回 None
+        """
+        if method != 'GET' or status not in CACHEABLE_STATUS:
+            return None
+        request_directives = parse_cache_control(request_headers.get('cache-control'))
+        directives = parse_cache_control(_header(response_headers, 'Cache-Control'))
+        if ('no-store' in request_directives or 'authorization' in request_headers
+                or 'no-store' in directives or 'private' in directives
+                or _header(response_headers, 'Set-Cookie') is not None):
+            self._count('uncacheable')
+            return None
+
+        vary_names = [name.strip().lower() for name in (_header(response_headers, 'Vary') or '').split(',') if name.strip()]
+        if '*' in vary_names:
+            self._count('uncacheable')
+            return None
+        now = time.time()
+        lifetime = freshness_lifetime(status, response_headers, now)
+        no_cache = 'no-cache' in directives
+        has_validators = (_header(response_headers, 'ETag') is not None
+                          or _header(response_headers, 'Last-Modified') is not None)
+        if (lifetime <= 0 or no_cache) and not has_validators:
+            self._count('uncacheable')
+            return None
+
+        length = _parse_seconds(_header(response_headers, 'Content-Length'))
+        if length is not None and length > self.max_object_size:
+            self._count('uncacheable')
+            return None
+
+        entry = CacheEntry(
+            url, status, reason,
+            [(name, value) for name, value in response_headers if name.lower() not in _UNSTORED_HEADERS],
+            vary={name: request_headers.get(name) for name in vary_names},
+            stored_at=now, initial_age=_parse_seconds(_header(response_headers, 'Age')) or 0,
+            lifetime=lifetime, no_cache=no_cache,
+        )
+        return CacheWriter(self, entry, length)
+
+    def _store_memory(self, entry, body):
+        entry.body = body
+        self.invalidate(entry.url)
+        with self.lock:
+            self.memory[entry.url] = entry
+            self.memory_bytes += entry.size
+            while self.memory_bytes > self.memory_size and self.memory:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= evicted.size
+                self.counters['evicted'] += 1
+            self.counters['stored'] += 1
+
+    def _store_disk(self, entry, tmp_path):
+        name = hashlib.sha256(entry.url.encode('utf-8')).hexdigest()
+        entry.path = os.path.join(self.cache_dir, f"{name}.{secrets.token_hex(4)}.body")
+        self.invalidate(entry.url)
+        try:
+            os.replace(tmp_path, entry.path)
+            self._write_meta(entry)
+        except OSError as e:
+            print(f"⚠️  缓存写入失败: {e}")
+            self._remove_files(entry)
+            return
+        with self.lock:
+            self.disk[entry.url] = entry
+            self.disk_bytes += entry.size
+            self.counters['stored'] += 1
+        self._evict_disk()
+
+    def _write_meta(self, entry):
+        atomic_write_text(self._meta_path(entry.url), json.dumps(entry.to_dict(), ensure_ascii=False))
+
+    def _evict_disk(self):
+        evicted = []
+        with self.lock:
+            while self.disk_bytes > self.disk_size and self.disk:
+                _, entry = self.disk.popitem(last=False)
+                self.disk_bytes -= entry.size
+                evicted.append(entry)
+            self.counters['evicted'] += len(evicted)
+        for entry in evicted:
+            self._remove_files(entry)
+
+    def _remove_files(self, entry):
+        # 正在读取该文件的请求仍持有打开的文件描述符，不受影响
+        for path in (entry.path, self._meta_path(entry.url)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # 命中时生成响应
+    # ------------------------------------------------------------------
+
+    def hit_response(self, entry, method, request_headers, cache_status='HIT', buffer_size=64 * 1024):
+        """
+        用缓存条目生成响应，返回 (状态码, 原因短语, 头部列表, 响应体块迭代器或 None)
+
+        响应体文件已被淘汰时返回 None，调用方按未命中处理。
+        """
+        now = time.time()
+        headers = [header for header in entry.headers]
+        headers.append(('Age', str(int(entry.age(now)))))
+        headers.append(('X-Cache', cache_status))
+
+        if entry.status == 200 and self._client_not_modified(entry, request_headers):
+            headers = [header for header in headers if header[0].lower() in _NOT_MODIFIED_HEADERS
+                       or header[0] in ('Age', 'X-Cache')]
+            self._count_hit(cache_status, 0)
+            return 304, 'Not Modified', headers, None
+
+        status, reason, start, length = entry.status, entry.reason, 0, entry.size
+        if entry.status == 200 and 'range' in request_headers:
+            byte_range = parse_range(request_headers['range'], entry.size)
+            if byte_range is False:
+                headers = [('Content-Range', f"bytes */{entry.size}"), ('Content-Length', '0'),
+                           ('X-Cache', cache_status)]
+                self._count_hit(cache_status, 0)
+                return 416, 'Range Not Satisfiable', headers, None
+            if byte_range is not None:
+                start, length = byte_range
+                status, reason = 206, 'Partial Content'
+                headers.append(('Content-Range', f"bytes {start}-{start + length - 1}/{entry.size}"))
+        headers.append(('Content-Length', str(length)))
+
+        if method == 'HEAD':
+            self._count_hit(cache_status, 0)
+            return status, reason, headers, None
+        body = self._open_body(entry)
+        if body is None:
+            return None
+        self._count_hit(cache_status, length)
+        return status, reason, headers, self._iter_body(body, start, length, buffer_size)
+
+    @staticmethod
+    def _client_not_modified(entry, request_headers):
+        condition = request_headers.get('if-none-match')
+        if condition is not None:
+            etag = entry.header('ETag')
+            return etag is not None and _etag_matches(condition, etag)
+        since = _parse_http_date(request_headers.get('if-modified-since'))
+        last_modified = _parse_http_date(entry.header('Last-Modified'))
+        return since is not None and last_modified is not None and last_modified <= since
+
+    def _open_body(self, entry):
+        if entry.body is not None:
+            return io.BytesIO(entry.body)
+        try:
+            return open(entry.path, 'rb')
+        except OSError:
+            self.invalidate(entry.url)
+            return None
+
+    @staticmethod
+    def _iter_body(body, start, length, buffer_size):
+        with body:
+            body.seek(start)
+            while length > 0:
+                data = body.read(min(buffer_size, length))
+                if not data:
+                    break
+                length -= len(data)
+                yield data
+
+    def _count_hit(self, cache_status, size):
+        with self.lock:
+            if cache_status == 'HIT':
+                self.counters['hits'] += 1
+            self.counters['bytes_served'] += size
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.counters['hits'],
+                'revalidated': self.counters['revalidated'],
+                'misses': self.counters['misses'],
+                'bypass': self.counters['bypass'],
+                'uncacheable': self.counters['uncacheable'],
+                'stored': self.counters['stored'],
+                'evicted': self.counters['evicted'],
+                'bytes_served': self.counters['bytes_served'],
+                'memory_entries': len(self.memory),
+                'memory_bytes': self.memory_bytes,
+                'disk_entries': len(self.disk),
+                'disk_bytes': self.disk_bytes,
+            }
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理上游的 DNS 缓存与连接
+每个隧道、每个新上游连接原来都要做一次阻塞的 getaddrinfo。这里在进程内缓存解析结果：
+
+  - 成功结果缓存 ttl 秒，失败结果（如 NXDOMAIN）缓存 negative_ttl 秒
+    （getaddrinfo 不返回记录自身的 TTL，因此使用固定值）
+  - 同一主机的并发解析合并为一次，其余调用方等待同一个结果
+  - 连接时按 RFC 8305（Happy Eyeballs）交错 IPv6/IPv4 地址：前一个地址
+    happy_eyeballs_delay 秒内没连上就同时尝试下一个，先连上者胜出；
+    连上的地址移到缓存列表最前，之后直接使用
+
+命中率等计数通过代理的 /stats 的 dns 字段返回。IP 地址字面量不经过缓存。
+"""
+
+import asyncio
+import collections
+import errno
+import os
+import select
+import socket
+import threading
+import time
+
+DEFAULT_TTL = 60
+DEFAULT_NEGATIVE_TTL = 10
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_HAPPY_EYEBALLS_DELAY = 0.25
+
+def is_ip_address(host):
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (OSError, ValueError):
+            pass
+    return False
+
+def interleave_families(infos):
+    """
+    按地址族交错排列（保持各族内部顺序，第一个地址的族优先）
+    """
+    groups = collections.OrderedDict()
+    for info in infos:
+        groups.setdefault(info[0], []).append(info)
+    result = []
+    queues = [collections.deque(group) for group in groups.values()]
+    while queues:
+        for queue in list(queues):
+            result.append(queue.popleft())
+            if not queue:
+                queues.remove(queue)
+    return result
+
+class _Entry:
+    __slots__ = ('infos', 'error', 'expires')
+
+    def __init__(self, infos, error, expires):
+        self.infos = infos
+        self.error = error
+        self.expires = expires
+
+class _Pending:
+    """
+    进行中的解析（threaded 调用方在 event 上等待结果；解析本身出错时错误放在 error 里）
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+        self.error = None
+
+class Resolver:
+    """
+    带缓存的解析器（线程安全；异步方法只能在同一个事件循环中使用）
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 happy_eyeballs_delay=DEFAULT_HAPPY_EYEBALLS_DELAY):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.pending = {}
+        self.pending_async = {}
+        self.counters = collections.Counter()
+        self.lookup_seconds = 0.0
+
+    # ----------------------------------------------------------------- 缓存
+
+    def _cached(self, key):
+        """
+        调用方持有锁；返回未过期的缓存项并更新计数
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del self.entries[key]
+            self.counters['expired'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.counters['negative_hits' if entry.error else 'hits'] += 1
+        return entry
+
+    def _lookup(self, host, port):
+        started = time.monotonic()
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            return self._store((host, port), infos, None, time.monotonic() - started)
+        except socket.gaierror as e:
+            return self._store((host, port), None, e, time.monotonic() - started)
+        except UnicodeError as e:
+            # 非法主机名（如 IDNA 标签超长）按解析失败处理，同样做负缓存
+            error = socket.gaierror(socket.EAI_NONAME, f"invalid host name: {e}")
+            return self._store((host, port), None, error, time.monotonic() - started)
+
+    def _store(self, key, infos, error, seconds):
+        ttl = self.negative_ttl if error else self.ttl
+        entry = _Entry(interleave_families(infos) if infos else None, error, time.monotonic() + ttl)
+        with self.lock:
+            self.counters['lookups'] += 1
+            self.lookup_seconds += seconds
+            if error:
+                self.counters['failures'] += 1
+            if ttl > 0:
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.counters['evicted'] += 1
+        return entry
+
+    @staticmethod
+    def _result(entry):
+        if entry.error is not None:
+            raise socket.gaierror(*entry.error.args)
+        return list(entry.infos)
+
+    def resolve(self, host, port):
+        """
+        解析主机，返回 getaddrinfo 格式的地址列表（已按地址族交错）；失败时抛出 socket.gaierror
+        """
+        if is_ip_address(host):
+            return socket.getaddrinfo(host, port, type=socket.SOCK_STREAM, flags=socket.AI_NUMERICHOST)
+        key = (host, port)
+        with self.lock:
+            entry = self._cached(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                pending = self.pending.get(key)
+                owner = pending is None
+                if owner:
+                    pending = self.pending[key] = _Pending()
+                else:
+                    self.counters['coalesced'] += 1
+        if entry is not None:
+            return self._result(entry)
+        if not owner:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return self._result(pending.entry)
+        try:
+            pending.entry = self._lookup(host, port)
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+            pending.event.set()
+        return self._result(pending.entry)
+
+    async def resolve_async(self, host, port):
+        """
+        resolve 的 asyncio 版本：解析在默认线程池中进行，不阻塞事件循环
+        """
+        if is_ip_address(host):
+            return socket.getaddrinfo(host, port, type=socket.SOCK_STREAM, flags=socket.AI_NUMERICHOST)
+        key = (host, port)
+        with self.lock:
+            entry = self._cached(key)
+            if entry is None:
+                self.counters['misses'] += 1
+        if entry is not None:
+            return self._result(entry)
+        future = self.pending_async.get(key)
+        if future is not None:
+            with self.lock:
+                self.counters['coalesced'] += 1
+            return self._result(await asyncio.shield(future))
+        loop = asyncio.get_running_loop()
+        future = self.pending_async[key] = loop.create_future()
+        try:
+            entry = await loop.run_in_executor(None, self._lookup, host, port)
+            future.set_result(entry)
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其它等待者时避免 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self.pending_async.pop(key, None)
+        return self._result(entry)
+
+    def prefer(self, host, port, sockaddr):
+        """
+        第一个地址没能最先连上时，把连接成功的地址移到缓存列表最前
+        """
+        with self.lock:
+            self.counters['fallbacks'] += 1
+            entry = self.entries.get((host, port))
+            if entry is None or not entry.infos or entry.infos[0][4] == sockaddr:
+                return
+            entry.infos.sort(key=lambda info: info[4] != sockaddr)
+
+    # ----------------------------------------------------------------- 连接
+
+    def create_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+        """
+        与 socket.create_connection 相同的接口，使用缓存解析与 Happy Eyeballs
+        """
+        host, port = address[:2]
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            timeout = socket.getdefaulttimeout()
+        infos = self.resolve(host, port)
+        sock, sockaddr = self._staggered_connect(infos, timeout, source_address)
+        if sockaddr != infos[0][4]:
+            self.prefer(host, port, sockaddr)
+        sock.settimeout(timeout)
+        return sock
+
+    def _staggered_connect(self, infos, timeout, source_address):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        queue = collections.deque(infos)
+        pending = {}
+        poller = select.poll()
+        next_start = time.monotonic()
+        last_error = None
+        try:
+            while queue or pending:
+                now = time.monotonic()
+                if queue and (not pending or now >= next_start):
+                    family, socktype, proto, _, sockaddr = queue.popleft()
+                    sock = None
+                    try:
+                        sock = socket.socket(family, socktype, proto)
+                        sock.setblocking(False)
+                        if source_address:
+                            sock.bind(source_address)
+                        err = sock.connect_ex(sockaddr)
+                        if err not in (0, errno.EINPROGRESS):
+                            raise OSError(err, os.strerror(err))
+                    except OSError as e:
+                        last_error = e
+                        if sock is not None:
+                            sock.close()
+                        continue
+                    pending[sock.fileno()] = (sock, sockaddr)
+                    poller.register(sock, select.POLLOUT)
+                    next_start = now + self.happy_eyeballs_delay
+                    continue
+                wait = next_start - now if queue else None
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise socket.timeout("timed out")
+                    wait = remaining if wait is None else min(wait, remaining)
+                for fd, _ in poller.poll(None if wait is None else max(wait, 0) * 1000):
+                    sock, sockaddr = pending.pop(fd)
+                    poller.unregister(fd)
+                    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err == 0:
+                        sock.setblocking(True)
+                        return sock, sockaddr
+                    last_error = OSError(err, os.strerror(err))
+                    sock.close()
+                    # 失败时立即尝试下一个地址
+                    next_start = time.monotonic()
+            raise last_error or OSError("no addresses to connect to")
+        finally:
+            for sock, _ in pending.values():
+                sock.close()
+
+    async def open_connection(self, host, port, **kwds):
+        """
+        与 asyncio.open_connection 相同的返回值，使用缓存解析与 Happy Eyeballs
+        """
+        infos = await self.resolve_async(host, port)
+        sock, sockaddr = await self._staggered_connect_async(infos)
+        if sockaddr != infos[0][4]:
+            self.prefer(host, port, sockaddr)
+        return await asyncio.open_connection(sock=sock, **kwds)
+
+    @staticmethod
+    async def _attempt_async(loop, info):
+        family, socktype, proto, _, sockaddr = info
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.setblocking(False)
+            await loop.sock_connect(sock, sockaddr)
+        except BaseException:
+            sock.close()
+            raise
+        return sock, sockaddr
+
+    async def _staggered_connect_async(self, infos):
+        loop = asyncio.get_running_loop()
+        queue = collections.deque(infos)
+        pending = set()
+        last_error = None
+        winner = None
+        try:
+            while queue or pending:
+                if queue:
+                    pending.add(loop.create_task(self._attempt_async(loop, queue.popleft())))
+                done, pending = await asyncio.wait(
+                    pending, timeout=self.happy_eyeballs_delay if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        task.result()[0].close()
+                if winner is not None:
+                    return winner
+            raise last_error or OSError("no addresses to connect to")
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_close_unused)
+
+    def stats(self):
+        with self.lock:
+            counters = self.counters
+            answered = counters['hits'] + counters['negative_hits'] + counters['misses']
+            lookups = counters['lookups']
+            return {
+                'entries': len(self.entries),
+                'hits': counters['hits'],
+                'negative_hits': counters['negative_hits'],
+                'misses': counters['misses'],
+                'coalesced': counters['coalesced'],
+                'lookups': lookups,
+                'failures': counters['failures'],
+                'expired': counters['expired'],
+                'evicted': counters['evicted'],
+                'fallbacks': counters['fallbacks'],
+                'hit_rate': round((counters['hits'] + counters['negative_hits']) / answered, 4) if answered else None,
+                'avg_lookup_ms': round(self.lookup_seconds / lookups * 1000, 2) if lookups else None,
+            }
+
+def _close_unused(task):
+    if not task.cancelled() and task.exception() is None:
+        task.result()[0].close()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+proxy_api.py 的 Server-Sent Events 推送
+后台探测线程与任务队列是唯一的事件来源，通过 EventBroker.publish 发布一次，
+消息只序列化一次，再分发给所有 GET /api/events 连接：
+
+  status  代理状态（active / health_status / 启停时间）发生变化
+  health  健康状态转换，如 healthy → unhealthy
+  job     后台任务的状态或进度变化
+
+每个连接有自己的有界队列；客户端消费过慢导致队列写满时断开该连接，浏览器的
+EventSource 会自动重连并重新收到当前状态。空闲时定期发送注释行保持连接。
+"""
+
+import json
+import queue
+import threading
+
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_HEARTBEAT = 15
+# 断线后浏览器重连的等待时间（毫秒）
+RETRY_MS = 3000
+
+def format_event(event, data, event_id=None):
+    """
+    编码为一条 SSE 消息
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+class EventBroker:
+    """
+    一对多的事件分发（线程安全）
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, heartbeat=DEFAULT_HEARTBEAT):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.next_id = 0
+
+    def subscribe(self):
+        subscriber = queue.Queue(self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        with self.lock:
+            self.next_id += 1
+            message = format_event(event, data, self.next_id)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                self._disconnect(subscriber)
+
+    def _disconnect(self, subscriber):
+        """
+        丢弃积压的消息，放入结束标记，让 stream 关闭该连接
+        """
+        self.unsubscribe(subscriber)
+        while True:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                break
+        subscriber.put_nowait(None)
+
+    def stream(self, subscriber, initial=()):
+        """
+        生成 SSE 响应体；initial 为连接建立时先发送的 (事件, 数据) 列表
+        """
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            for event, data in initial:
+                yield format_event(event, data)
+            while True:
+                try:
+                    message = subscriber.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
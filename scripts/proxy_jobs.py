@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理生命周期的后台任务
+proxy_api.py 的启动/停止/重启不再在 Flask 请求里同步执行 on_demand_proxy.sh：
+POST 立即返回任务 ID，任务在后台线程中依次执行，进度、耗时与输出通过
+GET /api/jobs/<id> 查询。
+
+  - 同一动作已在排队或执行时，新的请求直接返回该任务（coalesced），不会重复执行
+  - 不同动作按提交顺序串行执行，避免启动与停止交错
+  - 只保留最近 history 个已结束的任务
+"""
+
+import collections
+import threading
+import time
+import uuid
+
+DEFAULT_HISTORY = 50
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+class Job:
+    """
+    一个后台任务；progress 由执行函数调用，记录带时间戳的步骤
+    """
+
+    def __init__(self, action, on_update=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.action = action
+        self.state = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.steps = []
+        self.output = ''
+        self.error = ''
+        self.message = ''
+        self._on_update = on_update
+
+    @property
+    def done(self):
+        return self.state in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def progress(self, message):
+        self.steps.append({'at': time.time(), 'message': message})
+        self._notify()
+
+    def _notify(self):
+        if self._on_update is not None:
+            self._on_update(self)
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        return {
+            'id': self.id,
+            'action': self.action,
+            'state': self.state,
+            'success': self.state == JOB_SUCCEEDED if self.done else None,
+            'message': self.message,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queue_seconds': round((self.started_at or end) - self.created_at, 3),
+            'duration_seconds': round(end - self.started_at, 3) if self.started_at else None,
+            'steps': list(self.steps),
+            'output': self.output,
+            'error': self.error,
+        }
+
+class JobManager:
+    """
+    串行执行生命周期任务的后台队列（线程安全）
+
+    handlers 为 {动作: 函数(job)}，函数返回 (是否成功, 说明)，可设置 job.output / job.error；
+    on_update(job) 在任务状态或进度变化时调用。
+    """
+
+    def __init__(self, handlers, history=DEFAULT_HISTORY, on_update=None):
+        self.handlers = handlers
+        self.history = history
+        self.on_update = on_update
+        self.lock = threading.Lock()
+        self.jobs = collections.OrderedDict()
+        self.queue = collections.deque()
+        self.worker = None
+
+    def submit(self, action):
+        """
+        提交任务，返回 (任务, 是否合并到了已有任务)
+        """
+        if action not in self.handlers:
+            raise ValueError(f"未知动作: {action}")
+        with self.lock:
+            for job in self.jobs.values():
+                if job.action == action and not job.done:
+                    return job, True
+            job = Job(action, self.on_update)
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+        job._notify()
+        return job, False
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def recent(self, limit=10):
+        with self.lock:
+            return list(self.jobs.values())[-limit:]
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.queue:
+                    self.worker = None
+                    return
+                job = self.queue.popleft()
+            job.state = JOB_RUNNING
+            job.started_at = time.time()
+            job._notify()
+            try:
+                success, message = self.handlers[job.action](job)
+            except Exception as e:
+                success, message = False, f"{type(e).__name__}: {e}"
+            job.message = message
+            job.finished_at = time.time()
+            job.state = JOB_SUCCEEDED if success else JOB_FAILED
+            job._notify()
+            self._trim()
+
+    def _trim(self):
+        with self.lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.done]
+            for job_id in finished[:max(0, len(finished) - self.history)]:
+                del self.jobs[job_id]
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理的准入控制
+限制同时处理的客户端连接数、CONNECT 隧道数与单个客户端 IP 的连接数，避免突发流量
+或少数卡住的客户端耗尽线程与文件描述符：
+
+  连接数已满   新连接排队等待最多 queue_timeout 秒（threaded 引擎在 accept 循环中等待，
+               后续连接留在内核监听队列里，形成背压），仍无空位时快速返回 503
+  单 IP 超限   立即返回 503，不排队，避免一个客户端拖住其它客户端
+  隧道数已满   CONNECT 立即返回 503
+
+503 响应带 Retry-After 与 X-Proxy-Limit（触发的限制）头。当前占用、排队数与各类拒绝次数
+通过 /stats 的 limits 字段返回。多 worker 模式下每个 worker 各自计数。
+"""
+
+import asyncio
+import threading
+import time
+
+DEFAULT_MAX_CONNECTIONS = 1024
+DEFAULT_MAX_TUNNELS = 512
+# 0 表示不限制
+DEFAULT_MAX_PER_IP = 0
+DEFAULT_QUEUE_TIMEOUT = 5.0
+
+# 拒绝原因
+LIMIT_CONNECTIONS = 'connections'
+LIMIT_PER_IP = 'per_ip'
+LIMIT_TUNNELS = 'tunnels'
+
+RETRY_AFTER = 1
+OVERLOAD_BODY = b"proxy overloaded, retry later\n"
+
+def overload_response(limit):
+    """
+    完整的 503 响应（连接随后关闭）
+    """
+    return (
+        "HTTP/1.1 503 Service Unavailable\r\n"
+        "Content-Type: text/plain; charset=utf-8\r\n"
+        f"Content-Length: {len(OVERLOAD_BODY)}\r\n"
+        f"Retry-After: {RETRY_AFTER}\r\n"
+        f"X-Proxy-Limit: {limit}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode('latin-1') + OVERLOAD_BODY
+
+class AdmissionControl:
+    """
+    连接与隧道计数（线程安全）
+
+    threaded 引擎使用阻塞的 acquire_connection，asyncio 引擎使用 acquire_connection_async；
+    两者共用同一套计数，release_connection 会唤醒两种等待者。
+    """
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, max_tunnels=DEFAULT_MAX_TUNNELS,
+                 max_per_ip=DEFAULT_MAX_PER_IP, queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.max_connections = max_connections
+        self.max_tunnels = max_tunnels
+        self.max_per_ip = max_per_ip
+        self.queue_timeout = queue_timeout
+        self.cond = threading.Condition()
+        self.connections = 0
+        self.tunnels = 0
+        self.per_ip = {}
+        self.queued = 0
+        self.peak_connections = 0
+        self.peak_tunnels = 0
+        self.rejected = {LIMIT_CONNECTIONS: 0, LIMIT_PER_IP: 0, LIMIT_TUNNELS: 0}
+        self._released = None
+
+    def _check(self, ip):
+        if self.max_per_ip and self.per_ip.get(ip, 0) >= self.max_per_ip:
+            return LIMIT_PER_IP
+        if self.max_connections and self.connections >= self.max_connections:
+            return LIMIT_CONNECTIONS
+        return None
+
+    def _try_admit(self, ip):
+        """
+        调用方持有锁；返回 None 表示已准入，否则为未通过的限制
+        """
+        limit = self._check(ip)
+        if limit is None:
+            self.connections += 1
+            self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+            self.peak_connections = max(self.peak_connections, self.connections)
+        return limit
+
+    def acquire_connection(self, ip):
+        """
+        为新连接占一个名额，连接数已满时最多等待 queue_timeout 秒（阻塞）
+
+        返回 None 表示已准入（之后必须调用 release_connection），否则为拒绝原因。
+        """
+        with self.cond:
+            limit = self._try_admit(ip)
+            if limit == LIMIT_CONNECTIONS and self.queue_timeout > 0:
+                deadline = time.monotonic() + self.queue_timeout
+                self.queued += 1
+                try:
+                    while limit == LIMIT_CONNECTIONS:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.cond.wait(remaining)
+                        limit = self._try_admit(ip)
+                finally:
+                    self.queued -= 1
+            if limit is not None:
+                self.rejected[limit] += 1
+            return limit
+
+    async def acquire_connection_async(self, ip):
+        """
+        acquire_connection 的 asyncio 版本（只能在同一个事件循环中调用）
+        """
+        if self._released is None:
+            self._released = asyncio.Event()
+        with self.cond:
+            limit = self._try_admit(ip)
+        if limit == LIMIT_CONNECTIONS and self.queue_timeout > 0:
+            deadline = time.monotonic() + self.queue_timeout
+            self.queued += 1
+            try:
+                while limit == LIMIT_CONNECTIONS:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._released.clear()
+                    try:
+                        await asyncio.wait_for(self._released.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    with self.cond:
+                        limit = self._try_admit(ip)
+            finally:
+                self.queued -= 1
+        if limit is not None:
+            with self.cond:
+                self.rejected[limit] += 1
+        return limit
+
+    def release_connection(self, ip):
+        with self.cond:
+            self.connections -= 1
+            count = self.per_ip.get(ip, 0) - 1
+            if count > 0:
+                self.per_ip[ip] = count
+            else:
+                self.per_ip.pop(ip, None)
+            self.cond.notify()
+        if self._released is not None:
+            self._released.set()
+
+    def acquire_tunnel(self):
+        """
+        为 CONNECT 隧道占一个名额，已满时返回 False（不等待）
+        """
+        with self.cond:
+            if self.max_tunnels and self.tunnels >= self.max_tunnels:
+                self.rejected[LIMIT_TUNNELS] += 1
+                return False
+            self.tunnels += 1
+            self.peak_tunnels = max(self.peak_tunnels, self.tunnels)
+            return True
+
+    def release_tunnel(self):
+        with self.cond:
+            self.tunnels -= 1
+
+    def stats(self):
+        with self.cond:
+            return {
+                'max_connections': self.max_connections,
+                'max_tunnels': self.max_tunnels,
+                'max_per_ip': self.max_per_ip,
+                'queue_timeout': self.queue_timeout,
+                'connections': self.connections,
+                'tunnels': self.tunnels,
+                'client_ips': len(self.per_ip),
+                'queued': self.queued,
+                'peak_connections': self.peak_connections,
+                'peak_tunnels': self.peak_tunnels,
+                'rejected': dict(self.rejected),
+            }
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理上游连接池
+按源站 (主机, 端口) 保存空闲的 keep-alive 连接，重复请求同一源站时复用，
+省去每次新建 TCP 连接的握手。
+
+  UpstreamPool       threaded 引擎使用，保存 http.client.HTTPConnection
+  AsyncUpstreamPool  asyncio 引擎使用，保存 (StreamReader, StreamWriter)
+
+空闲连接在以下情况被淘汰：超过 idle_timeout、对端已关闭或出现了不请自来的数据、
+某个源站的空闲连接超过 max_idle。新建连接时若传入了 resolver（proxy_dns.Resolver），
+使用其缓存解析与 Happy Eyeballs 连接。
+"""
+
+import asyncio
+import collections
+import http.client
+import select
+import threading
+import time
+
+DEFAULT_MAX_IDLE = 8
+DEFAULT_IDLE_TIMEOUT = 30
+
+# 全量清理过期连接的最小间隔（秒）
+_SWEEP_INTERVAL = 1.0
+
+def _socket_is_healthy(sock):
+    """
+    空闲连接可读意味着对端已关闭（或发来了多余数据），都不能再复用
+
+    使用 poll 而不是 select：raise_nofile_limit 之后描述符可以超过 FD_SETSIZE (1024)，
+    select 对这样的描述符会抛出 ValueError，导致所有连接都被当作不可用。
+    """
+    if sock is None or sock.fileno() < 0:
+        return False
+    poller = select.poll()
+    poller.register(sock, select.POLLIN | select.POLLERR | select.POLLHUP)
+    try:
+        return not poller.poll(0)
+    except OSError:
+        return False
+
+class _IdleSet:
+    """
+    按源站分组的空闲连接集合（调用方负责加锁）
+    """
+
+    def __init__(self, max_idle, idle_timeout):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.last_sweep = time.monotonic()
+        self.counters = collections.Counter()
+
+    def pop(self, key, healthy):
+        """
+        取出一个仍然可用的空闲连接（后进先出），返回 (连接或 None, 被淘汰的连接列表)
+        """
+        found = None
+        evicted = []
+        queue = self.idle.get(key)
+        now = time.monotonic()
+        while queue:
+            conn, released_at = queue.pop()
+            if now - released_at <= self.idle_timeout and healthy(conn):
+                found = conn
+                break
+            evicted.append(conn)
+        if queue is not None and not queue:
+            del self.idle[key]
+        self.counters['evicted'] += len(evicted)
+        self.counters['hits' if found is not None else 'misses'] += 1
+        return found, evicted
+
+    def push(self, key, conn):
+        """
+        放回空闲连接，返回因超出上限或过期而淘汰的连接
+        """
+        evicted = self.sweep()
+        queue = self.idle.setdefault(key, collections.deque())
+        queue.append((conn, time.monotonic()))
+        while len(queue) > self.max_idle:
+            evicted.append(queue.popleft()[0])
+            self.counters['evicted'] += 1
+        return evicted
+
+    def sweep(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_sweep < _SWEEP_INTERVAL:
+            return []
+        self.last_sweep = now
+        evicted = []
+        for key in list(self.idle):
+            queue = self.idle[key]
+            while queue and now - queue[0][1] > self.idle_timeout:
+                evicted.append(queue.popleft()[0])
+            if not queue:
+                del self.idle[key]
+        self.counters['evicted'] += len(evicted)
+        return evicted
+
+    def drain(self):
+        conns = [conn for queue in self.idle.values() for conn, _ in queue]
+        self.idle.clear()
+        return conns
+
+    def idle_count(self):
+        return sum(len(queue) for queue in self.idle.values())
+
+    def stats(self):
+        return {
+            'idle': self.idle_count(),
+            'hits': self.counters['hits'],
+            'misses': self.counters['misses'],
+            'evicted': self.counters['evicted'],
+        }
+
+class UpstreamPool:
+    """
+    线程安全的 http.client 连接池
+    """
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE, idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=None, resolver=None):
+        self.timeout = timeout
+        self.resolver = resolver
+        self.lock = threading.Lock()
+        self._idle = _IdleSet(max_idle, idle_timeout)
+
+    def acquire(self, host, port):
+        """
+        取得到源站的连接，返回 (连接, 是否复用)
+        """
+        if self._idle.max_idle > 0:
+            with self.lock:
+                conn, evicted = self._idle.pop((host, port), lambda c: _socket_is_healthy(c.sock))
+            self._close_all(evicted)
+            if conn is not None:
+                return conn, True
+        conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        if self.resolver is not None:
+            conn._create_connection = self.resolver.create_connection
+        return conn, False
+
+    def release(self, conn, reusable=True):
+        """
+        归还连接；不可复用（或连接池已禁用）时直接关闭
+        """
+        if not reusable or self._idle.max_idle <= 0 or conn.sock is None:
+            conn.close()
+            return
+        with self.lock:
+            evicted = self._idle.push((conn.host, conn.port), conn)
+        self._close_all(evicted)
+
+    def close(self):
+        with self.lock:
+            conns = self._idle.drain()
+        self._close_all(conns)
+
+    def stats(self):
+        with self.lock:
+            return self._idle.stats()
+
+    @staticmethod
+    def _close_all(conns):
+        for conn in conns:
+            conn.close()
+
+class AsyncUpstreamPool:
+    """
+    asyncio 连接池（只在事件循环线程中使用，无需加锁）
+    """
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE, idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=None, resolver=None):
+        self.timeout = timeout
+        self.resolver = resolver
+        self._idle = _IdleSet(max_idle, idle_timeout)
+
+    @staticmethod
+    def _healthy(conn):
+        reader, writer = conn
+        return not (writer.is_closing() or reader.at_eof() or reader.exception() is not None)
+
+    async def acquire(self, host, port):
+        """
+        取得到源站的连接，返回 (reader, writer, 是否复用)
+        """
+        if self._idle.max_idle > 0:
+            conn, evicted = self._idle.pop((host, port), self._healthy)
+            self._close_all(evicted)
+            if conn is not None:
+                return conn[0], conn[1], True
+        open_connection = self.resolver.open_connection if self.resolver is not None else asyncio.open_connection
+        reader, writer = await asyncio.wait_for(open_connection(host, port), self.timeout)
+        return reader, writer, False
+
+    def release(self, host, port, reader, writer, reusable=True):
+        """
+        归还连接；不可复用（或连接池已禁用）时直接关闭
+        """
+        if not reusable or self._idle.max_idle <= 0 or not self._healthy((reader, writer)):
+            writer.close()
+            return
+        self._close_all(self._idle.push((host, port), (reader, writer)))
+
+    def close(self):
+        self._close_all(self._idle.drain())
+
+    def stats(self):
+        return self._idle.stats()
+
+    @staticmethod
+    def _close_all(conns):
+        for _, writer in conns:
+            writer.close()
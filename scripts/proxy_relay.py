@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CONNECT 隧道的低拷贝转发
+threaded 引擎在隧道建立后用这里的 relay() 双向转发数据：
+
+  copy    每个方向一块预分配缓冲区，recv_into + memoryview + sendall，
+          不再为每次读取分配新的 bytes，也不会像 send() 那样静默丢掉未写完的部分
+  splice  Linux 上经由管道 os.splice()，数据不进入用户态（零拷贝）
+  auto    有 os.splice 时用 splice，否则用 copy
+
+指定 idle_timeout 时两个方向都超过这么多秒没有数据（或对端一直不读）就关闭隧道；
+超时通过 SO_RCVTIMEO/SO_SNDTIMEO 实现，对 copy 与 splice 同样有效，转发路径上没有额外的系统调用。
+
+用法（吞吐量对比，legacy 为原来的 recv(4096) + send 循环）:
+  python3 scripts/proxy_relay.py --mb 512 --buffer-size 65536
+"""
+
+import argparse
+import os
+import resource
+import socket
+import struct
+import sys
+import threading
+import time
+
+RELAY_MODES = ('auto', 'splice', 'copy')
+DEFAULT_RELAY_BUFFER = 64 * 1024
+
+# 不能加 SPLICE_F_MORE：它对 socket 的效果与 MSG_MORE 相同，小响应会被压住直到 200ms 的
+# cork 超时，交互式隧道每次往返都多出 200ms
+_SPLICE_FLAGS = getattr(os, 'SPLICE_F_MOVE', 0)
+# fcntl.F_SETPIPE_SZ（Python 3.10+ 才有常量）
+_F_SETPIPE_SZ = 1031
+
+class TunnelActivity:
+    """
+    隧道两个方向共享的最近活动时间（单调时钟）
+    """
+
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self.last = time.monotonic()
+
+    def touch(self):
+        self.last = time.monotonic()
+
+    def remaining(self):
+        return self.idle_timeout - (time.monotonic() - self.last)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+def set_io_timeout(sock, seconds):
+    """
+    设置阻塞 socket 的收发超时：到期时 recv/send/splice 以 BlockingIOError 返回，
+    socket 本身仍是阻塞模式（settimeout 会把它改为非阻塞，splice 无法使用）
+    """
+    whole = int(seconds)
+    value = struct.pack('ll', whole, int((seconds - whole) * 1e6))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, value)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, value)
+
+def splice_available():
+    return sys.platform.startswith('linux') and hasattr(os, 'splice')
+
+def resolve_mode(mode):
+    """
+    把 auto（或当前平台不支持的 splice）解析为实际使用的模式
+    """
+    if mode in ('auto', 'splice'):
+        return 'splice' if splice_available() else 'copy'
+    return mode
+
+def forward_copy(src, dst, buffer_size=DEFAULT_RELAY_BUFFER, count=None, activity=None):
+    """
+    单向转发直到 EOF、出错或隧道空闲超时，返回转发的字节数（count 每转发一块调用一次）
+
+    activity 为两个方向共享的 TunnelActivity：读超时时只要另一方向仍有数据就继续等待。
+    """
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    total = 0
+    try:
+        while True:
+            try:
+                n = src.recv_into(buffer)
+            except BlockingIOError:
+                if activity is not None and not activity.expired():
+                    continue
+                break
+            if not n:
+                break
+            dst.sendall(view[:n])
+            total += n
+            if activity is not None:
+                activity.touch()
+            if count is not None:
+                count(n)
+    except OSError:
+        pass
+    return total
+
+def forward_splice(src, dst, buffer_size=DEFAULT_RELAY_BUFFER, count=None, activity=None):
+    """
+    经由管道 splice 单向转发直到 EOF、出错或隧道空闲超时，返回转发的字节数
+    """
+    pipe_r, pipe_w = os.pipe()
+    total = 0
+    try:
+        try:
+            import fcntl
+            fcntl.fcntl(pipe_w, getattr(fcntl, 'F_SETPIPE_SZ', _F_SETPIPE_SZ), buffer_size)
+        except OSError:
+            pass
+        src_fd = src.fileno()
+        dst_fd = dst.fileno()
+        while True:
+            try:
+                n = os.splice(src_fd, pipe_w, buffer_size, flags=_SPLICE_FLAGS)
+            except BlockingIOError:
+                if activity is not None and not activity.expired():
+                    continue
+                break
+            if not n:
+                break
+            pending = n
+            while pending:
+                pending -= os.splice(pipe_r, dst_fd, pending, flags=_SPLICE_FLAGS)
+            total += n
+            if activity is not None:
+                activity.touch()
+            if count is not None:
+                count(n)
+    except OSError:
+        pass
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+    return total
+
+_FORWARDERS = {'copy': forward_copy, 'splice': forward_splice}
+
+def _shutdown_write(sock):
+    try:
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+def relay(client, upstream, mode='auto', buffer_size=DEFAULT_RELAY_BUFFER, initial=b'', counters=(None, None),
+          idle_timeout=None):
+    """
+    在两个阻塞 socket 之间双向转发，直到两个方向都结束
+
+    当前线程负责 client→upstream，只额外启动一个线程负责 upstream→client。
+    initial 为客户端在隧道建立前已发来、被缓冲的数据；counters 为两个方向的
+    字节计数回调（用于流量统计）；idle_timeout 为隧道空闲超时（秒，None 表示不限）。
+    返回 (client→upstream 字节数, upstream→client 字节数)。
+    """
+    forward = _FORWARDERS[resolve_mode(mode)]
+    totals = [0, 0]
+    activity = None
+    if idle_timeout:
+        activity = TunnelActivity(idle_timeout)
+        # 超时只是唤醒检查的节拍，真正的判断以两个方向共享的最近活动时间为准
+        for sock in (client, upstream):
+            set_io_timeout(sock, idle_timeout)
+
+    def run(index, src, dst):
+        try:
+            totals[index] += forward(src, dst, buffer_size, counters[index], activity)
+        finally:
+            _shutdown_write(dst)
+
+    if initial:
+        try:
+            upstream.sendall(initial)
+            totals[0] += len(initial)
+        except OSError:
+            pass
+
+    thread = threading.Thread(target=run, args=(1, upstream, client), daemon=True)
+    thread.start()
+    run(0, client, upstream)
+    thread.join()
+    return totals[0], totals[1]
+
+# ---------------------------------------------------------------------------
+# 吞吐量基准
+# ---------------------------------------------------------------------------
+
+def _forward_legacy(src, dst, buffer_size=None, count=None):
+    """
+    原 relay_data 中 forward_data 的循环（仅用于对比）
+    """
+    total = 0
+    try:
+        while True:
+            data = src.recv(4096)
+            if not data:
+                break
+            total += dst.send(data)
+    except OSError:
+        pass
+    return total
+
+def _tcp_pair(listener):
+    a = socket.create_connection(listener.getsockname())
+    b, _ = listener.accept()
+    return a, b
+
+def bench_mode(forward, total_bytes, buffer_size):
+    """
+    sender → [relay] → sink，返回 (秒数, CPU 秒数, 收到的字节数)
+    """
+    listener = socket.create_server(('127.0.0.1', 0))
+    sender, relay_in = _tcp_pair(listener)
+    relay_out, sink = _tcp_pair(listener)
+    listener.close()
+    received = [0]
+
+    def send_all():
+        block = memoryview(b'\x00' * (1 << 20))
+        remaining = total_bytes
+        while remaining:
+            remaining -= sender.send(block[:min(len(block), remaining)])
+        sender.shutdown(socket.SHUT_WR)
+
+    def drain():
+        buffer = bytearray(1 << 20)
+        while True:
+            n = sink.recv_into(buffer)
+            if not n:
+                break
+            received[0] += n
+
+    threads = [threading.Thread(target=send_all), threading.Thread(target=drain)]
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    forward(relay_in, relay_out, buffer_size)
+    relay_out.shutdown(socket.SHUT_WR)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+    for sock in (sender, relay_in, relay_out, sink):
+        sock.close()
+    return elapsed, cpu, received[0]
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="CONNECT 隧道转发吞吐量对比")
+    parser.add_argument('--mb', type=int, default=512, help='每种模式转发的数据量（MB）')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_RELAY_BUFFER, help='copy/splice 缓冲区大小')
+    parser.add_argument('--repeat', type=int, default=3, help='每种模式重复次数（取最快一次）')
+    args = parser.parse_args()
+
+    modes = [('legacy', _forward_legacy), ('copy', forward_copy)]
+    if splice_available():
+        modes.append(('splice', forward_splice))
+
+    total_bytes = args.mb << 20
+    print(f"⏱️  隧道转发对比: {args.mb} MB，缓冲区 {args.buffer_size} 字节")
+    baseline = None
+    for name, forward in modes:
+        runs = [bench_mode(forward, total_bytes, args.buffer_size) for _ in range(args.repeat)]
+        elapsed, cpu, received = min(runs)
+        if received != total_bytes:
+            print(f"  ❌ {name}: 只收到 {received}/{total_bytes} 字节")
+            continue
+        rate = total_bytes / elapsed / (1 << 20)
+        baseline = baseline or rate
+        print(f"  {name:<7} {rate:>8.0f} MB/s  CPU {cpu / (total_bytes / (1 << 30)):.2f} s/GB  ({rate / baseline:.2f}x)")
+
+if __name__ == "__main__":
+    main()
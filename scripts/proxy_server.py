@@ -0,0 +1,1265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按需代理服务
+支持 HTTP 转发（GET/POST 等）与 HTTPS CONNECT 隧道，提供两种引擎：
+
+  asyncio   单个事件循环处理所有连接，数千个并发隧道也不需要额外线程（默认）
+  threaded  ThreadingHTTPServer，每个请求一个线程、每个隧道两个线程；
+            隧道用预分配缓冲区或 Linux splice 转发（见 proxy_relay.py）
+
+请求体与响应体都按固定大小的块流式转发（支持 chunked 传输编码），首字节延迟和
+内存占用不随响应大小增长。客户端连接支持 keep-alive，到源站的连接按源站放入连接池
+复用（见 proxy_pool.py）。加 --cache 时 GET 响应按缓存头缓存在本地（见 proxy_cache.py）。
+直接访问代理本身（如健康检查 curl http://host:1083/）
+时返回 200，而不是转发给自己；访问 /stats 返回 JSON 流量统计（见 proxy_stats.py）。
+加 --workers N 时由 supervisor 预先 fork N 个 worker 进程，以 SO_REUSEPORT 共享监听端口，
+/stats 返回所有 worker 的汇总（见 proxy_workers.py）。
+--listen-fd 使用继承来的监听 socket（由 proxy_activator.py 按需拉起），--idle-exit 在
+无流量若干秒后自行退出。连接数、隧道数与单个客户端 IP 的连接数受准入控制限制，
+超限时快速返回 503（见 proxy_limits.py）；隧道空闲超过 --tunnel-idle-timeout 秒后关闭。
+上游主机名的解析结果缓存在进程内，连接时交错尝试 IPv6/IPv4 地址（见 proxy_dns.py）。
+
+用法:
+  python3 scripts/proxy_server.py 1083
+  python3 scripts/proxy_server.py 1083 --engine threaded
+  python3 scripts/proxy_server.py 1083 --engine threaded --relay copy --buffer-size 131072
+  python3 scripts/proxy_server.py 1083 --cache --cache-disk-size 4096
+  python3 scripts/proxy_server.py 1083 --workers 0        # 每个 CPU 核心一个 worker
+"""
+
+import argparse
+import asyncio
+import http.client
+import http.server
+import ipaddress
+import json
+import os
+import resource
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+
+from proxy_cache import (DEFAULT_CACHE_DIR, DEFAULT_DISK_SIZE, DEFAULT_MAX_OBJECT_SIZE, DEFAULT_MEMORY_SIZE,
+                         ResponseCache)
+from proxy_dns import DEFAULT_NEGATIVE_TTL, DEFAULT_TTL, Resolver
+from proxy_limits import (DEFAULT_MAX_CONNECTIONS, DEFAULT_MAX_PER_IP, DEFAULT_MAX_TUNNELS,
+                          DEFAULT_QUEUE_TIMEOUT, LIMIT_TUNNELS, AdmissionControl, overload_response)
+from proxy_pool import DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_IDLE, AsyncUpstreamPool, UpstreamPool
+from proxy_relay import RELAY_MODES, TunnelActivity, relay, resolve_mode
+from proxy_stats import (STATS_PATH, CountingFile, CountingStreamReader, CountingStreamWriter,
+                         ProxyStats)
+from proxy_workers import run_supervisor
+
+ENGINES = ('asyncio', 'threaded')
+
+DEFAULT_PORT = 1083
+DEFAULT_TIMEOUT = 30
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+# 客户端 keep-alive 连接的空闲超时（秒）
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+
+# CONNECT 隧道两个方向都没有数据多久后关闭（秒）
+DEFAULT_TUNNEL_IDLE_TIMEOUT = 600
+
+# 被拒绝的连接最多等待客户端发完请求头的时间（秒），读走请求后再回 503，避免关闭时发出 RST
+REJECT_READ_TIMEOUT = 1.0
+# threaded 引擎同时进行中的 503 拒绝最多占用的线程数，超出时直接关闭连接
+MAX_PENDING_REJECTS = 64
+
+# --idle-exit 检查空闲的间隔（秒）
+IDLE_CHECK_INTERVAL = 1.0
+
+# 请求头总长度上限
+MAX_HEAD_SIZE = 64 * 1024
+
+# 逐跳头部，不转发给上游
+HOP_BY_HOP = {
+    'connection', 'keep-alive', 'proxy-connection', 'proxy-authenticate',
+    'proxy-authorization', 'te', 'trailer', 'transfer-encoding', 'upgrade',
+}
+
+LOCAL_RESPONSE_BODY = b"on-demand proxy ok\n"
+
+def split_host_port(value, default_port):
+    """
+    拆分 host:port（支持 [IPv6]:port），没有端口时使用 default_port
+    """
+    value = value.strip()
+    if value.startswith('['):
+        host, _, rest = value[1:].partition(']')
+        port = rest[1:] if rest.startswith(':') else ''
+    else:
+        host, sep, port = value.rpartition(':')
+        if not sep or ':' in host:
+            host, port = value, ''
+    return host, int(port) if port.isdigit() else default_port
+
+def resolve_target(path, host_header):
+    """
+    解析请求目标，返回 (主机, 端口, origin-form 路径)；无法确定目标时返回 None
+    """
+    if path.startswith('http://'):
+        parts = urllib.parse.urlsplit(path)
+        if not parts.hostname:
+            return None
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        return parts.hostname, parts.port or 80, target
+    if host_header:
+        host, port = split_host_port(host_header, 80)
+        return host, port, path
+    return None
+
+def is_local_request(path, host_header, server_port):
+    """
+    origin-form 请求且 Host 指向代理自身端口（或没有 Host）时，视为访问代理本身
+    """
+    if path.startswith('http://'):
+        return False
+    if not host_header:
+        return True
+    return split_host_port(host_header, 80)[1] == server_port
+
+def is_loopback(host):
+    """
+    判断客户端地址是否为本机回环地址（包括 IPv4 映射的 IPv6 地址）
+    """
+    try:
+        address = ipaddress.ip_address(host)
+    except (TypeError, ValueError):
+        return False
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.is_loopback
+
+def local_response(path, snapshot, client_host=None):
+    """
+    对代理自身请求的响应体与类型：/stats 返回 JSON 统计，其他路径返回固定文本
+
+    snapshot(include_connections) 返回统计字典。每个连接的明细（客户端 IP、CONNECT
+    目标）只返回给来自回环地址的请求；代理监听在 0.0.0.0 上时，其他客户端即使带上
+    connections=1 也只能看到汇总计数。
+    """
+    parts = urllib.parse.urlsplit(path)
+    if parts.path == STATS_PATH:
+        query = urllib.parse.parse_qs(parts.query)
+        include_connections = (query.get('connections', ['0'])[0] not in ('', '0')
+                               and is_loopback(client_host))
+        body = json.dumps(snapshot(include_connections), ensure_ascii=False, indent=1) + '\n'
+        return body.encode('utf-8'), 'application/json'
+    return LOCAL_RESPONSE_BODY, 'text/plain; charset=utf-8'
+
+def client_wants_keep_alive(version, connection):
+    """
+    HTTP/1.1 默认保持连接，HTTP/1.0 需要显式 Connection: keep-alive
+    """
+    tokens = {token.strip().lower() for token in (connection or '').split(',')}
+    if version == 'HTTP/1.1':
+        return 'close' not in tokens
+    return 'keep-alive' in tokens
+
+def is_chunked(transfer_encoding):
+    return 'chunked' in (transfer_encoding or '').lower()
+
+def parse_content_length(value):
+    """
+    解析请求的 Content-Length（没有时为 0）；格式错误或为负数时返回 None
+    """
+    if value is None:
+        return 0
+    value = value.strip()
+    if not (value.isascii() and value.isdigit()):
+        return None
+    return int(value)
+
+def response_has_body(method, status):
+    """
+    HEAD 请求以及 1xx/204/304 响应没有响应体
+    """
+    return method != 'HEAD' and not (100 <= status < 200 or status in (204, 304))
+
+def chunk_frame(data):
+    """
+    把一段数据编码为一个 chunked 块
+    """
+    return b'%x\r\n' % len(data) + data + b'\r\n'
+
+LAST_CHUNK = b'0\r\n\r\n'
+
+def iter_chunked_body(rfile, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    从文件对象读取 chunked 编码的消息体，逐段产出解码后的数据（丢弃 trailer）
+    """
+    while True:
+        line = rfile.readline(MAX_HEAD_SIZE + 1)
+        if not line.endswith(b'\n'):
+            raise ValueError("chunked 块头不完整")
+        size = int(line.split(b';', 1)[0].strip(), 16)
+        if size == 0:
+            while rfile.readline(MAX_HEAD_SIZE + 1) not in (b'\r\n', b'\n', b''):
+                pass
+            return
+        while size:
+            data = rfile.read(min(buffer_size, size))
+            if not data:
+                raise ValueError("chunked 块数据不完整")
+            size -= len(data)
+            yield data
+        rfile.readline(MAX_HEAD_SIZE + 1)
+
+def iter_fixed_body(rfile, length, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    从文件对象读取 Content-Length 指定长度的消息体，逐段产出
+    """
+    while length > 0:
+        data = rfile.read(min(buffer_size, length))
+        if not data:
+            raise ValueError("请求体不完整")
+        length -= len(data)
+        yield data
+
+def raise_nofile_limit():
+    """
+    把打开文件数软限制提高到硬限制，避免大量并发连接耗尽文件描述符
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+# ---------------------------------------------------------------------------
+# threaded 引擎
+# ---------------------------------------------------------------------------
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    """
+    线程模型的代理请求处理器
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # 响应头与响应体分两次写出，不关闭 Nagle 时会与客户端的延迟确认叠加出 40ms 停顿
+    disable_nagle_algorithm = True
+    upstream_timeout = DEFAULT_TIMEOUT
+    buffer_size = DEFAULT_BUFFER_SIZE
+    relay_mode = 'auto'
+    tunnel_idle_timeout = DEFAULT_TUNNEL_IDLE_TIMEOUT
+    # 客户端 keep-alive 连接的空闲超时（作用于客户端 socket）
+    timeout = DEFAULT_KEEPALIVE_TIMEOUT
+
+    def setup(self):
+        super().setup()
+        self.conn_stats = self.server.stats.open_connection(self.client_address)
+        self.rfile = CountingFile(self.rfile, self.conn_stats.add_in)
+        self.wfile = CountingFile(self.wfile, self.conn_stats.add_out)
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            self.server.stats.close_connection(self.conn_stats)
+
+    def do_GET(self):
+        self.proxy_request()
+
+    def do_POST(self):
+        self.proxy_request()
+
+    def do_CONNECT(self):
+        # 处理HTTPS连接
+        admission = self.server.admission
+        if not admission.acquire_tunnel():
+            self.close_connection = True
+            self.wfile.write(overload_response(LIMIT_TUNNELS))
+            return
+        try:
+            self.open_tunnel()
+        finally:
+            admission.release_tunnel()
+
+    def open_tunnel(self):
+        try:
+            host, port = split_host_port(self.path, 443)
+
+            # 建立到目标服务器的连接
+            target_socket = self.server.resolver.create_connection((host, port), timeout=self.upstream_timeout)
+            target_socket.settimeout(None)
+            target_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except Exception as e:
+            print(f"CONNECT error: {e}")
+            self.send_error(502, f"Proxy error: {e}")
+            return
+
+        # 发送200响应表示连接建立
+        self.send_response(200, 'Connection established')
+        self.end_headers()
+
+        # 开始双向数据转发（隧道使用自己的空闲超时，不受 keep-alive 空闲超时限制）
+        self.close_connection = True
+        self.connection.settimeout(None)
+        self.conn_stats.tunnel_opened(self.path)
+        try:
+            self.relay_data(target_socket)
+        finally:
+            self.conn_stats.tunnel_closed()
+
+    def send_local_response(self):
+        self.server.stats.local_request()
+        body, content_type = local_response(self.path, self.server.snapshot, self.client_address[0])
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_connection_header()
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def proxy_request(self):
+        if is_local_request(self.path, self.headers.get('Host'), self.server.server_address[1]):
+            self.send_local_response()
+            return
+        self.conn_stats.request_started()
+        try:
+            self.forward_request()
+        finally:
+            self.conn_stats.request_finished()
+
+    def forward_request(self):
+        resolved = resolve_target(self.path, self.headers.get('Host'))
+        if resolved is None:
+            self.send_error(400, "missing Host")
+            return
+        host, port, path = resolved
+        chunked = is_chunked(self.headers.get('Transfer-Encoding'))
+        content_length = 0 if chunked else parse_content_length(self.headers.get('Content-Length'))
+        if content_length is None:
+            self.send_error(400, "invalid Content-Length")
+            return
+        pool = self.server.upstream_pool
+        has_body = chunked or content_length > 0
+
+        cache = self.server.response_cache
+        request_headers = {name.lower(): value for name, value in self.headers.items()}
+        entry = None
+        drop, extra = set(), []
+        # 带请求体的请求（POST 等）不查也不存缓存，只让该 URL 的缓存失效
+        cache_method = self.command if not has_body else 'POST'
+        if cache is not None:
+            url = cache.cache_key(host, port, path)
+            entry, fresh = cache.lookup(cache_method, url, request_headers)
+            if fresh and self.send_cached(cache, entry, request_headers, 'HIT'):
+                return
+            drop, extra = cache.upstream_headers(self.command, request_headers, entry)
+
+        while True:
+            conn, reused = pool.acquire(host, port)
+            try:
+                self.send_upstream_request(conn, host, port, path, content_length, drop, extra)
+                response = conn.getresponse()
+                break
+            except Exception as e:
+                conn.close()
+                # 复用的空闲连接可能刚被源站关闭：没有请求体时换一条新连接重试
+                if reused and not has_body:
+                    continue
+                print(f"Proxy error: {e}")
+                self.close_connection = True
+                self.send_error(502, f"Proxy error: {e}")
+                return
+
+        if entry is not None and response.status == 304:
+            # 缓存验证通过：只更新头部，响应体仍由缓存提供
+            response.read()
+            pool.release(conn, not response.will_close)
+            entry = cache.freshen(entry, response.getheaders())
+            if not self.send_cached(cache, entry, request_headers, 'REVALIDATED'):
+                # 响应体文件已被淘汰，条目随之失效，重新按未命中处理
+                self.forward_request()
+            return
+
+        sink = None
+        if cache is not None:
+            sink = cache.open_writer(cache_method, url, request_headers, response.status, response.reason,
+                                     response.getheaders())
+        try:
+            reusable = self.relay_response(response, sink, 'MISS' if cache is not None else None)
+        except OSError:
+            # 客户端提前断开
+            if sink is not None:
+                sink.abort()
+            self.close_connection = True
+            conn.close()
+            return
+        pool.release(conn, reusable)
+
+    def send_cached(self, cache, entry, request_headers, cache_status):
+        """
+        用缓存条目响应客户端；响应体已不可用时返回 False
+        """
+        cached = cache.hit_response(entry, self.command, request_headers, cache_status, self.buffer_size)
+        if cached is None:
+            return False
+        status, reason, headers, body = cached
+        self.log_request(status)
+        self.send_response_only(status, reason)
+        for header, value in headers:
+            self.send_header(header, value)
+        self.send_connection_header()
+        self.end_headers()
+        try:
+            for data in body or ():
+                self.wfile.write(data)
+        except OSError:
+            self.close_connection = True
+        return True
+
+    def send_connection_header(self):
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        elif self.request_version != 'HTTP/1.1':
+            self.send_header('Connection', 'keep-alive')
+
+    def send_upstream_request(self, conn, host, port, path, content_length=0, drop=(), extra=()):
+        """
+        发送请求头，并把请求体分块转发给上游（不在内存中拼出完整请求体）
+
+        content_length 为已校验的请求体长度（chunked 时不使用），drop 为额外不转发的请求头（小写），extra 为追加的请求头（缓存回源验证用）。
+        """
+        conn.putrequest(self.command, path, skip_host=True, skip_accept_encoding=True)
+        if 'Host' not in self.headers:
+            conn.putheader('Host', host if port == 80 else f"{host}:{port}")
+        for header, value in self.headers.items():
+            if header.lower() not in HOP_BY_HOP and header.lower() not in drop:
+                conn.putheader(header, value)
+        for header, value in extra:
+            conn.putheader(header, value)
+
+        chunked = is_chunked(self.headers.get('Transfer-Encoding'))
+        if chunked:
+            conn.putheader('Transfer-Encoding', 'chunked')
+        conn.endheaders()
+
+        if chunked:
+            for data in iter_chunked_body(self.rfile, self.buffer_size):
+                conn.send(chunk_frame(data))
+            conn.send(LAST_CHUNK)
+        else:
+            for data in iter_fixed_body(self.rfile, content_length, self.buffer_size):
+                conn.send(data)
+
+    def relay_response(self, response, sink=None, cache_status=None):
+        """
+        转发响应头，并按块转发响应体，返回上游连接是否可以放回连接池
+
+        上游给出 Content-Length 时原样转发；否则对 HTTP/1.1 客户端使用 chunked 编码，
+        对 HTTP/1.0 客户端以关闭连接表示结束。sink 为写入缓存的 CacheWriter。
+        """
+        self.log_request(response.status)
+        self.send_response_only(response.status, response.reason)
+        for header, value in response.getheaders():
+            if header.lower() not in HOP_BY_HOP:
+                self.send_header(header, value)
+        if cache_status:
+            self.send_header('X-Cache', cache_status)
+
+        if not response_has_body(self.command, response.status):
+            response.read()
+            self.send_connection_header()
+            self.end_headers()
+            return not response.will_close
+
+        chunked = response.length is None and self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        elif response.length is None:
+            self.close_connection = True
+        self.send_connection_header()
+        self.end_headers()
+
+        while True:
+            data = response.read1(self.buffer_size)
+            if not data:
+                break
+            self.wfile.write(chunk_frame(data) if chunked else data)
+            if sink is not None:
+                sink.write(data)
+        if chunked:
+            self.wfile.write(LAST_CHUNK)
+        # read1 读完定长响应后不会自动关闭响应对象，read() 收尾后连接才能复用
+        response.read()
+        if sink is not None:
+            sink.commit()
+        return response.isclosed() and not response.will_close
+
+    do_HEAD = proxy_request
+    do_PUT = proxy_request
+    do_DELETE = proxy_request
+    do_PATCH = proxy_request
+    do_OPTIONS = proxy_request
+
+    def relay_data(self, target_socket):
+        # 客户端可能在收到 200 之前就发出了 TLS 握手，这部分已读入 rfile 缓冲
+        try:
+            relay(self.connection, target_socket, self.relay_mode, self.buffer_size,
+                  initial=self.take_buffered(),
+                  counters=(self.conn_stats.add_in, self.conn_stats.add_out),
+                  idle_timeout=self.tunnel_idle_timeout)
+        finally:
+            target_socket.close()
+
+    def take_buffered(self):
+        """
+        取出 rfile 中已缓冲、尚未处理的客户端数据（不阻塞）
+        """
+        self.connection.setblocking(False)
+        try:
+            return self.rfile.read1(self.buffer_size) or b''
+        except OSError:
+            return b''
+        finally:
+            self.connection.setblocking(True)
+
+class ThreadingProxyServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+    # 多 worker 模式下各进程各自绑定同一端口
+    reuse_port = False
+    reject_slots = threading.BoundedSemaphore(MAX_PENDING_REJECTS)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        # 在 accept 循环中等待名额：等待期间新连接留在内核监听队列中（背压）
+        limit = self.admission.acquire_connection(client_address[0])
+        if limit is not None:
+            self.reject_connection(request, limit)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.admission.release_connection(client_address[0])
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.admission.release_connection(client_address[0])
+
+    def reject_connection(self, request, limit):
+        """
+        在短命线程中回 503，不阻塞 accept 循环；拒绝过多时直接关闭
+        """
+        if not self.reject_slots.acquire(blocking=False):
+            self.shutdown_request(request)
+            return
+        threading.Thread(target=self._send_overload, args=(request, limit), daemon=True).start()
+
+    def _send_overload(self, request, limit):
+        try:
+            request.settimeout(REJECT_READ_TIMEOUT)
+            request.recv(MAX_HEAD_SIZE)
+            request.sendall(overload_response(limit))
+            request.shutdown(socket.SHUT_WR)
+            while request.recv(MAX_HEAD_SIZE):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+            self.reject_slots.release()
+
+    def snapshot(self, include_connections=False):
+        data = self.stats.snapshot(include_connections)
+        data['engine'] = 'threaded'
+        data['pool'] = self.upstream_pool.stats()
+        data['limits'] = self.admission.stats()
+        data['dns'] = self.resolver.stats()
+        if self.response_cache is not None:
+            data['cache'] = self.response_cache.stats()
+        return data
+
+def inherited_socket(fd):
+    """
+    包装从父进程继承的监听 socket（--listen-fd）
+    """
+    sock = socket.socket(fileno=fd)
+    sock.setblocking(True)
+    return sock
+
+def idle_exceeded(stats, idle_exit):
+    """
+    无流量时间是否已达到 idle_exit 秒（idle_exit 为空时永不退出）
+    """
+    return bool(idle_exit) and stats.snapshot()['idle_seconds'] >= idle_exit
+
+def run_threaded(host, port, timeout=DEFAULT_TIMEOUT, keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 pool_max_idle=DEFAULT_MAX_IDLE, pool_idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 buffer_size=DEFAULT_BUFFER_SIZE, relay_mode='auto', cache=None, reuse_port=False, stats=None,
+                 listen_socket=None, idle_exit=None, admission=None,
+                 tunnel_idle_timeout=DEFAULT_TUNNEL_IDLE_TIMEOUT, resolver=None):
+    ProxyHandler.upstream_timeout = timeout
+    ProxyHandler.timeout = keepalive_timeout
+    ProxyHandler.buffer_size = buffer_size
+    ProxyHandler.relay_mode = relay_mode
+    ProxyHandler.tunnel_idle_timeout = tunnel_idle_timeout
+    ThreadingProxyServer.reuse_port = reuse_port
+    with ThreadingProxyServer((host, port), ProxyHandler, bind_and_activate=listen_socket is None) as httpd:
+        if listen_socket is not None:
+            httpd.socket.close()
+            httpd.socket = listen_socket
+            httpd.server_address = listen_socket.getsockname()
+            httpd.server_name, httpd.server_port = host, port
+        httpd.resolver = resolver or Resolver()
+        httpd.upstream_pool = UpstreamPool(pool_max_idle, pool_idle_timeout, timeout, httpd.resolver)
+        httpd.admission = admission or AdmissionControl()
+        httpd.response_cache = cache
+        httpd.stats = stats or ProxyStats()
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+        if idle_exit:
+            def exit_when_idle():
+                while not idle_exceeded(httpd.stats, idle_exit):
+                    time.sleep(IDLE_CHECK_INTERVAL)
+                print(f"Idle for {idle_exit:g}s, shutting down")
+                httpd.shutdown()
+            threading.Thread(target=exit_when_idle, daemon=True).start()
+        httpd.serve_forever()
+
+# ---------------------------------------------------------------------------
+# asyncio 引擎
+# ---------------------------------------------------------------------------
+
+def parse_request_head(head):
+    """
+    解析请求头，返回 (方法, 目标, 版本, [(名称, 值)])
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ', 2)
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise ValueError(f"无效的请求头: {line!r}")
+        headers.append((name.strip(), value.strip()))
+    return method.upper(), target, version, headers
+
+def parse_response_head(head):
+    """
+    解析响应头，返回 (版本, 状态码, 原因短语, [(名称, 值)])
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ', 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise ValueError(f"无效的状态行: {lines[0]!r}")
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if sep:
+            headers.append((name.strip(), value.strip()))
+    return parts[0], int(parts[1]), parts[2] if len(parts) > 2 else '', headers
+
+def header_value(headers, name, default=None):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return default
+
+def build_response(status, reason, body=b'', content_type='text/plain; charset=utf-8', head_only=False,
+                   keep_alive=False):
+    head = (
+        f"HTTP/1.1 {status} {reason}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode('latin-1')
+    return head if head_only else head + body
+
+class AsyncProxyServer:
+    """
+    asyncio 代理引擎
+    """
+
+    def __init__(self, host='0.0.0.0', port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT,
+                 buffer_size=DEFAULT_BUFFER_SIZE, keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 pool_max_idle=DEFAULT_MAX_IDLE, pool_idle_timeout=DEFAULT_IDLE_TIMEOUT, cache=None,
+                 reuse_port=False, stats=None, listen_socket=None, idle_exit=None, admission=None,
+                 tunnel_idle_timeout=DEFAULT_TUNNEL_IDLE_TIMEOUT, resolver=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+        self.keepalive_timeout = keepalive_timeout
+        self.resolver = resolver or Resolver()
+        self.pool = AsyncUpstreamPool(pool_max_idle, pool_idle_timeout, timeout, self.resolver)
+        # 响应缓存（ResponseCache，None 表示不缓存）；磁盘读写量小，直接在事件循环中进行
+        self.cache = cache
+        self.stats = stats or ProxyStats()
+        self.reuse_port = reuse_port
+        # 继承来的监听 socket（--listen-fd），设置时不再自行绑定端口
+        self.listen_socket = listen_socket
+        self.idle_exit = idle_exit
+        self.admission = admission or AdmissionControl()
+        self.tunnel_idle_timeout = tunnel_idle_timeout
+        self.server = None
+
+    async def start(self):
+        if self.listen_socket is not None:
+            self.server = await asyncio.start_server(
+                self.handle_client, sock=self.listen_socket, backlog=1024, limit=MAX_HEAD_SIZE
+            )
+            return self.server
+        self.server = await asyncio.start_server(
+            self.handle_client, self.host, self.port,
+            backlog=1024, limit=MAX_HEAD_SIZE, reuse_address=True, reuse_port=self.reuse_port or None
+        )
+        return self.server
+
+    async def exit_when_idle(self):
+        while not idle_exceeded(self.stats, self.idle_exit):
+            await asyncio.sleep(IDLE_CHECK_INTERVAL)
+        print(f"Idle for {self.idle_exit:g}s, shutting down")
+        self.server.close()
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, self.server.close)
+            except (NotImplementedError, RuntimeError):
+                pass
+        if self.idle_exit:
+            loop.create_task(self.exit_when_idle())
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self.pool.close()
+
+    def snapshot(self, include_connections=False):
+        data = self.stats.snapshot(include_connections)
+        data['engine'] = 'asyncio'
+        data['pool'] = self.pool.stats()
+        data['limits'] = self.admission.stats()
+        data['dns'] = self.resolver.stats()
+        if self.cache is not None:
+            data['cache'] = self.cache.stats()
+        return data
+
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        ip = peer[0] if peer else None
+        limit = await self.admission.acquire_connection_async(ip)
+        if limit is not None:
+            await self._reject(reader, writer, limit)
+            return
+        try:
+            await self.serve_client(reader, writer, peer)
+        finally:
+            self.admission.release_connection(ip)
+
+    async def _reject(self, reader, writer, limit):
+        """
+        读走请求头后回 503 并关闭连接
+        """
+        try:
+            await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REJECT_READ_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        writer.write(overload_response(limit))
+        await self._close(writer)
+
+    async def serve_client(self, reader, writer, peer):
+        conn = self.stats.open_connection(peer)
+        reader = CountingStreamReader(reader, conn.add_in)
+        writer = CountingStreamWriter(writer, conn.add_out)
+        try:
+            timeout = self.timeout
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+                    method, target, version, headers = parse_request_head(head)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(build_response(400, 'Bad Request', b"bad request\n"))
+                    return
+
+                if method == 'CONNECT':
+                    await self.handle_connect(target, reader, writer, conn)
+                    return
+                if not await self.handle_http(method, target, version, headers, reader, writer, conn):
+                    return
+                await writer.drain()
+                # 后续请求使用 keep-alive 空闲超时
+                timeout = self.keepalive_timeout
+        except (ConnectionError, OSError):
+            pass
+        except Exception as e:
+            print(f"Proxy error: {e}")
+        finally:
+            self.stats.close_connection(conn)
+            await self._close(writer)
+
+    async def handle_connect(self, target, reader, writer, conn):
+        if not self.admission.acquire_tunnel():
+            writer.write(overload_response(LIMIT_TUNNELS))
+            return
+        try:
+            await self.open_tunnel(target, reader, writer, conn)
+        finally:
+            self.admission.release_tunnel()
+
+    async def open_tunnel(self, target, reader, writer, conn):
+        host, port = split_host_port(target, 443)
+        try:
+            upstream_reader, upstream_writer = await asyncio.wait_for(
+                self.resolver.open_connection(host, port), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"CONNECT error: {e}")
+            writer.write(build_response(502, 'Bad Gateway', f"Proxy error: {e}\n".encode()))
+            return
+
+        writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        conn.tunnel_opened(target)
+        activity = TunnelActivity(self.tunnel_idle_timeout) if self.tunnel_idle_timeout else None
+        watchdog = None
+        if activity is not None:
+            watchdog = asyncio.ensure_future(self._close_when_idle(activity, (writer, upstream_writer)))
+        try:
+            await asyncio.gather(
+                self._pipe(reader, upstream_writer, activity),
+                self._pipe(upstream_reader, writer, activity),
+            )
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            conn.tunnel_closed()
+            await self._close(upstream_writer)
+
+    @staticmethod
+    async def _close_when_idle(activity, writers):
+        """
+        隧道两个方向都空闲超时后中断两端连接（对端不读时 drain 也会因此结束）
+        """
+        while True:
+            remaining = activity.remaining()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        for writer in writers:
+            writer.transport.abort()
+
+    async def handle_http(self, method, target, version, headers, reader, writer, conn):
+        """
+        处理一个普通 HTTP 请求，返回客户端连接是否可以继续用于下一个请求
+        """
+        keep_alive = client_wants_keep_alive(version, header_value(headers, 'Connection'))
+        host_header = header_value(headers, 'Host')
+        if is_local_request(target, host_header, self.port):
+            self.stats.local_request()
+            peer = writer.get_extra_info('peername')
+            body, content_type = local_response(target, self.snapshot, peer[0] if peer else None)
+            writer.write(build_response(200, 'OK', body, content_type, head_only=method == 'HEAD',
+                                        keep_alive=keep_alive))
+            return keep_alive
+
+        conn.request_started()
+        try:
+            return await self.forward_http(method, target, version, headers, reader, writer, keep_alive)
+        finally:
+            conn.request_finished()
+
+    async def forward_http(self, method, target, version, headers, reader, writer, keep_alive):
+        """
+        把请求转发给源站（或由缓存响应），返回客户端连接是否可以继续使用
+        """
+        host_header = header_value(headers, 'Host')
+        resolved = resolve_target(target, host_header)
+        if resolved is None:
+            writer.write(build_response(400, 'Bad Request', b"missing Host\n"))
+            return False
+        host, port, path = resolved
+
+        chunked = is_chunked(header_value(headers, 'Transfer-Encoding'))
+        length = 0 if chunked else parse_content_length(header_value(headers, 'Content-Length'))
+        if length is None:
+            writer.write(build_response(400, 'Bad Request', b"invalid Content-Length\n"))
+            return False
+
+        cache = self.cache
+        request_headers = {name.lower(): value for name, value in headers}
+        entry = None
+        drop, extra = set(), []
+        # 带请求体的请求（POST 等）不查也不存缓存，只让该 URL 的缓存失效
+        cache_method = method if not chunked and length == 0 else 'POST'
+        if cache is not None:
+            url = cache.cache_key(host, port, path)
+            entry, fresh = cache.lookup(cache_method, url, request_headers)
+            if fresh and await self._send_cached(entry, method, version, request_headers, 'HIT', keep_alive, writer):
+                return keep_alive
+            drop, extra = cache.upstream_headers(method, request_headers, entry)
+
+        lines = [f"{method} {path} HTTP/1.1"]
+        if host_header is None:
+            lines.append(f"Host: {host}" if port == 80 else f"Host: {host}:{port}")
+        lines.extend(f"{name}: {value}" for name, value in headers
+                     if name.lower() not in HOP_BY_HOP and name.lower() not in drop)
+        lines.extend(f"{name}: {value}" for name, value in extra)
+        if chunked:
+            lines.append("Transfer-Encoding: chunked")
+        request_head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        while True:
+            try:
+                upstream_reader, upstream_writer, reused = await self.pool.acquire(host, port)
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"Proxy error: {e}")
+                writer.write(build_response(502, 'Bad Gateway', f"Proxy error: {e}\n".encode()))
+                return False
+
+            try:
+                upstream_writer.write(request_head)
+                # 请求体逐块转发给上游
+                if chunked:
+                    await self._copy_chunked(reader, upstream_writer)
+                else:
+                    await self._copy_exact(reader, upstream_writer, length)
+                response = await self._read_response_head(upstream_reader, writer)
+                break
+            except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+                upstream_writer.close()
+                # 复用的空闲连接可能刚被源站关闭：没有请求体时换一条新连接重试
+                if reused and not chunked and length == 0:
+                    continue
+                error = e
+            except (asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError) as e:
+                upstream_writer.close()
+                error = e
+            print(f"Proxy error: {error}")
+            writer.write(build_response(502, 'Bad Gateway', b"bad upstream response\n"))
+            return False
+
+        if entry is not None and response[1] == 304:
+            # 缓存验证通过：只更新头部，响应体仍由缓存提供
+            upstream_keep_alive = client_wants_keep_alive(response[0], header_value(response[3], 'Connection'))
+            self.pool.release(host, port, upstream_reader, upstream_writer, upstream_keep_alive)
+            entry = cache.freshen(entry, response[3])
+            if await self._send_cached(entry, method, version, request_headers, 'REVALIDATED', keep_alive, writer):
+                return keep_alive
+            # 响应体文件已被淘汰，条目随之失效，重新按未命中处理
+            return await self.forward_http(method, target, version, headers, reader, writer, keep_alive)
+
+        sink = None
+        if cache is not None:
+            sink = cache.open_writer(cache_method, url, request_headers, response[1], response[2], response[3])
+        reusable = False
+        try:
+            reusable, keep_alive = await self._relay_response(
+                method, version, keep_alive, response, upstream_reader, writer,
+                sink, 'MISS' if cache is not None else None
+            )
+        except BaseException:
+            if sink is not None:
+                sink.abort()
+            raise
+        finally:
+            self.pool.release(host, port, upstream_reader, upstream_writer, reusable)
+        return keep_alive
+
+    async def _send_cached(self, entry, method, version, request_headers, cache_status, keep_alive, writer):
+        """
+        用缓存条目响应客户端；响应体已不可用时返回 False
+        """
+        cached = self.cache.hit_response(entry, method, request_headers, cache_status, self.buffer_size)
+        if cached is None:
+            return False
+        status, reason, headers, body = cached
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if not keep_alive:
+            lines.append("Connection: close")
+        elif version != 'HTTP/1.1':
+            lines.append("Connection: keep-alive")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        for data in body or ():
+            writer.write(data)
+            await writer.drain()
+        return True
+
+    async def _read_response_head(self, upstream_reader, writer):
+        """
+        读取最终响应头；1xx 中间响应（如 100 Continue）原样转发
+        """
+        while True:
+            head = await asyncio.wait_for(upstream_reader.readuntil(b'\r\n\r\n'), self.timeout)
+            response = parse_response_head(head)
+            status = response[1]
+            if not 100 <= status < 200 or status == 101:
+                return response
+            writer.write(head)
+
+    async def _relay_response(self, method, version, keep_alive, response, upstream_reader, writer,
+                              sink=None, cache_status=None):
+        """
+        转发响应头，并按块转发响应体，返回 (上游连接可否复用, 客户端连接可否保持)
+
+        上游给出 Content-Length 时原样转发；上游使用 chunked 时保持 chunked
+        （HTTP/1.0 客户端改为解码后直接写出）；两者都没有时读到上游关闭为止，
+        对 HTTP/1.1 客户端重新编码为 chunked。sink 为写入缓存的 CacheWriter。
+        """
+        upstream_version, status, reason, headers = response
+        upstream_keep_alive = client_wants_keep_alive(upstream_version, header_value(headers, 'Connection'))
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines.extend(f"{name}: {value}" for name, value in headers if name.lower() not in HOP_BY_HOP)
+        if cache_status:
+            lines.append(f"X-Cache: {cache_status}")
+
+        upstream_chunked = is_chunked(header_value(headers, 'Transfer-Encoding'))
+        length = None if upstream_chunked else header_value(headers, 'Content-Length')
+        has_body = response_has_body(method, status)
+        client_chunked = has_body and version == 'HTTP/1.1' and length is None
+        if has_body and length is None and not upstream_chunked:
+            # 响应以上游关闭连接结束，上游连接不能复用
+            upstream_keep_alive = False
+            if not client_chunked:
+                keep_alive = False
+
+        if client_chunked:
+            lines.append("Transfer-Encoding: chunked")
+        if not keep_alive:
+            lines.append("Connection: close")
+        elif version != 'HTTP/1.1':
+            lines.append("Connection: keep-alive")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        if not has_body:
+            return upstream_keep_alive, keep_alive
+
+        if upstream_chunked:
+            await self._copy_chunked(upstream_reader, writer, decode=not client_chunked, sink=sink)
+        elif length is not None:
+            await self._copy_exact(upstream_reader, writer, int(length), sink)
+        else:
+            while True:
+                data = await upstream_reader.read(self.buffer_size)
+                if not data:
+                    break
+                writer.write(chunk_frame(data) if client_chunked else data)
+                if sink is not None:
+                    sink.write(data)
+                await writer.drain()
+            if client_chunked:
+                writer.write(LAST_CHUNK)
+        await writer.drain()
+        if sink is not None:
+            sink.commit()
+        return upstream_keep_alive, keep_alive
+
+    async def _copy_exact(self, reader, writer, length, sink=None):
+        """
+        按块转发固定长度的消息体（sink 同时收到每一块数据）
+        """
+        while length > 0:
+            data = await reader.read(min(self.buffer_size, length))
+            if not data:
+                raise ConnectionError("消息体不完整")
+            length -= len(data)
+            writer.write(data)
+            if sink is not None:
+                sink.write(data)
+            await writer.drain()
+
+    async def _copy_chunked(self, reader, writer, decode=False, sink=None):
+        """
+        转发 chunked 消息体：默认保持原有分块格式，decode=True 时只写出数据；
+        sink 收到解码后的数据
+        """
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            size = int(line.split(b';', 1)[0].strip(), 16)
+            if not decode:
+                writer.write(line)
+            if size == 0:
+                # trailer 直到空行
+                while True:
+                    line = await reader.readuntil(b'\r\n')
+                    if not decode:
+                        writer.write(line)
+                    if line == b'\r\n':
+                        break
+                await writer.drain()
+                return
+            await self._copy_exact(reader, writer, size, sink)
+            crlf = await reader.readexactly(2)
+            if not decode:
+                writer.write(crlf)
+
+    async def _pipe(self, reader, writer, activity=None):
+        """
+        单向转发直到 EOF，然后半关闭对端写方向
+        """
+        try:
+            while True:
+                data = await reader.read(self.buffer_size)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+                if activity is not None:
+                    activity.touch()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            try:
+                if writer.can_write_eof():
+                    writer.write_eof()
+            except (OSError, RuntimeError):
+                pass
+
+    @staticmethod
+    async def _close(writer):
+        if writer.is_closing():
+            return
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+def run_asyncio(host, port, timeout=DEFAULT_TIMEOUT, buffer_size=DEFAULT_BUFFER_SIZE,
+                keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, pool_max_idle=DEFAULT_MAX_IDLE,
+                pool_idle_timeout=DEFAULT_IDLE_TIMEOUT, cache=None, reuse_port=False, stats=None,
+                listen_socket=None, idle_exit=None, admission=None,
+                tunnel_idle_timeout=DEFAULT_TUNNEL_IDLE_TIMEOUT, resolver=None):
+    server = AsyncProxyServer(host, port, timeout, buffer_size, keepalive_timeout,
+                              pool_max_idle, pool_idle_timeout, cache, reuse_port, stats,
+                              listen_socket, idle_exit, admission, tunnel_idle_timeout, resolver)
+    asyncio.run(server.serve_forever())
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="按需代理服务")
+    parser.add_argument('port', nargs='?', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--engine', choices=ENGINES, default='asyncio', help='代理引擎')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='连接上游的超时（秒）')
+    parser.add_argument('--keepalive-timeout', type=float, default=DEFAULT_KEEPALIVE_TIMEOUT,
+                        help='客户端 keep-alive 连接的空闲超时（秒）')
+    parser.add_argument('--pool-max-idle', type=int, default=DEFAULT_MAX_IDLE,
+                        help='每个源站最多保留的空闲上游连接数（0 表示不复用）')
+    parser.add_argument('--pool-idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help='空闲上游连接的最长保留时间（秒）')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE,
+                        help='转发缓冲区大小（字节）')
+    parser.add_argument('--relay', choices=RELAY_MODES, default='auto',
+                        help='threaded 引擎的隧道转发方式（auto: 支持 splice 时用 splice）')
+    parser.add_argument('--cache', action='store_true', help='缓存 GET 响应')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='大对象的磁盘缓存目录')
+    parser.add_argument('--cache-memory-size', type=int, default=DEFAULT_MEMORY_SIZE >> 20,
+                        help='内存缓存上限（MB）')
+    parser.add_argument('--cache-disk-size', type=int, default=DEFAULT_DISK_SIZE >> 20,
+                        help='磁盘缓存上限（MB，0 表示只用内存）')
+    parser.add_argument('--cache-max-object', type=int, default=DEFAULT_MAX_OBJECT_SIZE >> 20,
+                        help='单个对象的缓存上限（MB）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker 进程数（SO_REUSEPORT 共享端口；0 表示 CPU 核心数，1 为单进程）')
+    parser.add_argument('--listen-fd', type=int, default=None,
+                        help='使用继承来的监听 socket 的文件描述符，不自行绑定端口（见 proxy_activator.py）')
+    parser.add_argument('--idle-exit', type=float, default=None,
+                        help='连续无代理流量这么多秒后退出（默认不退出）')
+    parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help='每个进程同时处理的客户端连接上限（0 表示不限制）')
+    parser.add_argument('--max-tunnels', type=int, default=DEFAULT_MAX_TUNNELS,
+                        help='每个进程同时打开的 CONNECT 隧道上限（0 表示不限制）')
+    parser.add_argument('--max-per-ip', type=int, default=DEFAULT_MAX_PER_IP,
+                        help='单个客户端 IP 的连接上限（0 表示不限制）')
+    parser.add_argument('--queue-timeout', type=float, default=DEFAULT_QUEUE_TIMEOUT,
+                        help='连接数已满时新连接最多排队的秒数，之后返回 503')
+    parser.add_argument('--tunnel-idle-timeout', type=float, default=DEFAULT_TUNNEL_IDLE_TIMEOUT,
+                        help='CONNECT 隧道两个方向都无数据多少秒后关闭（0 表示不限制）')
+    parser.add_argument('--dns-ttl', type=float, default=DEFAULT_TTL,
+                        help='上游主机名解析结果的缓存时间（秒，0 表示不缓存）')
+    parser.add_argument('--dns-negative-ttl', type=float, default=DEFAULT_NEGATIVE_TTL,
+                        help='解析失败结果的缓存时间（秒）')
+    args = parser.parse_args()
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    def make_cache(cache_dir):
+        if not args.cache:
+            return None
+        return ResponseCache(cache_dir, args.cache_memory_size << 20,
+                             disk_size=args.cache_disk_size << 20,
+                             max_object_size=args.cache_max_object << 20)
+
+    def serve(cache, reuse_port=False, stats=None, idle_exit=None):
+        listen_socket = inherited_socket(args.listen_fd) if args.listen_fd is not None else None
+        admission = AdmissionControl(args.max_connections, args.max_tunnels, args.max_per_ip, args.queue_timeout)
+        resolver = Resolver(args.dns_ttl, args.dns_negative_ttl)
+        if args.engine == 'threaded':
+            run_threaded(args.host, args.port, args.timeout, args.keepalive_timeout,
+                         args.pool_max_idle, args.pool_idle_timeout, args.buffer_size, args.relay, cache,
+                         reuse_port, stats, listen_socket, idle_exit, admission, args.tunnel_idle_timeout,
+                         resolver)
+        else:
+            run_asyncio(args.host, args.port, args.timeout, args.buffer_size, args.keepalive_timeout,
+                        args.pool_max_idle, args.pool_idle_timeout, cache, reuse_port, stats,
+                        listen_socket, idle_exit, admission, args.tunnel_idle_timeout, resolver)
+
+    raise_nofile_limit()
+    engine = args.engine if args.engine != 'threaded' else f"threaded, relay={resolve_mode(args.relay)}"
+    if workers > 1:
+        engine += f", {workers} workers"
+    print(f"Starting proxy server on port {args.port} ({engine})")
+    sys.stdout.flush()
+
+    if workers > 1:
+        def run_worker(index, stats):
+            # 每个 worker 一个磁盘缓存子目录，互不清理对方的文件
+            cache = make_cache(os.path.join(args.cache_dir, f"w{index}"))
+            try:
+                # 继承同一个监听 socket 时各 worker 直接共用它，否则各自以 SO_REUSEPORT 绑定
+                serve(cache, reuse_port=args.listen_fd is None, stats=stats)
+            finally:
+                if cache is not None:
+                    print(f"Cache stats (worker {index}): {cache.stats()}")
+
+        sys.exit(run_supervisor(workers, run_worker, args.idle_exit))
+
+    cache = make_cache(args.cache_dir)
+    try:
+        serve(cache, idle_exit=args.idle_exit)
+    except KeyboardInterrupt:
+        print("\nShutting down proxy server...")
+    except Exception as e:
+        print(f"Server error: {e}")
+        sys.exit(1)
+    finally:
+        if cache is not None:
+            print(f"Cache stats: {cache.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理流量统计
+记录每个客户端连接的请求数、收发字节数与隧道状态，并汇总为整个代理的计数器，
+由代理的本地 /stats 接口以 JSON 返回，smart_monitor.py 据此判断代理是否空闲。
+
+对代理自身的本地请求（健康检查、/stats）只计入 local_requests，不算作流量活动。
+
+  curl http://127.0.0.1:1083/stats
+  curl 'http://127.0.0.1:1083/stats?connections=1'   # 附带每个活动连接的明细（仅限本机请求）
+"""
+
+import threading
+import time
+
+STATS_PATH = '/stats'
+
+class ConnectionStats:
+    """
+    单个客户端连接的计数器
+
+    bytes_in 只由读客户端的线程/协程累加，bytes_out 只由写客户端的一方累加，
+    因此无需加锁。
+    """
+
+    def __init__(self, stats, peer):
+        self.stats = stats
+        self.peer = peer
+        self.opened_at = time.time()
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tunnel = None
+        self.in_flight = False
+        self.last_request_at = None
+
+    def add_in(self, size):
+        self.bytes_in += size
+        if self.tunnel is not None:
+            self.stats.last_activity_at = time.time()
+
+    def add_out(self, size):
+        self.bytes_out += size
+        if self.tunnel is not None:
+            self.stats.last_activity_at = time.time()
+
+    def request_started(self):
+        now = time.time()
+        self.requests += 1
+        self.in_flight = True
+        self.last_request_at = now
+        self.stats.last_activity_at = now
+
+    def request_finished(self):
+        self.in_flight = False
+        self.stats.last_activity_at = time.time()
+
+    def tunnel_opened(self, target):
+        self.request_started()
+        self.tunnel = target
+        with self.stats.lock:
+            self.stats.tunnels_total += 1
+
+    def tunnel_closed(self):
+        self.tunnel = None
+        self.request_finished()
+
+    def to_dict(self):
+        return {
+            'peer': self.peer,
+            'opened_at': self.opened_at,
+            'requests': self.requests,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'tunnel': self.tunnel,
+            'last_request_at': self.last_request_at,
+        }
+
+class ProxyStats:
+    """
+    整个代理的流量计数器（线程安全）
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.last_activity_at = None
+        self.active = {}
+        self.connections_total = 0
+        self.tunnels_total = 0
+        self.local_requests = 0
+        # 已关闭连接的累计值
+        self.closed_requests = 0
+        self.closed_bytes_in = 0
+        self.closed_bytes_out = 0
+
+    def open_connection(self, peer):
+        conn = ConnectionStats(self, _format_peer(peer))
+        with self.lock:
+            self.active[id(conn)] = conn
+            self.connections_total += 1
+        return conn
+
+    def close_connection(self, conn):
+        with self.lock:
+            if self.active.pop(id(conn), None) is None:
+                return
+            self.closed_requests += conn.requests
+            self.closed_bytes_in += conn.bytes_in
+            self.closed_bytes_out += conn.bytes_out
+
+    def local_request(self):
+        with self.lock:
+            self.local_requests += 1
+
+    def snapshot(self, include_connections=False):
+        """
+        当前统计；idle_seconds 为距最近一次代理流量的秒数，
+        有进行中的请求或隧道时为 0，启动后从未有流量时从启动时刻算起
+        """
+        now = time.time()
+        with self.lock:
+            active = list(self.active.values())
+            data = {
+                'started_at': self.started_at,
+                'uptime_seconds': round(now - self.started_at, 3),
+                'connections_total': self.connections_total,
+                'active_connections': len(active),
+                'tunnels_total': self.tunnels_total,
+                'active_tunnels': sum(1 for conn in active if conn.tunnel is not None),
+                'requests_total': self.closed_requests + sum(conn.requests for conn in active),
+                'local_requests': self.local_requests,
+                'bytes_in': self.closed_bytes_in + sum(conn.bytes_in for conn in active),
+                'bytes_out': self.closed_bytes_out + sum(conn.bytes_out for conn in active),
+            }
+        last_requests = [conn.last_request_at for conn in active if conn.last_request_at]
+        data['last_request_at'] = max(last_requests, default=None)
+        data['last_activity_at'] = self.last_activity_at
+        busy = any(conn.in_flight for conn in active)
+        data['idle_seconds'] = 0 if busy else round(now - (self.last_activity_at or self.started_at), 3)
+        if include_connections:
+            data['connections'] = [conn.to_dict() for conn in active]
+        return data
+
+def _format_peer(peer):
+    if isinstance(peer, tuple) and len(peer) >= 2:
+        return f"{peer[0]}:{peer[1]}"
+    return str(peer) if peer else None
+
+class CountingFile:
+    """
+    包装 rfile / wfile，把读写的字节数计入连接统计（threaded 引擎）
+    """
+
+    def __init__(self, raw, count):
+        self._raw = raw
+        self._count = count
+
+    def read(self, *args):
+        data = self._raw.read(*args)
+        if data:
+            self._count(len(data))
+        return data
+
+    def read1(self, *args):
+        data = self._raw.read1(*args)
+        if data:
+            self._count(len(data))
+        return data
+
+    def readline(self, *args):
+        data = self._raw.readline(*args)
+        self._count(len(data))
+        return data
+
+    def write(self, data):
+        result = self._raw.write(data)
+        self._count(len(data))
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+class CountingStreamReader:
+    """
+    包装 asyncio.StreamReader，把读取的字节数计入连接统计
+    """
+
+    def __init__(self, reader, count):
+        self._reader = reader
+        self._count = count
+
+    async def read(self, n=-1):
+        data = await self._reader.read(n)
+        self._count(len(data))
+        return data
+
+    async def readline(self):
+        data = await self._reader.readline()
+        self._count(len(data))
+        return data
+
+    async def readuntil(self, separator=b'\n'):
+        data = await self._reader.readuntil(separator)
+        self._count(len(data))
+        return data
+
+    async def readexactly(self, n):
+        data = await self._reader.readexactly(n)
+        self._count(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+class CountingStreamWriter:
+    """
+    包装 asyncio.StreamWriter，把写出的字节数计入连接统计
+    """
+
+    def __init__(self, writer, count):
+        self._writer = writer
+        self._count = count
+
+    def write(self, data):
+        self._writer.write(data)
+        self._count(len(data))
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理多进程模式
+supervisor 预先 fork N 个 worker 进程，每个 worker 用 SO_REUSEPORT 绑定同一端口，
+由内核在它们之间分配新连接，吞吐量不再受单个进程 GIL 的限制。
+
+  - worker 异常退出时 supervisor 自动重启（短时间内反复崩溃时逐步退避）
+  - 各 worker 定期把流量计数写入 fork 前创建的共享内存槽位，任一 worker 的 /stats
+    返回所有 worker 的汇总；已退出 worker 的累计值并入 retired 槽位，不会丢失
+  - supervisor 收到 SIGTERM/SIGINT 时通知所有 worker 退出；指定 idle_exit 时，
+    所有 worker 合计无流量达到该秒数后同样让全部 worker 退出
+
+由 proxy_server.py --workers N 使用。
+"""
+
+import mmap
+import os
+import signal
+import struct
+import threading
+import time
+import traceback
+
+from proxy_stats import ProxyStats
+
+# worker 写入共享内存的间隔（秒）
+DEFAULT_PUBLISH_INTERVAL = 0.5
+
+# 短时间内反复崩溃时的重启退避（秒）
+_RESTART_BACKOFF_MAX = 5.0
+_CRASH_WINDOW = 1.0
+# 同一 worker 连续这么多次启动即退出（如端口被占用）时放弃，supervisor 以退出码 1 结束
+_MAX_FAST_CRASHES = 5
+# supervisor 检查 worker 退出的间隔（秒）
+_POLL_INTERVAL = 0.1
+
+# 槽位格式：序号（奇数表示正在写入）+ 各计数
+_SLOT_FIELDS = (
+    ('sequence', 'q'), ('pid', 'q'), ('started_at', 'd'), ('updated_at', 'd'),
+    ('connections_total', 'q'), ('active_connections', 'q'), ('tunnels_total', 'q'),
+    ('active_tunnels', 'q'), ('requests_total', 'q'), ('local_requests', 'q'),
+    ('bytes_in', 'q'), ('bytes_out', 'q'), ('last_activity_at', 'd'), ('busy', 'q'),
+)
+_SLOT = struct.Struct('<' + ''.join(kind for _, kind in _SLOT_FIELDS))
+_SLOT_NAMES = [name for name, _ in _SLOT_FIELDS]
+
+# 可以累加的计数（worker 退出后并入 retired 槽位）
+_CUMULATIVE = ('connections_total', 'tunnels_total', 'requests_total', 'local_requests', 'bytes_in', 'bytes_out')
+
+class SharedStats:
+    """
+    fork 前创建的匿名共享内存：每个 worker 一个槽位，最后一个槽位保存已退出 worker 的累计值
+
+    每个槽位只有一个写者（对应的 worker，或 worker 退出后的 supervisor），
+    读者通过序号检测并重试被并发写入的槽位。
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.started_at = time.time()
+        self.memory = mmap.mmap(-1, _SLOT.size * (workers + 1))
+        self._write_slot(workers, {'started_at': self.started_at})
+
+    @property
+    def retired_index(self):
+        return self.workers
+
+    def _read_slot(self, index):
+        offset = index * _SLOT.size
+        while True:
+            values = _SLOT.unpack_from(self.memory, offset)
+            if values[0] % 2:
+                time.sleep(0)
+                continue
+            if _SLOT.unpack_from(self.memory, offset)[0] == values[0]:
+                return dict(zip(_SLOT_NAMES, values))
+
+    def _write_slot(self, index, values):
+        offset = index * _SLOT.size
+        sequence = _SLOT.unpack_from(self.memory, offset)[0]
+        struct.pack_into('<q', self.memory, offset, sequence + 1)
+        row = [values.get(name) or 0 for name in _SLOT_NAMES]
+        row[0] = sequence + 1
+        _SLOT.pack_into(self.memory, offset, *row)
+        struct.pack_into('<q', self.memory, offset, sequence + 2)
+
+    def publish(self, index, snapshot):
+        """
+        worker 写入自己的槽位（snapshot 为 ProxyStats.snapshot() 的结果）
+        """
+        values = {name: snapshot.get(name) for name in _SLOT_NAMES}
+        values.update(pid=os.getpid(), updated_at=time.time(), busy=1 if snapshot.get('idle_seconds') == 0 else 0)
+        self._write_slot(index, values)
+
+    def retire(self, index):
+        """
+        worker 退出后由 supervisor 调用：把它的累计值并入 retired 槽位并清空槽位
+        """
+        slot = self._read_slot(index)
+        retired = self._read_slot(self.retired_index)
+        for name in _CUMULATIVE:
+            retired[name] += slot[name]
+        retired['last_activity_at'] = max(retired['last_activity_at'], slot['last_activity_at'])
+        self._write_slot(self.retired_index, retired)
+        self._write_slot(index, {})
+
+    def aggregate(self, index, local):
+        """
+        汇总所有槽位；本 worker 的部分直接使用最新的 local 快照
+        """
+        now = time.time()
+        slots = []
+        for slot_index in range(self.workers):
+            slot = self._read_slot(slot_index)
+            if slot_index == index:
+                slot.update({name: local.get(name) or 0 for name in _SLOT_NAMES if name in local})
+                slot['busy'] = 1 if local.get('idle_seconds') == 0 else 0
+                slot['pid'] = os.getpid()
+            if slot['pid']:
+                slots.append((slot_index, slot))
+        retired = self._read_slot(self.retired_index)
+
+        data = {
+            'started_at': self.started_at,
+            'uptime_seconds': round(now - self.started_at, 3),
+        }
+        for name in _CUMULATIVE:
+            data[name] = retired[name] + sum(slot[name] for _, slot in slots)
+        data['active_connections'] = sum(slot['active_connections'] for _, slot in slots)
+        data['active_tunnels'] = sum(slot['active_tunnels'] for _, slot in slots)
+        last_activity = max([retired['last_activity_at']] + [slot['last_activity_at'] for _, slot in slots])
+        data['last_request_at'] = local.get('last_request_at')
+        data['last_activity_at'] = last_activity or None
+        busy = any(slot['busy'] for _, slot in slots)
+        data['idle_seconds'] = 0 if busy else round(now - (last_activity or self.started_at), 3)
+        data['worker_pid'] = os.getpid()
+        data['workers'] = [
+            {
+                'index': slot_index,
+                'pid': slot['pid'],
+                'requests_total': slot['requests_total'],
+                'active_connections': slot['active_connections'],
+                'active_tunnels': slot['active_tunnels'],
+                'bytes_in': slot['bytes_in'],
+                'bytes_out': slot['bytes_out'],
+                'updated_at': slot['updated_at'],
+            }
+            for slot_index, slot in slots
+        ]
+        if 'connections' in local:
+            data['connections'] = local['connections']
+        return data
+
+class SharedProxyStats(ProxyStats):
+    """
+    worker 进程使用的 ProxyStats：后台线程定期发布本进程计数，snapshot 返回所有 worker 的汇总
+    """
+
+    def __init__(self, shared, index, interval=DEFAULT_PUBLISH_INTERVAL):
+        super().__init__()
+        self.shared = shared
+        self.index = index
+        self.interval = interval
+        threading.Thread(target=self._publish_loop, daemon=True).start()
+
+    def _publish_loop(self):
+        while True:
+            self.shared.publish(self.index, super().snapshot())
+            time.sleep(self.interval)
+
+    def snapshot(self, include_connections=False):
+        return self.shared.aggregate(self.index, super().snapshot(include_connections))
+
+def _describe_exit(status):
+    if os.WIFSIGNALED(status):
+        return f"信号 {os.WTERMSIG(status)}"
+    return f"退出码 {os.WEXITSTATUS(status)}"
+
+def run_supervisor(workers, run_worker, idle_exit=None):
+    """
+    fork workers 个子进程运行 run_worker(index, stats)，崩溃时重启，收到终止信号或
+    空闲 idle_exit 秒后让全部 worker 退出并等待它们结束
+
+    run_worker 在子进程中运行，返回即表示该 worker 正常结束。返回 supervisor 的退出码。
+    """
+    shared = SharedStats(workers)
+    children = {}
+    fast_crashes = [0] * workers
+    restarts = {}
+    stopping = False
+    failed = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            code = 0
+            try:
+                run_worker(index, SharedProxyStats(shared, index))
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (index, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+    print(f"🚀 已启动 {workers} 个 worker (supervisor PID: {os.getpid()})", flush=True)
+
+    while children or (restarts and not stopping):
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if not pid:
+            if idle_exit and not stopping and shared.aggregate(None, {})['idle_seconds'] >= idle_exit:
+                print(f"💤 已空闲 {idle_exit:g} 秒，停止所有 worker", flush=True)
+                stop(None, None)
+            now = time.monotonic()
+            for index, due in list(restarts.items()):
+                if due <= now and not stopping:
+                    del restarts[index]
+                    spawn(index)
+            time.sleep(_POLL_INTERVAL)
+            continue
+        index, started = children.pop(pid)
+        shared.retire(index)
+        if stopping:
+            continue
+        # 启动后很快就退出时逐步退避，避免配置错误导致的快速重启循环
+        if time.monotonic() - started < _CRASH_WINDOW:
+            fast_crashes[index] += 1
+        else:
+            fast_crashes[index] = 0
+        if fast_crashes[index] >= _MAX_FAST_CRASHES:
+            print(f"❌ worker {index} 连续 {fast_crashes[index]} 次启动后立即退出，停止所有 worker", flush=True)
+            failed = True
+            stop(None, None)
+            continue
+        delay = min(_RESTART_BACKOFF_MAX, 0.1 * 2 ** fast_crashes[index]) if fast_crashes[index] else 0.0
+        print(f"⚠️  worker {index} (PID {pid}) 已退出（{_describe_exit(status)}），"
+              f"{delay:.1f} 秒后重启", flush=True)
+        restarts[index] = time.monotonic() + delay
+    print("👋 所有 worker 已退出", flush=True)
+    return 1 if failed else 0
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可续传的 R2 分段上传
+大文件按固定大小切段并发上传，每完成一段就把 UploadId 与各段 ETag 写入
+检查点文件；中断后再次运行时先用 list_parts 核对远端已有的段，只补传缺失的段。
+
+由 r2_upload.py 对超过阈值的文件调用，一般不单独使用。
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fileutil import atomic_write_text
+
+DEFAULT_CHECKPOINT_DIR = ".r2_upload_checkpoints"
+DEFAULT_PART_SIZE = 16 << 20
+DEFAULT_PART_WORKERS = 4
+
+# S3 协议限制：除最后一段外每段至少 5 MiB，最多 10000 段
+MIN_PART_SIZE = 5 << 20
+MAX_PARTS = 10000
+
+def plan_part_size(size, part_size):
+    """
+    调整分段大小以满足协议限制
+    """
+    return max(part_size, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+
+class UploadCheckpoint:
+    """
+    单个对象的分段上传检查点
+    """
+
+    VERSION = 1
+
+    def __init__(self, checkpoint_dir, bucket, key):
+        name = hashlib.sha256(f"{bucket}/{key}".encode('utf-8')).hexdigest()[:32]
+        self.path = os.path.join(checkpoint_dir, f"{name}.json")
+        self.lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == self.VERSION:
+                    self.data = data
+            except (OSError, ValueError) as e:
+                print(f"⚠️  检查点无法读取，将重新上传: {self.path} ({e})")
+
+    def matches(self, bucket, key, sha256, size, part_size):
+        """
+        检查点是否属于同一对象、同一内容与同一分段方式
+        """
+        return (self.data.get('bucket') == bucket and self.data.get('key') == key
+                and self.data.get('sha256') == sha256 and self.data.get('size') == size
+                and self.data.get('part_size') == part_size and bool(self.data.get('upload_id')))
+
+    def start(self, bucket, key, sha256, size, part_size, upload_id):
+        self.data = {
+            'version': self.VERSION,
+            'bucket': bucket,
+            'key': key,
+            'sha256': sha256,
+            'size': size,
+            'part_size': part_size,
+            'upload_id': upload_id,
+            'parts': {},
+        }
+        self.save()
+
+    @property
+    def upload_id(self):
+        return self.data.get('upload_id')
+
+    @property
+    def parts(self):
+        """
+        已完成的段 {段号: ETag}
+        """
+        return {int(number): etag for number, etag in self.data.get('parts', {}).items()}
+
+    def set_parts(self, parts):
+        with self.lock:
+            self.data['parts'] = {str(number): etag for number, etag in parts.items()}
+        self.save()
+
+    def record_part(self, number, etag):
+        with self.lock:
+            self.data['parts'][str(number)] = etag
+        self.save()
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            atomic_write_text(self.path, json.dumps(self.data, indent=1, sort_keys=True))
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.data = {}
+
+def _is_missing_upload(error):
+    return error.response.get('Error', {}).get('Code') in ('NoSuchUpload', '404', 'NotFound')
+
+def list_uploaded_parts(client, bucket, key, upload_id):
+    """
+    列出远端已有的段 {段号: (ETag, 大小)}
+    """
+    parts = {}
+    marker = 0
+    while True:
+        response = client.list_parts(Bucket=bucket, Key=key, UploadId=upload_id, PartNumberMarker=marker)
+        for part in response.get('Parts', []):
+            parts[part['PartNumber']] = (part['ETag'], part['Size'])
+        if not response.get('IsTruncated'):
+            return parts
+        marker = response['NextPartNumberMarker']
+
+def _resume_parts(client, bucket, key, checkpoint, size, part_size, part_count):
+    """
+    用 list_parts 核对检查点，返回可复用的段；上传已失效时返回 None
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        remote = list_uploaded_parts(client, bucket, key, checkpoint.upload_id)
+    except ClientError as e:
+        if _is_missing_upload(e):
+            return None
+        raise
+
+    verified = {}
+    for number, etag in checkpoint.parts.items():
+        expected = min(part_size, size - (number - 1) * part_size)
+        if 1 <= number <= part_count and remote.get(number) == (etag, expected):
+            verified[number] = etag
+    return verified
+
+def _abort_quietly(client, bucket, key, upload_id):
+    from botocore.exceptions import ClientError
+
+    try:
+        client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+    except ClientError:
+        pass
+
+def multipart_upload(client, bucket, key, file_path, sha256, content_type, acl=None,
+                     part_size=DEFAULT_PART_SIZE, part_workers=DEFAULT_PART_WORKERS,
+                     checkpoint_dir=DEFAULT_CHECKPOINT_DIR):
+    """
+    分段上传一个文件，返回 (总段数, 续传复用的段数)
+
+    失败时保留检查点并抛出异常，下次调用同一对象会从已完成的段继续。
+    """
+    size = os.path.getsize(file_path)
+    part_size = plan_part_size(size, part_size)
+    part_count = max(1, math.ceil(size / part_size))
+    checkpoint = UploadCheckpoint(checkpoint_dir, bucket, key)
+
+    done = None
+    if checkpoint.matches(bucket, key, sha256, size, part_size):
+        done = _resume_parts(client, bucket, key, checkpoint, size, part_size, part_count)
+    elif checkpoint.upload_id:
+        # 文件内容或分段方式已变，旧的未完成上传不再需要
+        _abort_quietly(client, bucket, checkpoint.data.get('key', key), checkpoint.upload_id)
+
+    if done is None:
+        extra = {'ContentType': content_type, 'Metadata': {'sha256': sha256}}
+        if acl:
+            extra['ACL'] = acl
+        response = client.create_multipart_upload(Bucket=bucket, Key=key, **extra)
+        checkpoint.start(bucket, key, sha256, size, part_size, response['UploadId'])
+        done = {}
+    else:
+        checkpoint.set_parts(done)
+    resumed = len(done)
+    upload_id = checkpoint.upload_id
+
+    def upload_part(number):
+        with open(file_path, 'rb') as f:
+            f.seek((number - 1) * part_size)
+            body = f.read(part_size)
+        response = client.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+        )
+        checkpoint.record_part(number, response['ETag'])
+
+    pending = [number for number in range(1, part_count + 1) if number not in done]
+    with ThreadPoolExecutor(max_workers=max(1, part_workers)) as executor:
+        # list() 让任意一段的异常在这里抛出
+        list(executor.map(upload_part, pending))
+
+    parts = checkpoint.parts
+    client.complete_multipart_upload(
+        Bucket=bucket, Key=key, UploadId=upload_id,
+        MultipartUpload={'Parts': [
+            {'PartNumber': number, 'ETag': parts[number]} for number in sorted(parts)
+        ]}
+    )
+    checkpoint.remove()
+    return part_count, resumed
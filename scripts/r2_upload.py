@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒体文件并发上传到 Cloudflare R2
+所有文件共用一个带连接池的 S3 客户端，由有界线程池并发上传，替代逐个文件
+启动 aws s3 cp 的串行循环；上传成功的映射写入映射库并导出 txt/CSV。
+
+用法:
+  # static/videos → videos/<相对路径>，映射键为相对路径
+  python3 scripts/r2_upload.py --root static/videos --key-prefix videos/ \\
+      --namespace video --export video_url_mapping.txt static/videos
+
+  # media/** → <相对 media 的路径>，映射键为文件路径
+  python3 scripts/r2_upload.py --root media --mapping-key path --acl public-read \\
+      --namespace inline --export media/inline-mapping.csv media/inline/images media/inline/pdfs
+
+  # 本地 S3 兼容服务（MinIO / moto_server 等）
+  python3 scripts/r2_upload.py --endpoint-url http://127.0.0.1:9000 --path-style ...
+
+不小于 --multipart-threshold 的大文件分段并发上传，进度写入检查点，
+中断后再次运行会从已完成的段继续（见 r2_multipart.py）。
+
+本地清单（默认 .r2_upload_manifest.json）记录每个对象上次上传的内容哈希，
+内容未变的文件直接跳过；--remote-check 会对清单中没有记录的文件发送 HEAD，
+按对象元数据 sha256（或单段上传的 ETag/MD5）判断桶里是否已是同一内容。
+
+凭据从环境变量 R2_ACCESS_KEY / R2_SECRET_KEY 读取（未设置时使用 AWS 默认凭据链），
+端点默认为 R2_ENDPOINT 或 https://$R2_ACCOUNT_ID.r2.cloudflarestorage.com。
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fileutil import atomic_write_text, file_digest
+from mapping_store import DEFAULT_STORE, MappingStore
+from mp4_faststart import DEFAULT_CACHE_DIR as DEFAULT_FASTSTART_CACHE, faststart_cached
+from r2_multipart import DEFAULT_CHECKPOINT_DIR, DEFAULT_PART_SIZE, DEFAULT_PART_WORKERS, multipart_upload
+
+# 单个文件的上传结果
+UPLOADED = 'uploaded'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+DEFAULT_MANIFEST = ".r2_upload_manifest.json"
+
+# 超过该大小的文件使用可续传的分段上传
+DEFAULT_MULTIPART_THRESHOLD = 64 << 20
+
+# 视频扩展名（与 upload_videos.sh 的 find 条件一致）
+VIDEO_EXTENSIONS = ('mp4', 'webm', 'mov', 'avi', 'mkv')
+
+# 与上传脚本中 get_mime_type 一致的类型表，其余按扩展名猜测
+MIME_TYPES = {
+    'mp4': 'video/mp4',
+    'webm': 'video/webm',
+    'mov': 'video/quicktime',
+    'avi': 'video/x-msvideo',
+    'mkv': 'video/x-matroska',
+    'mp3': 'audio/mpeg',
+}
+
+UploadJob = namedtuple('UploadJob', 'local_path key mapping_key public_url content_type size')
+
+UploadResult = namedtuple('UploadResult', 'job status error seconds')
+
+def get_mime_type(file_path):
+    """
+    获取文件的 MIME 类型
+    """
+    extension = os.path.splitext(file_path)[1][1:].lower()
+    if extension in MIME_TYPES:
+        return MIME_TYPES[extension]
+    guessed, _ = mimetypes.guess_type(file_path)
+    return guessed or 'application/octet-stream'
+
+def make_client(endpoint_url, max_connections, path_style=False):
+    """
+    创建共享的 S3 客户端（线程安全，连接池大小与并发数一致）
+    """
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=max_connections,
+        retries={'max_attempts': 5, 'mode': 'standard'},
+        s3={'addressing_style': 'path' if path_style else 'auto'},
+    )
+    return boto3.session.Session().client(
+        's3',
+        endpoint_url=endpoint_url,
+        aws_access_key_id=os.environ.get('R2_ACCESS_KEY') or None,
+        aws_secret_access_key=os.environ.get('R2_SECRET_KEY') or None,
+        region_name=os.environ.get('R2_REGION', 'auto'),
+        config=config,
+    )
+
+def _expand_sources(sources):
+    """
+    展开来源（目录递归、文件、通配符），按路径排序去重
+    """
+    files = set()
+    for source in sources:
+        matches = glob.glob(source, recursive=True) if glob.has_magic(source) else [source]
+        for match in matches:
+            if os.path.isdir(match):
+                for directory, _, names in os.walk(match):
+                    files.update(os.path.join(directory, name) for name in names)
+            elif os.path.isfile(match):
+                files.add(match)
+    return sorted(files)
+
+def collect_jobs(sources, root, key_prefix, public_domain, mapping_key='relative', extensions=None,
+                 content_type=None):
+    """
+    收集待上传的文件
+
+    对象键为 key_prefix + 相对 root 的路径；映射键为相对路径（relative）
+    或文件路径本身（path）。
+    """
+    jobs = []
+    for file_path in _expand_sources(sources):
+        extension = os.path.splitext(file_path)[1][1:].lower()
+        if extensions and extension not in extensions:
+            continue
+        relative_path = os.path.relpath(file_path, root).replace(os.sep, '/')
+        key = key_prefix + relative_path
+        jobs.append(UploadJob(
+            local_path=file_path,
+            key=key,
+            mapping_key=relative_path if mapping_key == 'relative' else file_path.replace(os.sep, '/'),
+            public_url=f"{public_domain.rstrip('/')}/{key}",
+            content_type=content_type or get_mime_type(file_path),
+            size=os.path.getsize(file_path),
+        ))
+    return jobs
+
+class UploadManifest:
+    """
+    上传清单
+
+    以 "存储桶/对象键" 为键，记录对象上次成功上传时本地文件的大小、修改时间、
+    SHA-256 与 Content-Type。大小和修改时间都未变时直接复用记录的哈希，
+    不必重新读取整个文件。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, full=False):
+        self.path = path
+        self.objects = {}
+        self.lock = threading.Lock()
+
+        if not full and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == self.VERSION:
+                    self.objects = data.get('objects', {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️  上传清单无法读取，将全部上传: {path} ({e})")
+
+    def digest(self, bucket, job):
+        """
+        返回文件内容的 SHA-256（文件未变时使用清单中的记录）
+        """
+        with self.lock:
+            entry = self.objects.get(f"{bucket}/{job.key}")
+        stat = os.stat(job.local_path)
+        if (entry and entry.get('local_path') == job.local_path and entry.get('size') == stat.st_size
+                and entry.get('mtime_ns') == stat.st_mtime_ns):
+            return entry['sha256']
+        return file_digest(job.local_path)
+
+    def is_current(self, bucket, job, sha256, faststart=False):
+        """
+        对象是否已经以相同内容、类型和预处理方式上传过
+        """
+        with self.lock:
+            entry = self.objects.get(f"{bucket}/{job.key}")
+        return (bool(entry) and entry.get('sha256') == sha256 and entry.get('content_type') == job.content_type
+                and entry.get('faststart', False) == faststart)
+
+    def record(self, bucket, job, sha256, faststart=False):
+        """
+        记录上传（或远端确认）成功后的状态
+        """
+        stat = os.stat(job.local_path)
+        with self.lock:
+            self.objects[f"{bucket}/{job.key}"] = {
+                'local_path': job.local_path,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': sha256,
+                'content_type': job.content_type,
+                'faststart': faststart,
+            }
+
+    def save(self):
+        """
+        保存清单（本地已删除的文件不再保留记录）
+        """
+        with self.lock:
+            objects = {
+                name: entry for name, entry in self.objects.items()
+                if os.path.exists(entry.get('local_path', ''))
+            }
+        data = {'version': self.VERSION, 'objects': objects}
+        atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=1, sort_keys=True))
+
+def _md5_digest(file_path, block_size=1 << 20):
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _upload_body(job, sha256, faststart_cache=None):
+    """
+    实际上传的文件：指定 faststart_cache 时为 faststart 处理后的文件（按原文件哈希缓存）
+    """
+    if not faststart_cache:
+        return job.local_path
+    return faststart_cached(job.local_path, sha256, faststart_cache)
+
+def remote_matches(client, bucket, job, sha256, faststart_cache=None):
+    """
+    HEAD 远端对象，判断是否已是相同内容
+
+    优先比较上传时写入的 x-amz-meta-sha256（原文件哈希）；没有该元数据时，单段上传
+    对象的 ETag 即内容 MD5，与实际上传的文件（faststart 时为处理后的文件）比较大小
+    与 MD5（分段上传的 ETag 带 "-"，无法比较）。
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        head = client.head_object(Bucket=bucket, Key=job.key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+    if head.get('ContentType') != job.content_type:
+        return False
+    remote_sha256 = head.get('Metadata', {}).get('sha256')
+    if remote_sha256:
+        return remote_sha256 == sha256
+    etag = head.get('ETag', '').strip('"')
+    if not etag or '-' in etag:
+        return False
+    body_path = _upload_body(job, sha256, faststart_cache)
+    return head.get('ContentLength') == os.path.getsize(body_path) and etag == _md5_digest(body_path)
+
+def upload_one(client, bucket, job, sha256, acl=None, multipart=None, faststart_cache=None):
+    """
+    上传单个文件（内容哈希写入对象元数据，供之后的远端比较）
+
+    multipart 为分段上传参数（threshold / part_size / part_workers / checkpoint_dir），
+    文件不小于 threshold 时分段上传。指定 faststart_cache 时，moov 在末尾的 MP4
+    先做 faststart 处理（按原文件哈希缓存），上传处理后的文件。
+    """
+    body_path = _upload_body(job, sha256, faststart_cache)
+    if body_path != job.local_path:
+        print(f"🚀 faststart: {job.local_path}")
+
+    if multipart and os.path.getsize(body_path) >= multipart['threshold']:
+        options = {name: value for name, value in multipart.items() if name != 'threshold'}
+        parts, resumed = multipart_upload(
+            client, bucket, job.key, body_path, sha256, job.content_type, acl, **options
+        )
+        if resumed:
+            print(f"🔁 续传: {job.local_path}（{parts} 段中 {resumed} 段已完成）")
+        return
+    extra = {'ContentType': job.content_type, 'Metadata': {'sha256': sha256}}
+    if acl:
+        extra['ACL'] = acl
+    with open(body_path, 'rb') as body:
+        client.put_object(Bucket=bucket, Key=job.key, Body=body, **extra)
+
+def upload_all(client, bucket, jobs, workers, acl=None, manifest=None, remote_check=False, multipart=None,
+               faststart_cache=None, progress=None):
+    """
+    用有界线程池并发上传，返回 [UploadResult]
+
+    清单或远端确认内容未变的文件记为 SKIPPED，不再传输。
+    """
+    results = []
+    lock = threading.Lock()
+
+    def run(job):
+        started = time.perf_counter()
+        try:
+            sha256 = manifest.digest(bucket, job) if manifest else file_digest(job.local_path)
+            if manifest and manifest.is_current(bucket, job, sha256, bool(faststart_cache)):
+                status = SKIPPED
+            elif remote_check and remote_matches(client, bucket, job, sha256, faststart_cache):
+                status = SKIPPED
+            else:
+                upload_one(client, bucket, job, sha256, acl, multipart, faststart_cache)
+                status = UPLOADED
+            if manifest:
+                manifest.record(bucket, job, sha256, bool(faststart_cache))
+            result = UploadResult(job, status, None, time.perf_counter() - started)
+        except Exception as e:
+            result = UploadResult(job, FAILED, str(e), time.perf_counter() - started)
+        if progress is not None:
+            with lock:
+                progress(result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, job) for job in jobs]
+        for future in as_completed(futures):
+            results.append(future.result())
+    return results
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f}{unit}" if unit != 'B' else f"{size}B"
+        size /= 1024
+
+def _default_endpoint():
+    if os.environ.get('R2_ENDPOINT'):
+        endpoint = os.environ['R2_ENDPOINT']
+        return endpoint if '://' in endpoint else f"https://{endpoint}"
+    if os.environ.get('R2_ACCOUNT_ID'):
+        return f"https://{os.environ['R2_ACCOUNT_ID']}.r2.cloudflarestorage.com"
+    return None
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="媒体文件并发上传到 Cloudflare R2")
+    parser.add_argument('sources', nargs='+', help='要上传的目录、文件或通配符')
+    parser.add_argument('--bucket', default=os.environ.get('R2_BUCKET'), help='R2 存储桶（默认 $R2_BUCKET）')
+    parser.add_argument('--endpoint-url', default=_default_endpoint(), help='S3 兼容端点')
+    parser.add_argument('--path-style', action='store_true', help='使用路径风格寻址（本地 S3 兼容服务）')
+    parser.add_argument('--public-domain', default=os.environ.get('R2_CDN_DOMAIN', 'https://your-cdn-domain.com'),
+                        help='公共访问域名（默认 $R2_CDN_DOMAIN）')
+    parser.add_argument('--root', default='.', help='计算相对路径的根目录')
+    parser.add_argument('--key-prefix', default='', help='对象键前缀，如 videos/')
+    parser.add_argument('--mapping-key', choices=('relative', 'path'), default='relative',
+                        help='映射键使用相对 root 的路径还是文件路径')
+    parser.add_argument('--ext', help='只上传这些扩展名（逗号分隔），如 mp4,webm')
+    parser.add_argument('--content-type', help='为所有文件指定 Content-Type（默认按扩展名）')
+    parser.add_argument('--acl', help='对象 ACL，如 public-read')
+    parser.add_argument('--workers', '-w', type=int, default=8, help='并发上传数')
+    parser.add_argument('--namespace', help='写入映射库的命名空间，如 video / inline / notebooklm')
+    parser.add_argument('--db', default=os.environ.get('LINK_MAPPING_DB', DEFAULT_STORE), help='映射库路径')
+    parser.add_argument('--export', help='上传后导出该命名空间的映射（.txt 管道分隔 / .csv）')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='上传清单路径（空字符串表示不使用清单）')
+    parser.add_argument('--full', action='store_true', help='忽略清单，全部重新上传')
+    parser.add_argument('--remote-check', action='store_true',
+                        help='清单中没有记录的文件先 HEAD 远端对象，内容相同则跳过')
+    parser.add_argument('--multipart-threshold', type=int, default=DEFAULT_MULTIPART_THRESHOLD >> 20,
+                        help='不小于该大小（MB）的文件分段上传，0 表示全部分段')
+    parser.add_argument('--part-size', type=int, default=DEFAULT_PART_SIZE >> 20, help='分段大小（MB，至少 5）')
+    parser.add_argument('--part-workers', type=int, default=DEFAULT_PART_WORKERS, help='单个文件的并发分段数')
+    parser.add_argument('--checkpoint-dir', default=DEFAULT_CHECKPOINT_DIR, help='分段上传检查点目录')
+    parser.add_argument('--faststart', action='store_true', help='上传前把 MP4 的 moov 移到文件开头')
+    parser.add_argument('--faststart-cache', default=DEFAULT_FASTSTART_CACHE, help='faststart 处理结果缓存目录')
+    parser.add_argument('--dry-run', action='store_true', help='只列出将要上传的文件')
+    args = parser.parse_args()
+
+    extensions = tuple(ext.strip().lower().lstrip('.') for ext in args.ext.split(',')) if args.ext else None
+    jobs = collect_jobs(
+        args.sources, args.root, args.key_prefix, args.public_domain,
+        mapping_key=args.mapping_key, extensions=extensions, content_type=args.content_type
+    )
+    if not jobs:
+        print("📭 没有找到需要上传的文件")
+        return
+
+    total_bytes = sum(job.size for job in jobs)
+    print(f"📤 准备上传 {len(jobs)} 个文件 ({_format_size(total_bytes)})，并发 {args.workers}")
+
+    if args.dry_run:
+        for job in jobs:
+            print(f"  {job.local_path} → {job.key} ({job.content_type})")
+        return
+
+    if not args.bucket:
+        parser.error("未指定存储桶（--bucket 或 $R2_BUCKET）")
+
+    # 文件级与段级并发共用同一个连接池
+    client = make_client(args.endpoint_url, args.workers * max(1, args.part_workers), args.path_style)
+    multipart = {
+        'threshold': args.multipart_threshold << 20,
+        'part_size': args.part_size << 20,
+        'part_workers': args.part_workers,
+        'checkpoint_dir': args.checkpoint_dir,
+    }
+    manifest = UploadManifest(args.manifest, args.full) if args.manifest else None
+
+    def progress(result):
+        if result.status == UPLOADED:
+            print(f"✅ 成功: {result.job.local_path} ({_format_size(result.job.size)}, {result.seconds:.1f}s)")
+            print(f"   公共链接: {result.job.public_url}")
+        elif result.status == SKIPPED:
+            print(f"⏭️  未变化: {result.job.local_path}")
+        else:
+            print(f"❌ 失败: {result.job.local_path}: {result.error}")
+
+    started = time.perf_counter()
+    try:
+        results = upload_all(
+            client, args.bucket, jobs, args.workers, args.acl,
+            manifest=manifest, remote_check=args.remote_check, multipart=multipart,
+            faststart_cache=args.faststart_cache if args.faststart else None, progress=progress
+        )
+    finally:
+        if manifest:
+            manifest.save()
+    elapsed = time.perf_counter() - started
+
+    # 跳过的文件同样已在桶中，映射照常写入
+    succeeded = [result.job for result in results if result.status != FAILED]
+    uploaded = [result.job for result in results if result.status == UPLOADED]
+    failed = len(results) - len(succeeded)
+    uploaded_bytes = sum(job.size for job in uploaded)
+    saved_bytes = sum(job.size for job in succeeded) - uploaded_bytes
+
+    if args.namespace and succeeded:
+        with MappingStore(args.db) as store:
+            store.upsert_many(args.namespace, ((job.mapping_key, job.public_url) for job in succeeded))
+            if args.export:
+                count = store.export_file(args.namespace, args.export)
+                print(f"📝 导出 {count} 条映射到 {args.export}")
+
+    rate = uploaded_bytes / elapsed / (1 << 20) if elapsed > 0 else 0.0
+    print(f"\n🎉 上传完成! 上传 {len(uploaded)} / 未变化 {len(succeeded) - len(uploaded)} / 失败 {failed}，"
+          f"传输 {_format_size(uploaded_bytes)}，节省 {_format_size(saved_bytes)}，"
+          f"耗时 {elapsed:.1f}s ({rate:.1f} MB/s)")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -5,28 +5,32 @@
 将文章中的本地视频路径替换为 Cloudflare R2 的 CDN 链接
 """
 
+import argparse
 import os
-import re
 import sys
-from pathlib import Path
 
-def load_url_mapping(mapping_file="video_url_mapping.txt"):
+from link_rewrite import (
+    DEFAULT_CHUNK_SIZE,
+    LinkRewriter, VideoLinkRewriter,
+    format_summary, load_pipe_mapping, rewrite_file, rewrite_files,
+)
+from link_rewrite import find_markdown_files as _find_markdown_files
+from mapping_store import DEFAULT_STORE, load_store_mapping
+
+def load_url_mapping(mapping_file="video_url_mapping.txt", store_file=DEFAULT_STORE):
     """
-    加载视频 URL 映射文件
-    格式: 本地路径|CDN链接
+    加载视频 URL 映射
+    优先读取映射库中的 video 命名空间，否则读取映射文件（格式: 本地路径|CDN链接）
     """
     mapping = {}
+    if os.path.exists(store_file):
+        mapping = load_store_mapping(f"{store_file}#video")
     
-    if not os.path.exists(mapping_file):
-        print(f"⚠️  未找到映射文件: {mapping_file}")
-        return mapping
-    
-    with open(mapping_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if '|' in line:
-                local_path, cdn_url = line.split('|', 1)
-                mapping[local_path] = cdn_url
+    if not mapping:
+        if not os.path.exists(mapping_file):
+            print(f"⚠️  未找到映射文件: {mapping_file}")
+            return {}
+        mapping = load_pipe_mapping(mapping_file)
     
     print(f"✅ 加载了 {len(mapping)} 个视频映射")
     return mapping
@@ -35,94 +39,17 @@ def find_markdown_files(content_dir="content"):
     """
     递归查找所有 Markdown 文件
     """
-    markdown_files = []
-    content_path = Path(content_dir)
-    
-    if not content_path.exists():
-        print(f"❌ 内容目录不存在: {content_dir}")
-        return markdown_files
-    
-    for md_file in content_path.rglob("*.md"):
-        markdown_files.append(str(md_file))
-    
+    markdown_files = _find_markdown_files([content_dir])
     print(f"📄 找到 {len(markdown_files)} 个 Markdown 文件")
     return markdown_files
 
-def replace_video_links_in_file(file_path, mapping):
+def replace_video_links_in_file(file_path, mapping, rewriter=None):
     """
-    在单个文件中替换视频链接
+    在单个文件中替换视频链接，返回 UPDATED / UNCHANGED / FAILED
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except Exception as e:
-        print(f"❌ 读取文件失败 {file_path}: {e}")
-        return False
-    
-    original_content = content
-    changes_made = False
-    
-    # 匹配视频链接的正则表达式
-    video_patterns = [
-        # 标准 Markdown 语法
-        r'\[([^\]]*(?:视频|video|播放)[^\]]*)\]\(([^)]+\.(?:mp4|webm|mov|avi|mkv))\)',
-        # 直接的文件路径
-        r'(?:src|href)="([^"]+\.(?:mp4|webm|mov|avi|mkv))"',
-        # 普通的文件路径引用
-        r'([^\s<>()\[\]]+\.(?:mp4|webm|mov|avi|mkv))',
-    ]
-    
-    for local_path, cdn_url in mapping.items():
-        # 尝试多种匹配模式
-        for pattern in video_patterns:
-            # 创建替换函数
-            def replacer(match):
-                nonlocal changes_made
-                full_match = match.group(0)
-                
-                # 检查是否包含我们要替换的本地路径
-                if local_path in full_match:
-                    # 保持原有的格式，只替换 URL 部分
-                    if match.groups():
-                        # 如果有分组（比如 Markdown 链接）
-                        groups = list(match.groups())
-                        # 替换包含本地路径的组
-                        for i, group in enumerate(groups):
-                            if local_path in group:
-                                groups[i] = cdn_url
-                        
-                        # 重新构造匹配
-                        result = full_match
-                        for i, group in enumerate(groups):
-                            if i == 0:
-                                result = result.replace(group, groups[i], 1)
-                        return result
-                    else:
-                        # 直接替换
-                        return full_match.replace(local_path, cdn_url)
-                else:
-                    return full_match
-            
-            # 执行替换
-            content = re.sub(pattern, replacer, content, flags=re.IGNORECASE)
-        
-        # 检查是否有变化
-        if content != original_content:
-            changes_made = True
-    
-    # 如果有变化，写回文件
-    if changes_made:
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            print(f"✅ 更新: {file_path}")
-            return True
-        except Exception as e:
-            print(f"❌ 写入文件失败 {file_path}: {e}")
-            return False
-    else:
-        print(f"⏭️  无需更新: {file_path}")
-        return True
+    if rewriter is None:
+        rewriter = VideoLinkRewriter(mapping)
+    return rewrite_file(file_path, rewriter)
 
 def create_video_shortcode(local_path, cdn_url):
     """
@@ -142,7 +69,7 @@ def generate_video_embeds(mapping, output_file="video_embeds.md"):
     """
     embed_content = "# 视频嵌入代码\n\n"
     
-    for local_path, cdn_url in mapping:
+    for local_path, cdn_url in mapping.items():
         filename = os.path.basename(local_path)
         embed_content += f"## {filename}\n\n"
         embed_content += f"**本地路径**: `{local_path}`\n\n"
@@ -163,6 +90,14 @@ def main():
     """
     主函数
     """
+    parser = argparse.ArgumentParser(description="视频链接替换工具")
+    parser.add_argument('--full', action='store_true', help='忽略清单，全量处理所有文件')
+    parser.add_argument('--manifest', default='.video_links_manifest.json', help='增量处理清单路径')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='并行处理的进程数')
+    parser.add_argument('--stream', action='store_true', help='分块流式处理，内存占用与文件大小无关')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='流式模式的分块大小（字符数）')
+    args = parser.parse_args()
+    
     print("🎬 视频链接替换工具")
     print("=" * 50)
     
@@ -178,13 +113,13 @@ def main():
         print("❌ 没有找到 Markdown 文件")
         sys.exit(1)
     
-    # 替换链接
-    success_count = 0
-    for md_file in markdown_files:
-        if replace_video_links_in_file(md_file, mapping):
-            success_count += 1
-    
-    print(f"\n🎉 完成! 成功处理 {success_count}/{len(markdown_files)} 个文件")
+    # 只处理内容或相关映射发生变化的文件（每个进程只编译一次匹配器）
+    results, elapsed, skipped_count = rewrite_files(
+        markdown_files, LinkRewriter(video_mapping=mapping),
+        manifest_path=args.manifest, full=args.full, jobs=args.jobs,
+        stream=args.stream, chunk_size=args.chunk_size
+    )
+    print(f"\n🎉 完成! {format_summary(results, elapsed)}，跳过 {skipped_count} 个")
     
     # 生成视频嵌入文档
     generate_video_embeds(mapping)
@@ -3,6 +3,9 @@
 """
 智能按需代理监控系统
 自动检测流量并按需启动/停止代理服务
+
+空闲判断依据代理 /stats 接口返回的真实流量（见 proxy_stats.py），
+监控自身的健康检查不算作活动。
 """
 
 import os
@@ -23,6 +26,7 @@ class SmartProxyMonitor:
         self.setup_logging()
         self.proxy_active = False
         self.last_activity = None
+        self.last_stats = None
         self.activity_count = 0
         
     def load_config(self, config_file):
@@ -117,14 +121,39 @@ class SmartProxyMonitor:
             self.logger.error(f"代理健康检查异常: {e}")
             return False
     
+    def fetch_proxy_stats(self):
+        """读取代理的 /stats 流量统计，失败时返回 None"""
+        try:
+            stats_url = f"http://{self.config['proxy_host']}:{self.config['proxy_port']}/stats"
+            response = requests.get(
+                stats_url,
+                timeout=5,
+                headers={'User-Agent': 'SmartProxyMonitor/1.0'}
+            )
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.logger.debug(f"代理流量统计读取失败: {e}")
+            return None
+
     def get_proxy_activity(self):
-        """获取代理活动统计"""
-        # 这里可以集成实际的流量统计
-        # 目前使用简单的活动检测
-        if self.check_proxy_health():
-            self.last_activity = datetime.now()
-            return True
-        return False
+        """获取代理活动统计
+
+        按代理报告的空闲秒数（有进行中的请求或隧道时为 0）推算最近一次真实流量的
+        时间并更新 last_activity，返回本轮检查间隔内是否有流量。
+        """
+        stats = self.fetch_proxy_stats()
+        if stats is None or stats.get('idle_seconds') is None:
+            return False
+
+        if self.last_stats is not None and stats['requests_total'] != self.last_stats.get('requests_total'):
+            self.logger.debug(f"代理新增请求: {stats['requests_total'] - self.last_stats.get('requests_total', 0)}")
+        self.last_stats = stats
+
+        activity_time = datetime.now() - timedelta(seconds=stats['idle_seconds'])
+        if self.last_activity is None or activity_time > self.last_activity:
+            self.last_activity = activity_time
+        return stats['idle_seconds'] < self.config['health_check_interval']
     
     def should_start_proxy(self):
         """判断是否应该启动代理"""
@@ -262,6 +291,10 @@ class SmartProxyMonitor:
                     else:
                         self.proxy_active = False
                 
+                # 按代理的真实流量更新活动时间（健康检查本身不算活动）
+                if is_active:
+                    self.get_proxy_activity()
+
                 # 按需启动检查
                 if not self.proxy_active and self.should_start_proxy():
                     self.start_proxy_service()
@@ -270,10 +303,6 @@ class SmartProxyMonitor:
                 elif self.proxy_active and self.should_stop_proxy():
                     self.stop_proxy_service()
                 
-                # 更新活动统计
-                if is_active:
-                    self.last_activity = datetime.now()
-                
                 # 定期清理
                 if self.activity_count % 100 == 0:  # 每100次活动清理一次
                     self.cleanup_old_logs()
@@ -302,6 +331,7 @@ class SmartProxyMonitor:
         status = {
             "proxy_active": self.proxy_active,
             "last_activity": self.last_activity.isoformat() if self.last_activity else None,
+            "proxy_stats": self.last_stats,
             "activity_count": self.activity_count,
             "config": self.config,
             "timestamp": datetime.now().isoformat()
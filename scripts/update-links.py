@@ -1,41 +1,39 @@
 #!/usr/bin/env python3
-import csv
-import os
-import re
+import argparse
 from pathlib import Path
 
+from link_rewrite import (
+    DEFAULT_CHUNK_SIZE,
+    LiteralLinkRewriter, LinkRewriter,
+    format_summary, load_csv_mapping, rewrite_file, rewrite_files,
+)
+from mapping_store import DEFAULT_STORE, load_store_mapping
+
 def load_mapping(csv_file):
-    mapping = {}
-    if os.path.exists(csv_file):
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if len(row) >= 2:
-                    mapping[row[0]] = row[1]
-    return mapping
+    return load_csv_mapping(csv_file) if Path(csv_file).exists() else {}
 
 def update_links_in_file(file_path, mapping):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    original_content = content
-    
-    for local_path, cdn_url in mapping.items():
-        content = content.replace(local_path, cdn_url)
-    
-    if content != original_content:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        print(f"已更新: {file_path}")
-        return True
-    return False
+    return rewrite_file(file_path, LiteralLinkRewriter(mapping))
 
 def main():
+    parser = argparse.ArgumentParser(description='根据映射表更新文章中的媒体链接')
+    parser.add_argument('--full', action='store_true', help='忽略清单，全量处理所有文件')
+    parser.add_argument('--manifest', default='.media_links_manifest.json', help='增量处理清单路径')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='并行处理的进程数')
+    parser.add_argument('--stream', action='store_true', help='分块流式处理，内存占用与文件大小无关')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='流式模式的分块大小（字符数）')
+    args = parser.parse_args()
+    
     content_dir = Path('hugo/content')
     
     print("加载链接映射表...")
-    inline_mapping = load_mapping('media/inline-mapping.csv')
-    notebooklm_mapping = load_mapping('media/notebooklm-mapping.csv')
+    inline_mapping, notebooklm_mapping = {}, {}
+    if Path(DEFAULT_STORE).exists():
+        inline_mapping = load_store_mapping(f"{DEFAULT_STORE}#inline")
+        notebooklm_mapping = load_store_mapping(f"{DEFAULT_STORE}#notebooklm")
+    if not inline_mapping and not notebooklm_mapping:
+        inline_mapping = load_mapping('media/inline-mapping.csv')
+        notebooklm_mapping = load_mapping('media/notebooklm-mapping.csv')
     
     all_mapping = {**inline_mapping, **notebooklm_mapping}
     
@@ -45,12 +43,12 @@ def main():
     
     print(f"找到 {len(all_mapping)} 个映射")
     
-    updated_count = 0
-    for md_file in content_dir.rglob('*.md'):
-        if update_links_in_file(md_file, all_mapping):
-            updated_count += 1
-    
-    print(f"\n更新完成！共更新 {updated_count} 个文件")
+    results, elapsed, skipped_count = rewrite_files(
+        content_dir.rglob('*.md'), LinkRewriter(link_mapping=all_mapping),
+        manifest_path=args.manifest, full=args.full, jobs=args.jobs,
+        stream=args.stream, chunk_size=args.chunk_size
+    )
+    print(f"\n更新完成！{format_summary(results, elapsed)}，跳过 {skipped_count} 个未变化文件")
 
 if __name__ == '__main__':
     main()
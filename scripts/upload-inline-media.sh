@@ -8,29 +8,17 @@ CDN_DOMAIN="cdn.yourdomain.com"
 
 echo "开始上传辅助性媒体文件到R2..."
 
-echo "上传辅助性图片..."
-for file in media/inline/images/**/*; do
-  if [ -f "$file" ]; then
-    rel_path=${file#media/}
-    echo "上传: $file"
-    aws s3 cp "$file" "s3://$R2_BUCKET/$rel_path" \
-      --endpoint-url "https://$R2_ENDPOINT" \
-      --acl public-read
-    echo "$file,https://$CDN_DOMAIN/$rel_path" >> media/inline-mapping.csv
-  fi
-done
-
-echo "上传PDF文件..."
-for file in media/inline/pdfs/**/*; do
-  if [ -f "$file" ]; then
-    rel_path=${file#media/}
-    echo "上传: $file"
-    aws s3 cp "$file" "s3://$R2_BUCKET/$rel_path" \
-      --endpoint-url "https://$R2_ENDPOINT" \
-      --acl public-read
-    echo "$file,https://$CDN_DOMAIN/$rel_path" >> media/inline-mapping.csv
-  fi
-done
+# 图片与 PDF 一起并发上传（共享连接池），映射写入映射库并导出去重后的映射表
+python3 scripts/r2_upload.py media/inline/images media/inline/pdfs \
+  --endpoint-url "https://$R2_ENDPOINT" \
+  --bucket "$R2_BUCKET" \
+  --public-domain "https://$CDN_DOMAIN" \
+  --root media \
+  --mapping-key path \
+  --acl public-read \
+  --workers "${UPLOAD_WORKERS:-8}" \
+  --namespace inline \
+  --export media/inline-mapping.csv
 
 echo "辅助性媒体文件上传完成！"
-echo "链接映射表已保存到: media/inline-mapping.csv"
+echo "链接映射表已保存到: link_mapping.db (inline)，导出: media/inline-mapping.csv"
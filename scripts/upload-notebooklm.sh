@@ -8,43 +8,43 @@ CDN_DOMAIN="cdn.yourdomain.com"
 
 echo "开始上传NotebookLM内容到R2..."
 
+# 并发上传（共享连接池），映射写入映射库，全部完成后导出去重后的映射表
 echo "上传NotebookLM视频..."
-for file in media/notebooklm/**/video/*; do
-  if [ -f "$file" ]; then
-    rel_path=${file#media/}
-    echo "上传: $file"
-    aws s3 cp "$file" "s3://$R2_BUCKET/$rel_path" \
-      --endpoint-url "https://$R2_ENDPOINT" \
-      --acl public-read \
-      --content-type "video/mp4"
-    echo "$file,https://$CDN_DOMAIN/$rel_path" >> media/notebooklm-mapping.csv
-  fi
-done
+python3 scripts/r2_upload.py 'media/notebooklm/**/video/*' \
+  --endpoint-url "https://$R2_ENDPOINT" \
+  --bucket "$R2_BUCKET" \
+  --public-domain "https://$CDN_DOMAIN" \
+  --root media \
+  --mapping-key path \
+  --acl public-read \
+  --workers "${UPLOAD_WORKERS:-8}" \
+  --namespace notebooklm \
+  --content-type "video/mp4" \
+  --faststart
 
 echo "上传NotebookLM音频..."
-for file in media/notebooklm/**/audio/*; do
-  if [ -f "$file" ]; then
-    rel_path=${file#media/}
-    echo "上传: $file"
-    aws s3 cp "$file" "s3://$R2_BUCKET/$rel_path" \
-      --endpoint-url "https://$R2_ENDPOINT" \
-      --acl public-read \
-      --content-type "audio/mpeg"
-    echo "$file,https://$CDN_DOMAIN/$rel_path" >> media/notebooklm-mapping.csv
-  fi
-done
+python3 scripts/r2_upload.py 'media/notebooklm/**/audio/*' \
+  --endpoint-url "https://$R2_ENDPOINT" \
+  --bucket "$R2_BUCKET" \
+  --public-domain "https://$CDN_DOMAIN" \
+  --root media \
+  --mapping-key path \
+  --acl public-read \
+  --workers "${UPLOAD_WORKERS:-8}" \
+  --namespace notebooklm \
+  --content-type "audio/mpeg"
 
 echo "上传信息图..."
-for file in media/notebooklm/**/infographics/*; do
-  if [ -f "$file" ]; then
-    rel_path=${file#media/}
-    echo "上传: $file"
-    aws s3 cp "$file" "s3://$R2_BUCKET/$rel_path" \
-      --endpoint-url "https://$R2_ENDPOINT" \
-      --acl public-read
-    echo "$file,https://$CDN_DOMAIN/$rel_path" >> media/notebooklm-mapping.csv
-  fi
-done
+python3 scripts/r2_upload.py 'media/notebooklm/**/infographics/*' \
+  --endpoint-url "https://$R2_ENDPOINT" \
+  --bucket "$R2_BUCKET" \
+  --public-domain "https://$CDN_DOMAIN" \
+  --root media \
+  --mapping-key path \
+  --acl public-read \
+  --workers "${UPLOAD_WORKERS:-8}" \
+  --namespace notebooklm
 
 echo "NotebookLM内容上传完成！"
-echo "链接映射表已保存到: media/notebooklm-mapping.csv"
+python3 scripts/mapping_store.py export notebooklm media/notebooklm-mapping.csv
+echo "链接映射表已保存到: link_mapping.db (notebooklm)，导出: media/notebooklm-mapping.csv"
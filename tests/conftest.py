@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+scripts/ 下的模块以脚本方式导入（不是包），测试时把它加入 sys.path
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
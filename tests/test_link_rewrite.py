@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+link_rewrite 单次扫描替换器、流式模式、增量清单与并行处理的测试
+"""
+
+import io
+import json
+import os
+import random
+
+import pytest
+
+from fileutil import atomic_write_text
+from link_rewrite import (FAILED, UNCHANGED, UPDATED, LinkManifest, LinkRewriter, LiteralLinkRewriter,
+                          VideoLinkRewriter, rewrite_file, rewrite_files, run_file_jobs, stream_rewrite, stream_rewrite_file)
+
+CDN = 'https://cdn.example.com/videos/tian/a.mp4'
+
+@pytest.fixture
+def rewriter():
+    return VideoLinkRewriter({'videos/tian/a.mp4': CDN})
+
+@pytest.mark.parametrize('text, expected', [
+    ('[视频](videos/tian/a.mp4)', f'[视频]({CDN})'),
+    ('<video src="videos/tian/a.mp4"></video>', f'<video src="{CDN}"></video>'),
+    ('见 videos/tian/a.mp4 结尾', f'见 {CDN} 结尾'),
+])
+def test_rewrites_each_pattern(rewriter, text, expected):
+    assert rewriter.rewrite(text) == (expected, 1)
+
+@pytest.mark.parametrize('text, expected', [
+    # 中文正文与路径之间没有分隔字符：只能替换路径本身，不能吞掉前面的文字
+    ('中文中文videos/tian/a.mp4。', f'中文中文{CDN}。'),
+    ('说明：videos/tian/a.mp4，后文', f'说明：{CDN}，后文'),
+    ('（videos/tian/a.mp4）', f'（{CDN}）'),
+])
+def test_bare_path_in_cjk_prose_keeps_surrounding_text(rewriter, text, expected):
+    assert rewriter.rewrite(text) == (expected, 1)
+
+@pytest.mark.parametrize('text, expected', [
+    ('[视频](/videos/tian/a.mp4)', f'[视频]({CDN})'),
+    ('[视频](../static/videos/tian/a.mp4)', f'[视频]({CDN})'),
+    ('中文../static/videos/tian/a.mp4。', f'中文{CDN}。'),
+])
+def test_path_prefix_is_replaced_with_the_link(rewriter, text, expected):
+    assert rewriter.rewrite(text) == (expected, 1)
+
+@pytest.mark.parametrize('text', [
+    '[视频](videos/tian/a.mp4)',
+    '<video src="videos/tian/a.mp4"></video>',
+    '中文中文videos/tian/a.mp4。',
+    '见 videos/tian/a.mp4 结尾',
+])
+def test_rewrite_is_idempotent_when_cdn_url_contains_the_key(rewriter, text):
+    once, _ = rewriter.rewrite(text)
+    assert rewriter.rewrite(once) == (once, 0)
+
+def test_unmapped_links_are_left_alone(rewriter):
+    text = '[视频](videos/other.mp4) 与 videos/other.webm'
+    assert rewriter.rewrite(text) == (text, 0)
+
+def test_finditer_matches_plain_regex_scan(rewriter):
+    text = '中文中文videos/tian/a.mp4。[视频](b.mp4) src="c.mov" 段落里没有空格的文字x.mkv结尾 (d.avi)'
+    expected = [m.span() for m in rewriter.link_re.finditer(text)]
+    assert [m.span() for m in rewriter.finditer(text)] == expected
+
+def test_link_rewriter_applies_video_then_literal_mappings():
+    rewriter = LinkRewriter({'a.mp4': 'https://cdn/a.mp4'}, {'img/b.png': 'https://cdn/b.png'})
+    content, count = rewriter.rewrite('[视频](a.mp4) ![](img/b.png)')
+    assert content == '[视频](https://cdn/a.mp4) ![](https://cdn/b.png)'
+    assert count == 2
+
+def test_literal_overlapping_keys_use_the_longest_match():
+    rewriter = LiteralLinkRewriter({'img/a.png': 'https://cdn/a.png', 'img/a.png.webp': 'https://cdn/a.webp'})
+    assert rewriter.rewrite('![](img/a.png.webp) ![](img/a.png)') == (
+        '![](https://cdn/a.webp) ![](https://cdn/a.png)', 2)
+
+def test_literal_replacements_are_not_chained():
+    # 逐条 str.replace 会把 a 先换成 b 再换成 c；单次扫描只替换原文中的路径
+    rewriter = LiteralLinkRewriter({'img/a.png': 'img/b.png', 'img/b.png': 'img/c.png'})
+    once, count = rewriter.rewrite('img/a.png img/b.png')
+    assert (once, count) == ('img/b.png img/c.png', 2)
+    output = io.StringIO()
+    assert stream_rewrite(io.StringIO('img/a.png img/b.png'), output, rewriter, 3) == 2
+    assert output.getvalue() == once
+
+def _random_document(rng, keys, length):
+    """
+    由中文正文、标点、空白与各种形式的链接随机拼成的文档
+    """
+    pieces = []
+    while sum(map(len, pieces)) < length:
+        key = rng.choice(keys + ['videos/unmapped.mp4'])
+        pieces.append(rng.choice([
+            '中文正文' * rng.randint(1, 20),
+            rng.choice(['。', '，', ' ', '\n', '（', '）', '：']),
+            f'[视频]({key})',
+            f'<video src="{key}"></video>',
+            f'见{key}',
+            f' {key} ',
+            f'![](img/{rng.randint(0, 3)}.png)',
+        ]))
+    return ''.join(pieces)
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 4096])
+def test_streaming_rewrite_matches_in_memory_rewrite(chunk_size):
+    rng = random.Random(chunk_size)
+    video = {f'videos/tian/{index}.mp4': f'https://cdn/v/{index}.mp4' for index in range(5)}
+    links = {f'img/{index}.png': f'https://cdn/i/{index}.png' for index in range(3)}
+    rewriter = LinkRewriter(video, links)
+    for _ in range(5):
+        text = _random_document(rng, list(video), 3000)
+        expected, expected_count = rewriter.rewrite(text)
+        output = io.StringIO()
+        count = stream_rewrite(io.StringIO(text), output, rewriter, chunk_size)
+        assert output.getvalue() == expected
+        assert count == expected_count
+
+def test_stream_rewrite_file_matches_rewrite_file(tmp_path):
+    rng = random.Random(0)
+    rewriter = LinkRewriter({'videos/tian/a.mp4': CDN}, {'img/0.png': 'https://cdn/i/0.png'})
+    text = _random_document(rng, ['videos/tian/a.mp4'], 20000)
+    in_memory, streamed = tmp_path / 'a.md', tmp_path / 'b.md'
+    in_memory.write_text(text, encoding='utf-8')
+    streamed.write_text(text, encoding='utf-8')
+    assert rewrite_file(in_memory, rewriter) == UPDATED
+    assert stream_rewrite_file(streamed, rewriter, chunk_size=256) == UPDATED
+    assert streamed.read_bytes() == in_memory.read_bytes()
+    assert stream_rewrite_file(streamed, rewriter, chunk_size=256) == UNCHANGED
+
+@pytest.fixture
+def content(tmp_path):
+    """
+    三篇文章：a 引用 a.mp4，b 引用 b.mp4，c 没有视频
+    """
+    files = {}
+    for name, body in (('a', '[视频](videos/a.mp4)'), ('b', '见 videos/b.mp4 结尾'), ('c', '纯文本')):
+        path = tmp_path / f'{name}.md'
+        path.write_text(body, encoding='utf-8')
+        files[name] = str(path)
+    return files
+
+def run_incremental(content, mapping, manifest_path, full=False):
+    """
+    返回本次实际处理的文章名
+    """
+    results, _, skipped = rewrite_files(sorted(content.values()), LinkRewriter(mapping), manifest_path, full=full)
+    names = {path: name for name, path in content.items()}
+    processed = sorted(names[path] for path, _ in results)
+    assert skipped == len(content) - len(processed)
+    return processed
+
+def test_manifest_skips_unchanged_files(content, tmp_path):
+    manifest = str(tmp_path / 'manifest.json')
+    mapping = {'videos/a.mp4': 'https://cdn/a.mp4'}
+    assert run_incremental(content, mapping, manifest) == ['a', 'b', 'c']
+    assert run_incremental(content, mapping, manifest) == []
+
+def test_manifest_ignores_mtime_only_changes(content, tmp_path):
+    manifest = str(tmp_path / 'manifest.json')
+    mapping = {'videos/a.mp4': 'https://cdn/a.mp4'}
+    run_incremental(content, mapping, manifest)
+    os.utime(content['c'], ns=(1, 1))
+    assert run_incremental(content, mapping, manifest) == []
+    # 刷新后的修改时间已写回清单，下次不必再计算哈希
+    with open(manifest, encoding='utf-8') as f:
+        assert json.load(f)['files'][content['c']]['mtime_ns'] == 1
+
+def test_manifest_reprocesses_edited_files(content, tmp_path):
+    manifest = str(tmp_path / 'manifest.json')
+    mapping = {'videos/a.mp4': 'https://cdn/a.mp4'}
+    run_incremental(content, mapping, manifest)
+    with open(content['c'], 'a', encoding='utf-8') as f:
+        f.write('\n[视频](videos/a.mp4)')
+    assert run_incremental(content, mapping, manifest) == ['c']
+    assert 'https://cdn/a.mp4' in open(content['c'], encoding='utf-8').read()
+
+def test_manifest_reprocesses_only_files_using_changed_mapping(content, tmp_path):
+    manifest = str(tmp_path / 'manifest.json')
+    mapping = {'videos/a.mp4': 'https://cdn/a.mp4'}
+    run_incremental(content, mapping, manifest)
+    mapping['videos/b.mp4'] = 'https://cdn/b.mp4'
+    assert run_incremental(content, mapping, manifest) == ['b']
+    assert open(content['b'], encoding='utf-8').read() == '见 https://cdn/b.mp4 结尾'
+    # 删除映射条目不影响已替换的内容
+    del mapping['videos/a.mp4']
+    assert run_incremental(content, mapping, manifest) == []
+
+def test_manifest_full_and_version_change_reprocess_everything(content, tmp_path):
+    manifest = str(tmp_path / 'manifest.json')
+    mapping = {'videos/a.mp4': 'https://cdn/a.mp4'}
+    run_incremental(content, mapping, manifest)
+    assert run_incremental(content, mapping, manifest, full=True) == ['a', 'b', 'c']
+
+    with open(manifest, encoding='utf-8') as f:
+        data = json.load(f)
+    data['version'] = LinkManifest.VERSION - 1
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    assert run_incremental(content, mapping, manifest) == ['a', 'b', 'c']
+
+def test_manifest_drops_deleted_files(content, tmp_path):
+    manifest = str(tmp_path / 'manifest.json')
+    run_incremental(content, {}, manifest)
+    os.remove(content['c'])
+    del content['c']
+    run_incremental(content, {}, manifest)
+    with open(manifest, encoding='utf-8') as f:
+        assert sorted(json.load(f)['files']) == sorted(content.values())
+
+def test_parallel_jobs_match_serial_run(tmp_path):
+    rng = random.Random(1)
+    video = {f'videos/tian/{index}.mp4': f'https://cdn/v/{index}.mp4' for index in range(5)}
+    rewriter = LinkRewriter(video)
+    outputs = {}
+    for jobs in (1, 3):
+        directory = tmp_path / f'jobs{jobs}'
+        directory.mkdir()
+        for index in range(12):
+            text = _random_document(random.Random(index), list(video), 500) if index % 4 else '无链接'
+            (directory / f'{index}.md').write_text(text, encoding='utf-8')
+        files = sorted(str(path) for path in directory.iterdir())
+        results, _, _ = rewrite_files(files, rewriter, jobs=jobs)
+        outputs[jobs] = ([(os.path.basename(path), status) for path, status in results],
+                         [open(path, encoding='utf-8').read() for path in files])
+    assert outputs[1] == outputs[3]
+    assert {status for _, status in outputs[1][0]} == {UPDATED, UNCHANGED}
+
+def _raise_for_b(file_path):
+    if file_path.endswith('b.md'):
+        raise ValueError('boom')
+    return UNCHANGED
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_worker_exception_is_recorded_as_failed(jobs):
+    results, _ = run_file_jobs(['a.md', 'b.md', 'c.md'], _raise_for_b, jobs=jobs)
+    assert results == [('a.md', UNCHANGED), ('b.md', FAILED), ('c.md', UNCHANGED)]
+
+def test_atomic_write_keeps_mode_and_leaves_no_temp_files(tmp_path):
+    path = tmp_path / 'a.md'
+    path.write_text('旧内容', encoding='utf-8')
+    path.chmod(0o640)
+    atomic_write_text(path, '新内容')
+    assert path.read_text(encoding='utf-8') == '新内容'
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ['a.md']
+
+def test_failed_atomic_write_keeps_original(tmp_path):
+    path = tmp_path / 'a.md'
+    path.write_text('旧内容', encoding='utf-8')
+    with pytest.raises(UnicodeEncodeError):
+        atomic_write_text(path, '无法编码的代理项 \ud800')
+    assert path.read_text(encoding='utf-8') == '旧内容'
+    assert os.listdir(tmp_path) == ['a.md']
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+mapping_store SQLite 映射库的测试
+"""
+
+import json
+
+import pytest
+
+from link_rewrite import load_mapping_source, merge_mapping_sources
+from mapping_store import MappingStore
+
+@pytest.fixture
+def store(tmp_path):
+    with MappingStore(str(tmp_path / 'links.db')) as store:
+        yield store
+
+def test_upsert_and_get(store):
+    assert store.get('video', 'tian/a.mp4') is None
+    store.upsert('video', 'tian/a.mp4', 'https://cdn/a.mp4')
+    store.upsert('video', 'tian/a.mp4', 'https://cdn/a2.mp4')
+    assert store.get('video', 'tian/a.mp4') == 'https://cdn/a2.mp4'
+    assert store.get('inline', 'tian/a.mp4') is None
+    assert store.counts() == {'video': 1}
+
+def test_upsert_many_counts_only_changed_rows(store):
+    assert store.upsert_many('video', [('a.mp4', 'https://cdn/a'), ('b.mp4', 'https://cdn/b')]) == 2
+    assert store.upsert_many('video', [('a.mp4', 'https://cdn/a'), ('b.mp4', 'https://cdn/b2')]) == 1
+    assert store.load('video') == {'a.mp4': 'https://cdn/a', 'b.mp4': 'https://cdn/b2'}
+
+def test_namespaces_are_separate(store):
+    store.upsert('video', 'a.mp4', 'https://cdn/v/a.mp4')
+    store.upsert('inline', 'a.png', 'https://cdn/i/a.png')
+    store.delete('video', 'missing.mp4')
+    assert store.load('video') == {'a.mp4': 'https://cdn/v/a.mp4'}
+    assert store.load() == {'a.png': 'https://cdn/i/a.png', 'a.mp4': 'https://cdn/v/a.mp4'}
+    store.delete('video', 'a.mp4')
+    assert store.counts() == {'inline': 1}
+
+def test_import_deduplicates_and_export_round_trips(store, tmp_path):
+    txt = tmp_path / 'video_url_mapping.txt'
+    txt.write_text('a.mp4|https://cdn/old\nb.mp4|https://cdn/b\n无分隔的行\na.mp4|https://cdn/a\n', encoding='utf-8')
+    csv_file = tmp_path / 'inline.csv'
+    csv_file.write_text('"x,1.png",https://cdn/x\n', encoding='utf-8')
+    json_file = tmp_path / 'notebooklm.json'
+    json_file.write_text(json.dumps({'n.pdf': 'https://cdn/n'}), encoding='utf-8')
+
+    assert store.import_file('video', str(txt)) == 2
+    assert store.import_file('video', str(txt)) == 0
+    assert store.import_file('inline', str(csv_file)) == 1
+    assert store.import_file('notebooklm', str(json_file)) == 1
+
+    exported_txt, exported_csv = tmp_path / 'out.txt', tmp_path / 'out.csv'
+    assert store.export_file('video', str(exported_txt)) == 2
+    assert exported_txt.read_text(encoding='utf-8') == 'a.mp4|https://cdn/a\nb.mp4|https://cdn/b\n'
+    assert store.export_file('inline', str(exported_csv)) == 1
+    assert load_mapping_source(str(exported_csv)) == {'x,1.png': 'https://cdn/x'}
+
+def test_store_as_mapping_source(store):
+    store.upsert('video', 'a.mp4', 'https://cdn/v/a.mp4')
+    store.upsert('inline', 'a.png', 'https://cdn/i/a.png')
+    assert load_mapping_source(f'{store.path}#video') == {'a.mp4': 'https://cdn/v/a.mp4'}
+    assert load_mapping_source(store.path) == {'a.mp4': 'https://cdn/v/a.mp4', 'a.png': 'https://cdn/i/a.png'}
+    assert merge_mapping_sources([f'{store.path}#video', f'{store.path}#missing']) == {'a.mp4': 'https://cdn/v/a.mp4'}
+
+def test_missing_store_file_is_empty_source(tmp_path):
+    assert load_mapping_source(str(tmp_path / 'missing.db') + '#video') == {}
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+mp4_faststart 偏移修正的测试：每个块偏移在处理后必须仍指向同样的数据
+"""
+
+import struct
+
+import pytest
+
+from mp4_faststart import FaststartError, faststart, faststart_cached, needs_faststart, read_top_level_atoms
+
+CONTAINERS = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+
+def atom(kind, payload):
+    return struct.pack('>I4s', len(payload) + 8, kind) + payload
+
+def chunk_table(kind, offsets):
+    width = 'Q' if kind == b'co64' else 'I'
+    return atom(kind, struct.pack(f'>II{len(offsets)}{width}', 0, len(offsets), *offsets))
+
+def moov(tables):
+    traks = b''.join(
+        atom(b'trak', atom(b'mdia', atom(b'minf', atom(b'stbl', chunk_table(kind, offsets)))))
+        for kind, offsets in tables
+    )
+    return atom(b'moov', atom(b'mvhd', bytes(100)) + traks)
+
+def chunk_offsets(data, start=0, end=None):
+    """
+    按顺序返回文件中所有 stco/co64 的偏移列表
+    """
+    end = len(data) if end is None else end
+    tables = []
+    while start < end:
+        size, kind = struct.unpack_from('>I4s', data, start)
+        if kind in CONTAINERS:
+            tables += chunk_offsets(data, start + 8, start + size)
+        elif kind in (b'stco', b'co64'):
+            count = struct.unpack_from('>I', data, start + 12)[0]
+            width = 'Q' if kind == b'co64' else 'I'
+            tables.append(list(struct.unpack_from(f'>{count}{width}', data, start + 16)))
+        start += size
+    return tables
+
+def build_file(layout, chunks, kinds=None):
+    """
+    按 layout 拼接顶层原子；chunks 为 {mdat 名: [块数据]}，moov 的偏移表指向这些块
+    （mdat 名以 mdat 开头，如 mdat2，以区分多个 mdat 原子）
+
+    moov 的大小与偏移值无关，先用占位偏移确定布局，再填入真实偏移。
+    """
+    kinds = kinds or [b'stco'] * len(chunks)
+    mdats = {name: atom(b'mdat', b''.join(data)) for name, data in chunks.items()}
+
+    def assemble(tables):
+        parts, positions, offset = [], {}, 0
+        for name in layout:
+            if name == 'moov':
+                part = moov(tables)
+            elif name in mdats:
+                positions[name] = offset
+                part = mdats[name]
+            else:
+                part = atom(name.encode(), bytes(24))
+            parts.append(part)
+            offset += len(part)
+        return b''.join(parts), positions
+
+    placeholder = [(kind, [0] * len(data)) for kind, data in zip(kinds, chunks.values())]
+    _, positions = assemble(placeholder)
+    tables = []
+    for kind, (name, data) in zip(kinds, chunks.items()):
+        offsets, offset = [], positions[name] + 8
+        for block in data:
+            offsets.append(offset)
+            offset += len(block)
+        tables.append((kind, offsets))
+    return assemble(tables)[0]
+
+def assert_same_chunks(original, processed):
+    before, after = chunk_offsets(original), chunk_offsets(processed)
+    assert len(before) == len(after)
+    for old_table, new_table in zip(before, after):
+        for old, new in zip(old_table, new_table):
+            assert processed[new:new + 16] == original[old:old + 16]
+
+def top_level(path):
+    with open(path, 'rb') as f:
+        return [kind for kind, _, _ in read_top_level_atoms(f)]
+
+CHUNKS = [bytes([index]) * 16 + bytes(7) for index in range(1, 6)]
+TAIL_CHUNKS = [bytes([0x80 + index]) * 16 for index in range(3)]
+
+@pytest.mark.parametrize('layout, chunks, kinds', [
+    (['ftyp', 'mdat', 'moov'], {'mdat': CHUNKS}, None),
+    (['ftyp', 'mdat', 'moov'], {'mdat': CHUNKS}, [b'co64']),
+    # moov 之后还有原子与第二个 mdat：其数据随旧 moov 的移除而前移
+    (['ftyp', 'mdat', 'moov', 'free', 'mdat2'], {'mdat': CHUNKS, 'mdat2': TAIL_CHUNKS}, None),
+    (['ftyp', 'free', 'mdat', 'moov', 'udta', 'mdat2'], {'mdat': CHUNKS, 'mdat2': TAIL_CHUNKS}, [b'stco', b'co64']),
+])
+def test_chunk_offsets_point_to_same_data(tmp_path, layout, chunks, kinds):
+    original = build_file(layout, chunks, kinds)
+    source, output = tmp_path / 'in.mp4', tmp_path / 'out.mp4'
+    source.write_bytes(original)
+
+    assert needs_faststart(str(source))
+    assert faststart(str(source), str(output))
+    processed = output.read_bytes()
+
+    assert len(processed) == len(original)
+    kinds_out = top_level(str(output))
+    assert kinds_out.index(b'moov') < kinds_out.index(b'mdat')
+    assert not needs_faststart(str(output))
+    assert_same_chunks(original, processed)
+
+def test_already_faststart_is_left_alone(tmp_path):
+    source = tmp_path / 'in.mp4'
+    source.write_bytes(build_file(['ftyp', 'moov', 'mdat'], {'mdat': CHUNKS}))
+    assert not faststart(str(source), str(tmp_path / 'out.mp4'))
+    assert faststart_cached(str(source), cache_dir=str(tmp_path / 'cache')) == str(source)
+
+def test_offset_inside_moov_is_rejected(tmp_path):
+    data = bytearray(build_file(['ftyp', 'mdat', 'moov'], {'mdat': CHUNKS}))
+    moov_offset = data.index(b'moov') - 4
+    # 把第一个块偏移改为指向 moov 内部
+    stco = data.index(b'stco')
+    struct.pack_into('>I', data, stco + 12, moov_offset + 8)
+    source = tmp_path / 'in.mp4'
+    source.write_bytes(bytes(data))
+    with pytest.raises(FaststartError):
+        faststart(str(source), str(tmp_path / 'out.mp4'))
+
+def test_cached_result_is_reused(tmp_path):
+    source = tmp_path / 'in.mp4'
+    source.write_bytes(build_file(['ftyp', 'mdat', 'moov'], {'mdat': CHUNKS}))
+    cache_dir = str(tmp_path / 'cache')
+    first = faststart_cached(str(source), cache_dir=cache_dir)
+    assert first != str(source)
+    assert faststart_cached(str(source), cache_dir=cache_dir) == first
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_api 的测试（需要 Flask 与 requests）
+"""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('requests')
+
+import proxy_api
+from proxy_events import EventBroker
+from proxy_jobs import Job, JobManager
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = proxy_api.ProxyManager()
+    calls = []
+
+    def execute_command(action):
+        calls.append(action)
+        return {"success": action != "stop", "output": "", "error": f"{action} failed" if action == "stop" else ""}
+
+    monkeypatch.setattr(manager, 'execute_command', execute_command)
+    monkeypatch.setattr(manager, 'check_health', lambda: True)
+    manager.calls = calls
+    return manager
+
+def test_restart_does_not_start_when_stop_fails(manager):
+    job = Job('restart')
+    success, message = manager.run_restart(job)
+    assert not success and message == "代理服务停止失败"
+    assert manager.calls == ["stop"]
+    assert "stop failed" in job.error
+
+def test_activate_mode_probes_only_on_demand(monkeypatch):
+    manager = proxy_api.ProxyManager(health_ttl=0.01)
+    probes = []
+    monkeypatch.setattr(proxy_api, 'activator_running', lambda pid_file=proxy_api.PID_FILE: True)
+    monkeypatch.setattr(manager, '_probe', lambda: probes.append(1))
+    # 后台探测线程不会随测试结束，不能真的启动
+    monkeypatch.setattr(manager, 'start_prober', lambda: None)
+
+    status = manager.snapshot()
+    assert status["probe_mode"] == "on_demand" and status["age_seconds"] is None
+    assert probes == []
+    assert manager.is_running()
+
+    manager.snapshot(refresh=True)
+    assert probes == [1]
+
+@pytest.fixture
+def api(monkeypatch):
+    """
+    用模块级 app 与全新的任务队列；命令在 release 放行前一直阻塞
+    """
+    manager = proxy_api.proxy_manager
+    api = SimpleNamespace(client=proxy_api.app.test_client(), release=threading.Event(), calls=[], running=False)
+
+    def execute_command(action):
+        api.calls.append(action)
+        api.release.wait(5)
+        return {"success": True, "output": f"{action} ok\n", "error": ""}
+
+    monkeypatch.setattr(manager, 'status', dict(manager.status))
+    monkeypatch.setattr(manager, 'execute_command', execute_command)
+    monkeypatch.setattr(manager, 'check_health', lambda: True)
+    monkeypatch.setattr(manager, 'start_prober', lambda: None)
+    monkeypatch.setattr(manager, 'is_running', lambda: api.running)
+    monkeypatch.setattr(proxy_api, 'job_manager', JobManager({
+        "start": manager.run_start,
+        "stop": manager.run_stop,
+        "restart": manager.run_restart,
+    }))
+    yield api
+    api.release.set()
+    # 任务线程要在 monkeypatch 还原前结束，否则还没开始的步骤会执行真实的 on_demand_proxy.sh
+    worker = proxy_api.job_manager.worker
+    if worker is not None:
+        worker.join(5)
+
+def wait_for_job(client, job_id):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['success'] is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"任务 {job_id} 未结束")
+
+@pytest.mark.parametrize('action, running, commands', [
+    ('start', False, ['start']),
+    ('stop', True, ['stop']),
+    ('restart', True, ['stop', 'start']),
+])
+def test_lifecycle_post_returns_job_and_coalesces(api, action, running, commands):
+    api.running = running
+    first = api.client.post(f'/api/proxy/{action}')
+    assert first.status_code == 202
+    body = first.get_json()
+    assert body['success'] and not body['coalesced']
+    assert body['status_url'] == f"/api/jobs/{body['job_id']}"
+
+    second = api.client.post(f'/api/proxy/{action}')
+    assert second.status_code == 202
+    assert second.get_json()['coalesced'] and second.get_json()['job_id'] == body['job_id']
+
+    api.release.set()
+    job = wait_for_job(api.client, body['job_id'])
+    assert job['success'] and job['action'] == action
+    assert api.calls == commands
+
+def test_start_when_running_does_not_submit(api):
+    api.running = True
+    response = api.client.post('/api/proxy/start')
+    assert response.status_code == 200 and not response.get_json()['success']
+    assert proxy_api.job_manager.recent() == []
+
+def test_unknown_job_is_404(api):
+    response = api.client.get('/api/jobs/0123456789ab')
+    assert response.status_code == 404
+    assert not response.get_json()['success']
+
+def parse_frame(frame):
+    fields = dict(line.split(': ', 1) for line in frame.decode().strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+def test_status_change_event_does_not_probe(api, monkeypatch):
+    manager = proxy_api.proxy_manager
+    probes = []
+    monkeypatch.setattr(manager, 'check_health', lambda: probes.append(1))
+    monkeypatch.setattr(manager, 'probed_at', None)
+    monkeypatch.setattr(proxy_api, 'event_broker', EventBroker())
+    subscriber = proxy_api.event_broker.subscribe()
+
+    manager.set_status(active=False, health_status="stopped")
+    health = parse_frame(subscriber.get_nowait().encode())
+    status = parse_frame(subscriber.get_nowait().encode())
+    assert health == ('health', {'from': 'unknown', 'to': 'stopped', 'timestamp': health[1]['timestamp']})
+    assert status[0] == 'status'
+    assert status[1]['proxy']['health_status'] == 'stopped' and status[1]['proxy']['age_seconds'] is None
+    assert probes == []
+
+def test_events_stream_starts_with_status_and_running_jobs(api, monkeypatch):
+    monkeypatch.setattr(proxy_api, 'event_broker', EventBroker())
+    job_id = api.client.post('/api/proxy/start').get_json()['job_id']
+
+    response = api.client.get('/api/events')
+    assert response.mimetype == 'text/event-stream'
+    frames = response.iter_encoded()
+    assert next(frames).startswith(b'retry: ')
+    event, data = parse_frame(next(frames))
+    assert event == 'status' and data['proxy']['probe_mode'] == 'background'
+    event, data = parse_frame(next(frames))
+    assert event == 'job' and data['id'] == job_id
+
+    proxy_api.proxy_manager.set_status(active=True, health_status="healthy")
+    assert [parse_frame(next(frames))[0] for _ in range(2)] == ['health', 'status']
+    response.close()
+    assert proxy_api.event_broker.subscribers == set()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_cache 响应缓存的测试
+"""
+
+import os
+import time
+
+import pytest
+
+from proxy_cache import ResponseCache, freshness_lifetime, parse_range
+
+URL = 'http://cdn.example.com:80/videos/a.mp4'
+
+def store(cache, body, headers, request_headers=None, url=URL, status=200):
+    headers = list(headers) + [('Content-Length', str(len(body)))]
+    writer = cache.open_writer('GET', url, request_headers or {}, status, 'OK', headers)
+    if writer is None:
+        return False
+    for offset in range(0, len(body), 1000):
+        writer.write(body[offset:offset + 1000])
+    return writer.commit()
+
+def read_hit(cache, request_headers=None, method='GET'):
+    entry, fresh = cache.lookup(method, URL, request_headers or {})
+    assert entry is not None
+    status, _, headers, body = cache.hit_response(entry, method, request_headers or {})
+    return fresh, status, dict(headers), b''.join(body or [])
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / 'cache'), memory_size=10000, memory_object_size=4000,
+                         disk_size=50000, max_object_size=30000)
+
+def test_freshness_lifetime_precedence():
+    now = time.time()
+    assert freshness_lifetime(200, [('Cache-Control', 'max-age=60, s-maxage=600')], now) == 600
+    assert freshness_lifetime(200, [('Cache-Control', 'max-age=60'), ('Expires', 'Thu, 01 Jan 2099 00:00:00 GMT')], now) == 60
+    assert freshness_lifetime(200, [('Expires', '0')], now) == 0
+    date = 'Sun, 06 Nov 1994 08:49:37 GMT'
+    assert freshness_lifetime(200, [('Date', date), ('Last-Modified', 'Sun, 06 Nov 1994 07:49:37 GMT')], now) == 360
+
+@pytest.mark.parametrize('value, expected', [
+    ('bytes=0-99', (0, 100)),
+    ('bytes=100-', (100, 900)),
+    ('bytes=-100', (900, 100)),
+    ('bytes=900-5000', (900, 100)),
+    ('bytes=1000-', False),
+    ('bytes=0-1,5-6', None),
+    ('items=0-1', None),
+])
+def test_parse_range(value, expected):
+    assert parse_range(value, 1000) == expected
+
+def test_memory_hit_range_and_conditional(cache):
+    body = os.urandom(3000)
+    assert store(cache, body, [('Cache-Control', 'max-age=60'), ('ETag', '"v1"')])
+    fresh, status, headers, data = read_hit(cache)
+    assert (fresh, status, data, headers['X-Cache']) == (True, 200, body, 'HIT')
+
+    _, status, headers, data = read_hit(cache, {'range': 'bytes=10-19'})
+    assert (status, data, headers['Content-Range']) == (206, body[10:20], 'bytes 10-19/3000')
+    assert read_hit(cache, {'range': 'bytes=5000-'})[1] == 416
+    assert read_hit(cache, {'if-none-match': 'W/"v1"'})[1] == 304
+    assert cache.stats()['memory_entries'] == 1
+
+def test_large_objects_go_to_disk_and_survive_restart(cache, tmp_path):
+    body = os.urandom(20000)
+    assert store(cache, body, [('Cache-Control', 'max-age=60')])
+    assert cache.stats()['disk_entries'] == 1
+    restarted = ResponseCache(str(tmp_path / 'cache'), memory_size=10000, memory_object_size=4000,
+                              disk_size=50000, max_object_size=30000)
+    _, status, _, data = read_hit(restarted)
+    assert (status, data) == (200, body)
+
+def test_disk_lru_eviction(cache):
+    for index in range(3):
+        assert store(cache, os.urandom(20000), [('Cache-Control', 'max-age=60')], url=f'{URL}?{index}')
+    stats = cache.stats()
+    assert stats['disk_entries'] == 2 and stats['evicted'] == 1
+    assert cache.lookup('GET', f'{URL}?0', {})[0] is None
+    assert len([name for name in os.listdir(cache.cache_dir) if name.endswith('.body')]) == 2
+
+@pytest.mark.parametrize('headers, request_headers', [
+    ([('Cache-Control', 'max-age=60, private')], {}),
+    ([('Cache-Control', 'no-store')], {}),
+    ([('Cache-Control', 'max-age=60'), ('Set-Cookie', 'a=1')], {}),
+    ([('Cache-Control', 'max-age=60'), ('Vary', '*')], {}),
+    ([('Cache-Control', 'max-age=60')], {'authorization': 'Bearer x'}),
+    ([], {}),
+])
+def test_uncacheable_responses(cache, headers, request_headers):
+    assert not store(cache, b'x' * 10, headers, request_headers)
+
+def test_truncated_or_oversized_bodies_are_not_stored(cache):
+    writer = cache.open_writer('GET', URL, {}, 200, 'OK', [('Cache-Control', 'max-age=60'), ('Content-Length', '100')])
+    writer.write(b'x' * 50)
+    assert not writer.commit()
+    assert not store(cache, os.urandom(40000), [('Cache-Control', 'max-age=60')])
+    assert cache.lookup('GET', URL, {})[0] is None
+    assert [name for name in os.listdir(cache.cache_dir)] == []
+
+def test_stale_entry_revalidates_with_validators(cache):
+    assert store(cache, b'body', [('Cache-Control', 'max-age=0'), ('ETag', '"v1"'),
+                                  ('Last-Modified', 'Sun, 06 Nov 1994 08:49:37 GMT')])
+    entry, fresh = cache.lookup('GET', URL, {'range': 'bytes=0-1'})
+    assert entry is not None and not fresh
+    drop, extra = cache.upstream_headers('GET', {}, entry)
+    assert 'range' in drop and 'if-none-match' in drop
+    assert ('If-None-Match', '"v1"') in extra
+
+    cache.freshen(entry, [('Cache-Control', 'max-age=60'), ('Content-Length', '0')])
+    fresh, status, headers, data = read_hit(cache)
+    assert (fresh, status, data) == (True, 200, b'body')
+    assert headers['Cache-Control'] == 'max-age=60'
+    assert cache.stats()['revalidated'] == 1
+
+def test_vary_and_unsafe_methods(cache):
+    assert store(cache, b'gzip', [('Cache-Control', 'max-age=60'), ('Vary', 'Accept-Encoding')],
+                 {'accept-encoding': 'gzip'})
+    assert cache.lookup('GET', URL, {'accept-encoding': 'gzip'})[0] is not None
+    assert cache.lookup('GET', URL, {'accept-encoding': 'br'})[0] is None
+    assert cache.lookup('POST', URL, {}) == (None, False)
+    assert cache.lookup('GET', URL, {'accept-encoding': 'gzip'})[0] is None
+
+def test_full_range_request_is_fetched_without_range(cache):
+    drop, extra = cache.upstream_headers('GET', {'range': 'bytes=0-'}, None)
+    assert drop == {'range'} and extra == []
+    assert cache.upstream_headers('GET', {'range': 'bytes=10-'}, None) == (set(), [])
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_dns 解析缓存与 Happy Eyeballs 连接的测试（getaddrinfo 用假实现代替）
+"""
+
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+import proxy_dns
+from proxy_dns import Resolver, interleave_families
+
+def info(family, address, port=80):
+    sockaddr = (address, port, 0, 0) if family == socket.AF_INET6 else (address, port)
+    return (family, socket.SOCK_STREAM, 6, '', sockaddr)
+
+class FakeGetaddrinfo:
+    """
+    按主机名返回预设结果并记录调用；gate 非空时每次解析都等它放行
+    """
+
+    def __init__(self, answers, gate=None):
+        self.answers = answers
+        self.gate = gate
+        self.calls = []
+        self.real = socket.getaddrinfo
+
+    def __call__(self, host, port, *args, **kwargs):
+        if kwargs.get('flags') == socket.AI_NUMERICHOST:
+            return self.real(host, port, *args, **kwargs)
+        self.calls.append(host)
+        if self.gate is not None:
+            self.gate.wait(5)
+        answer = self.answers[host]
+        if isinstance(answer, Exception):
+            raise answer
+        return [info(family, address, port) for family, address in answer]
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeGetaddrinfo({
+        'cdn.example.com': [(socket.AF_INET, '192.0.2.1'), (socket.AF_INET, '192.0.2.2'),
+                            (socket.AF_INET6, '2001:db8::1')],
+        'missing.example.com': socket.gaierror(socket.EAI_NONAME, 'Name or service not known'),
+    })
+    monkeypatch.setattr(proxy_dns.socket, 'getaddrinfo', fake)
+    return fake
+
+def test_interleave_families():
+    infos = [info(socket.AF_INET6, '2001:db8::1'), info(socket.AF_INET6, '2001:db8::2'),
+             info(socket.AF_INET, '192.0.2.1'), info(socket.AF_INET, '192.0.2.2'), info(socket.AF_INET, '192.0.2.3')]
+    assert [item[4][0] for item in interleave_families(infos)] == [
+        '2001:db8::1', '192.0.2.1', '2001:db8::2', '192.0.2.2', '192.0.2.3']
+
+def test_positive_and_negative_results_are_cached(fake):
+    resolver = Resolver(ttl=60, negative_ttl=60)
+    first = resolver.resolve('cdn.example.com', 443)
+    assert [item[4][0] for item in first] == ['192.0.2.1', '2001:db8::1', '192.0.2.2']
+    assert resolver.resolve('cdn.example.com', 443) == first
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            resolver.resolve('missing.example.com', 443)
+    assert fake.calls == ['cdn.example.com', 'missing.example.com']
+    stats = resolver.stats()
+    assert (stats['hits'], stats['negative_hits'], stats['misses'], stats['failures']) == (1, 1, 2, 1)
+
+def test_ip_literals_and_zero_ttl_bypass_cache(fake):
+    resolver = Resolver(ttl=0)
+    assert resolver.resolve('127.0.0.1', 80)[0][4] == ('127.0.0.1', 80)
+    resolver.resolve('cdn.example.com', 80)
+    resolver.resolve('cdn.example.com', 80)
+    assert fake.calls == ['cdn.example.com', 'cdn.example.com']
+    assert resolver.stats()['entries'] == 0
+
+def test_entries_expire_and_are_evicted(fake):
+    resolver = Resolver(ttl=0.05, max_entries=1)
+    resolver.resolve('cdn.example.com', 80)
+    time.sleep(0.1)
+    resolver.resolve('cdn.example.com', 80)
+    resolver.resolve('cdn.example.com', 443)
+    stats = resolver.stats()
+    assert (stats['lookups'], stats['expired'], stats['evicted'], stats['entries']) == (3, 1, 1, 1)
+
+def test_concurrent_lookups_are_coalesced(fake):
+    fake.gate = threading.Event()
+    resolver = Resolver()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(resolver.resolve('cdn.example.com', 80)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while resolver.stats()['misses'] < 4:
+        time.sleep(0.01)
+    fake.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert fake.calls == ['cdn.example.com']
+    assert len(results) == 4 and all(result == results[0] for result in results)
+    assert resolver.stats()['coalesced'] == 3
+
+@pytest.mark.parametrize('error, expected', [
+    (UnicodeError('label too long'), socket.gaierror),
+    (RuntimeError('resolver broken'), RuntimeError),
+])
+def test_concurrent_lookup_errors_reach_every_caller(fake, error, expected):
+    host = 'a' * 70 + '.com'
+    fake.answers[host] = error
+    fake.gate = threading.Event()
+    resolver = Resolver()
+    errors = []
+
+    def resolve():
+        try:
+            resolver.resolve(host, 80)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=resolve) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while resolver.stats()['misses'] < 2:
+        time.sleep(0.01)
+    fake.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert [type(e) for e in errors] == [expected, expected]
+    assert fake.calls == [host]
+
+def test_concurrent_async_lookups_are_coalesced(fake):
+    resolver = Resolver()
+
+    async def scenario():
+        return await asyncio.gather(*(resolver.resolve_async('cdn.example.com', 80) for _ in range(3)),
+                                    resolver.resolve_async('missing.example.com', 80),
+                                    return_exceptions=True)
+
+    *results, error = asyncio.run(scenario())
+    assert isinstance(error, socket.gaierror)
+    assert sorted(fake.calls) == ['cdn.example.com', 'missing.example.com']
+    assert all(result == results[0] for result in results)
+
+@pytest.fixture
+def fallback(monkeypatch):
+    """
+    第一个地址拒绝连接、第二个地址在监听
+    """
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.2', 0))
+        refused = probe.getsockname()[1]
+    answers = [info(socket.AF_INET, '127.0.0.2', refused), info(socket.AF_INET, '127.0.0.1', port)]
+    monkeypatch.setattr(proxy_dns.socket, 'getaddrinfo', lambda host, *args, **kwargs: list(answers))
+    yield port
+    listener.close()
+
+def test_create_connection_falls_back_and_prefers_working_address(fallback):
+    resolver = Resolver()
+    sock = resolver.create_connection(('origin.example.com', fallback), timeout=5)
+    assert sock.getpeername() == ('127.0.0.1', fallback)
+    assert sock.gettimeout() == 5
+    sock.close()
+    assert resolver.resolve('origin.example.com', fallback)[0][4] == ('127.0.0.1', fallback)
+    assert resolver.stats()['fallbacks'] == 1
+
+def test_open_connection_falls_back(fallback):
+    resolver = Resolver()
+
+    async def scenario():
+        reader, writer = await resolver.open_connection('origin.example.com', fallback)
+        peer = writer.get_extra_info('peername')
+        writer.close()
+        await writer.wait_closed()
+        return peer
+
+    assert asyncio.run(scenario()) == ('127.0.0.1', fallback)
+    assert resolver.resolve('origin.example.com', fallback)[0][4] == ('127.0.0.1', fallback)
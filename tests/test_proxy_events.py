@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_events SSE 推送的测试
+"""
+
+import json
+
+from proxy_events import RETRY_MS, EventBroker, format_event
+
+def parse(message):
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    fields['data'] = json.loads(fields['data'])
+    return fields
+
+def test_format_event():
+    message = format_event('status', {'active': True, 'message': '代理运行中'}, 7)
+    assert message.endswith('\n\n')
+    assert parse(message) == {'id': '7', 'event': 'status', 'data': {'active': True, 'message': '代理运行中'}}
+
+def test_stream_sends_retry_initial_events_and_published_messages():
+    broker = EventBroker(heartbeat=5)
+    subscriber = broker.subscribe()
+    stream = broker.stream(subscriber, initial=[('status', {'active': False})])
+    assert next(stream) == f"retry: {RETRY_MS}\n\n"
+    assert parse(next(stream))['data'] == {'active': False}
+
+    broker.publish('job', {'id': 'a'})
+    broker.publish('health', {'to': 'healthy'})
+    assert [parse(next(stream))['id'] for _ in range(2)] == ['1', '2']
+    stream.close()
+    assert broker.subscribers == set()
+
+def test_publish_reaches_every_subscriber():
+    broker = EventBroker()
+    subscribers = [broker.subscribe() for _ in range(3)]
+    broker.publish('status', {'active': True})
+    assert {subscriber.get_nowait() for subscriber in subscribers} == {format_event('status', {'active': True}, 1)}
+
+def test_idle_stream_sends_keepalive():
+    broker = EventBroker(heartbeat=0.05)
+    stream = broker.stream(broker.subscribe())
+    next(stream)
+    assert next(stream) == ": keepalive\n\n"
+
+def test_slow_subscriber_is_disconnected():
+    broker = EventBroker(queue_size=2)
+    slow, fast = broker.subscribe(), broker.subscribe()
+    stream = broker.stream(slow)
+    next(stream)
+    for index in range(3):
+        broker.publish('job', {'index': index})
+        fast.get_nowait()
+    # 队列写满后积压被丢弃，连接收到结束标记
+    assert list(stream) == []
+    assert broker.subscribers == {fast}
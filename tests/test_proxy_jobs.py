@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_jobs 后台任务队列的测试
+"""
+
+import threading
+import time
+
+import pytest
+
+from proxy_jobs import JOB_FAILED, JOB_SUCCEEDED, JobManager
+
+def wait_done(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.done:
+        assert time.monotonic() < deadline, "任务未在限定时间内结束"
+        time.sleep(0.01)
+
+def test_duplicate_submissions_coalesce_onto_running_job():
+    release = threading.Event()
+    runs = []
+
+    def start(job):
+        runs.append(job.id)
+        release.wait(5)
+        return True, "ok"
+
+    manager = JobManager({'start': start})
+    first, first_coalesced = manager.submit('start')
+    second, second_coalesced = manager.submit('start')
+    assert second is first and not first_coalesced and second_coalesced
+    release.set()
+    wait_done(first)
+    assert runs == [first.id]
+    assert first.to_dict()['state'] == JOB_SUCCEEDED
+
+def test_different_actions_run_in_submission_order():
+    order = []
+
+    def handler(name):
+        def run(job):
+            order.append(name)
+            job.progress(name)
+            time.sleep(0.05)
+            return True, name
+        return run
+
+    manager = JobManager({'stop': handler('stop'), 'start': handler('start')})
+    stop, _ = manager.submit('stop')
+    start, _ = manager.submit('start')
+    wait_done(start)
+    assert order == ['stop', 'start']
+    assert stop.finished_at <= start.started_at
+    assert [step['message'] for step in start.to_dict()['steps']] == ['start']
+
+def test_handler_failure_and_exception_mark_job_failed():
+    manager = JobManager({
+        'stop': lambda job: (False, "停止失败"),
+        'start': lambda job: 1 / 0,
+    })
+    stop, _ = manager.submit('stop')
+    start, _ = manager.submit('start')
+    wait_done(start)
+    assert stop.state == JOB_FAILED and stop.message == "停止失败"
+    assert start.state == JOB_FAILED and 'ZeroDivisionError' in start.message
+
+def test_unknown_action_is_rejected():
+    with pytest.raises(ValueError):
+        JobManager({}).submit('start')
+
+def test_finished_jobs_are_trimmed_to_history():
+    manager = JobManager({'start': lambda job: (True, "ok")}, history=2)
+    jobs = []
+    for _ in range(4):
+        job, _ = manager.submit('start')
+        wait_done(job)
+        jobs.append(job)
+    time.sleep(0.05)
+    assert manager.get(jobs[0].id) is None
+    assert [job.id for job in manager.recent()] == [job.id for job in jobs[-2:]]
+
+def test_on_update_sees_every_state_change():
+    states = []
+    manager = JobManager({'start': lambda job: (True, "ok")}, on_update=lambda job: states.append(job.state))
+    job, _ = manager.submit('start')
+    wait_done(job)
+    time.sleep(0.05)
+    assert states[0] == 'queued' and 'running' in states and states[-1] == JOB_SUCCEEDED
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_limits 准入控制的测试
+"""
+
+import asyncio
+import threading
+import time
+
+from proxy_limits import (LIMIT_CONNECTIONS, LIMIT_PER_IP, LIMIT_TUNNELS, OVERLOAD_BODY, AdmissionControl,
+                          overload_response)
+
+def test_overload_response():
+    response = overload_response(LIMIT_TUNNELS)
+    head, _, body = response.partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 503 ')
+    assert b'X-Proxy-Limit: tunnels' in head and b'Retry-After: 1' in head
+    assert f'Content-Length: {len(OVERLOAD_BODY)}'.encode() in head
+    assert body == OVERLOAD_BODY
+
+def test_per_ip_limit_rejects_immediately():
+    admission = AdmissionControl(max_connections=10, max_per_ip=2, queue_timeout=5)
+    assert admission.acquire_connection('10.0.0.1') is None
+    assert admission.acquire_connection('10.0.0.1') is None
+    started = time.monotonic()
+    assert admission.acquire_connection('10.0.0.1') == LIMIT_PER_IP
+    assert time.monotonic() - started < 0.5
+    assert admission.acquire_connection('10.0.0.2') is None
+    admission.release_connection('10.0.0.1')
+    assert admission.acquire_connection('10.0.0.1') is None
+    stats = admission.stats()
+    assert (stats['connections'], stats['client_ips'], stats['rejected'][LIMIT_PER_IP]) == (3, 2, 1)
+
+def test_full_server_queues_until_release():
+    admission = AdmissionControl(max_connections=1, queue_timeout=5)
+    assert admission.acquire_connection('a') is None
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(admission.acquire_connection('b')))
+    waiter.start()
+    while admission.stats()['queued'] == 0:
+        time.sleep(0.01)
+    admission.release_connection('a')
+    waiter.join(5)
+    assert result == [None]
+    stats = admission.stats()
+    assert (stats['connections'], stats['queued'], stats['peak_connections']) == (1, 0, 1)
+
+def test_queue_timeout_rejects():
+    admission = AdmissionControl(max_connections=1, queue_timeout=0.2)
+    admission.acquire_connection('a')
+    started = time.monotonic()
+    assert admission.acquire_connection('b') == LIMIT_CONNECTIONS
+    assert 0.15 <= time.monotonic() - started < 2
+    assert AdmissionControl(max_connections=1, queue_timeout=0).acquire_connection('x') is None
+
+def test_async_queue_wakes_on_release_and_times_out():
+    async def scenario():
+        admission = AdmissionControl(max_connections=1, queue_timeout=0.3)
+        assert await admission.acquire_connection_async('a') is None
+        waiter = asyncio.ensure_future(admission.acquire_connection_async('b'))
+        await asyncio.sleep(0.05)
+        assert admission.stats()['queued'] == 1
+        admission.release_connection('a')
+        assert await waiter is None
+        started = time.monotonic()
+        assert await admission.acquire_connection_async('c') == LIMIT_CONNECTIONS
+        assert time.monotonic() - started >= 0.25
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['rejected'][LIMIT_CONNECTIONS] == 1
+    assert stats['queued'] == 0
+
+def test_tunnel_limit():
+    admission = AdmissionControl(max_tunnels=1)
+    assert admission.acquire_tunnel()
+    assert not admission.acquire_tunnel()
+    admission.release_tunnel()
+    assert admission.acquire_tunnel()
+    assert admission.stats()['rejected'][LIMIT_TUNNELS] == 1
+
+def test_zero_limits_mean_unlimited():
+    admission = AdmissionControl(max_connections=0, max_tunnels=0, max_per_ip=0)
+    for _ in range(100):
+        assert admission.acquire_connection('a') is None
+        assert admission.acquire_tunnel()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_pool 上游连接池的测试
+"""
+
+import os
+import resource
+import socket
+
+import pytest
+
+from proxy_pool import UpstreamPool
+
+class FakeConnection:
+    """
+    只具备连接池用到的属性的 HTTPConnection 替身
+    """
+
+    def __init__(self, sock, host='origin', port=80):
+        self.sock = sock
+        self.host = host
+        self.port = port
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+def test_idle_connection_is_reused(pair):
+    pool = UpstreamPool()
+    conn = FakeConnection(pair[0])
+    pool.release(conn)
+    reused, is_reused = pool.acquire('origin', 80)
+    assert reused is conn and is_reused
+    assert pool.stats()['hits'] == 1
+
+def test_connection_closed_by_peer_is_evicted(pair):
+    pool = UpstreamPool()
+    conn = FakeConnection(pair[0])
+    pool.release(conn)
+    pair[1].close()
+    fresh, is_reused = pool.acquire('origin', 80)
+    assert fresh is not conn and not is_reused
+    assert pool.stats()['evicted'] == 1 and conn.sock is None
+
+def test_unsolicited_data_evicts_connection(pair):
+    pool = UpstreamPool()
+    conn = FakeConnection(pair[0])
+    pool.release(conn)
+    pair[1].sendall(b'HTTP/1.1 408 Request Timeout\r\n\r\n')
+    _, is_reused = pool.acquire('origin', 80)
+    assert not is_reused
+
+def test_descriptor_above_fd_setsize_is_still_reused(pair):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = 1500
+    if soft <= target:
+        if hard != resource.RLIM_INFINITY and hard <= target:
+            pytest.skip("RLIMIT_NOFILE 太低，无法创建大于 1024 的描述符")
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target + 1, hard))
+    os.dup2(pair[0].fileno(), target)
+    high = socket.socket(fileno=target)
+    try:
+        pool = UpstreamPool()
+        conn = FakeConnection(high)
+        pool.release(conn)
+        reused, is_reused = pool.acquire('origin', 80)
+        assert reused is conn and is_reused
+    finally:
+        high.close()
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
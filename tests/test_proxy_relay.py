@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_relay 隧道转发的测试
+
+client_app ⇄ [client | relay | upstream] ⇄ server_app，两段都是本机 TCP 连接。
+"""
+
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from proxy_relay import relay, splice_available
+
+MODES = ['copy', pytest.param('splice', marks=pytest.mark.skipif(not splice_available(), reason='需要 os.splice'))]
+
+def tcp_pair(listener):
+    a = socket.create_connection(listener.getsockname())
+    b, _ = listener.accept()
+    return a, b
+
+@pytest.fixture
+def sockets():
+    listener = socket.create_server(('127.0.0.1', 0))
+    client_app, client = tcp_pair(listener)
+    upstream, server_app = tcp_pair(listener)
+    listener.close()
+    yield client_app, client, upstream, server_app
+    for sock in (client_app, client, upstream, server_app):
+        sock.close()
+
+def start_relay(client, upstream, **options):
+    result = {}
+
+    def run():
+        result['totals'] = relay(client, upstream, **options)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, result
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+def recv_until_eof(sock):
+    data = b''
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+@pytest.mark.parametrize('mode', MODES)
+def test_relay_forwards_both_directions_and_half_close(sockets, mode):
+    client_app, client, upstream, server_app = sockets
+    counted = [0, 0]
+    counters = (lambda n: counted.__setitem__(0, counted[0] + n), lambda n: counted.__setitem__(1, counted[1] + n))
+    thread, result = start_relay(client, upstream, mode=mode, buffer_size=4096, initial=b'GET ', counters=counters)
+
+    request = os.urandom(1 << 20)
+    sender = threading.Thread(target=lambda: (client_app.sendall(request), client_app.shutdown(socket.SHUT_WR)))
+    sender.start()
+    assert recv_until_eof(server_app) == b'GET ' + request
+    sender.join()
+
+    response = os.urandom(300000)
+    server_app.sendall(response)
+    server_app.shutdown(socket.SHUT_WR)
+    assert recv_until_eof(client_app) == response
+
+    thread.join(5)
+    assert not thread.is_alive()
+    assert result['totals'] == (len(request) + 4, len(response))
+    # initial 是调用方从 rfile 读出的数据（读入时已计数），计数回调只统计转发的块
+    assert counted == [len(request), len(response)]
+
+@pytest.mark.parametrize('mode', MODES)
+def test_idle_tunnel_is_closed(sockets, mode):
+    client_app, client, upstream, server_app = sockets
+    started = time.monotonic()
+    thread, _ = start_relay(client, upstream, mode=mode, idle_timeout=0.3)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert 0.25 <= time.monotonic() - started < 3
+    assert server_app.recv(1) == b''
+
+@pytest.mark.parametrize('mode', MODES)
+def test_traffic_in_one_direction_keeps_tunnel_open(sockets, mode):
+    client_app, client, upstream, server_app = sockets
+    thread, _ = start_relay(client, upstream, mode=mode, idle_timeout=0.3)
+    # 只有下行流量，上行方向的读超时不能关闭隧道
+    for _ in range(8):
+        server_app.sendall(b'tick')
+        assert recv_exactly(client_app, 4) == b'tick'
+        time.sleep(0.1)
+    assert thread.is_alive()
+    client_app.shutdown(socket.SHUT_WR)
+    server_app.shutdown(socket.SHUT_WR)
+    thread.join(5)
+    assert not thread.is_alive()
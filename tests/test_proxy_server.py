@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_server 的测试
+
+后半部分对两种引擎做端到端测试：在子进程中启动代理，经它访问本机的 HTTP 源站
+与 TCP 回显服务。
+"""
+
+import http.client
+import http.server
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from proxy_server import LOCAL_RESPONSE_BODY, is_loopback, local_response
+
+def fake_snapshot(include_connections=False):
+    data = {'requests_total': 3}
+    if include_connections:
+        data['connections'] = [{'peer': ['203.0.113.7', 50000], 'tunnel': 'example.com:443'}]
+    return data
+
+@pytest.mark.parametrize('host, expected', [
+    ('127.0.0.1', True),
+    ('::1', True),
+    ('::ffff:127.0.0.1', True),
+    ('192.168.31.20', False),
+    ('203.0.113.7', False),
+    (None, False),
+])
+def test_is_loopback(host, expected):
+    assert is_loopback(host) is expected
+
+def test_stats_connection_detail_for_loopback_client():
+    body, content_type = local_response('/stats?connections=1', fake_snapshot, '127.0.0.1')
+    assert content_type == 'application/json'
+    assert 'connections' in json.loads(body)
+
+@pytest.mark.parametrize('client_host', ['192.168.31.20', '203.0.113.7', None])
+def test_stats_connection_detail_hidden_from_remote_clients(client_host):
+    body, _ = local_response('/stats?connections=1', fake_snapshot, client_host)
+    data = json.loads(body)
+    assert data == {'requests_total': 3}
+
+def test_other_local_paths_return_fixed_text():
+    assert local_response('/', fake_snapshot, '203.0.113.7')[0] == LOCAL_RESPONSE_BODY
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+PROXY_SERVER = os.path.join(SCRIPTS, 'proxy_server.py')
+PROXY_ACTIVATOR = os.path.join(SCRIPTS, 'proxy_activator.py')
+
+class OriginHandler(http.server.BaseHTTPRequestHandler):
+    """
+    本机源站：/chunked 以 chunked 编码返回，POST 原样返回请求体，其余路径返回路径本身
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/slow':
+            # 第一块发出后等客户端确认收到，再发送剩余部分
+            self.send_response(200)
+            self.send_header('Content-Length', '10')
+            self.end_headers()
+            self.wfile.write(b'first')
+            self.wfile.flush()
+            self.server.first_chunk_seen.wait(5)
+            self.wfile.write(b'-last')
+            return
+        if self.path == '/chunked':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for part in (b'hello ', b'chunked ', b'world'):
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(part), part))
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        self.send_body(f"path={self.path} host={self.headers.get('Host')}".encode())
+
+    def do_POST(self):
+        self.send_body(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+    def send_body(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class EchoHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            self.request.sendall(data)
+
+def start_server(server):
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+@pytest.fixture(scope='module')
+def origin():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), OriginHandler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.first_chunk_seen = threading.Event()
+    yield start_server(server)
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(scope='module')
+def echo():
+    server = start_server(socketserver.ThreadingTCPServer(('127.0.0.1', 0), EchoHandler))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, process, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"代理进程已退出: {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"代理未在 {timeout} 秒内监听端口 {port}")
+
+def run_proxy(engine, *options):
+    """
+    在子进程中启动代理，返回 (进程, 端口)
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, PROXY_SERVER, str(port), '--host', '127.0.0.1', '--engine', engine, *options],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, process)
+    except BaseException:
+        process.kill()
+        process.wait(10)
+        raise
+    return process, port
+
+def stop_proxy(process):
+    process.terminate()
+    process.wait(10)
+
+@pytest.fixture(scope='module', params=['asyncio', 'threaded'])
+def proxy(request):
+    process, port = run_proxy(request.param)
+    yield port
+    stop_proxy(process)
+
+def origin_url(origin, path):
+    return f"http://127.0.0.1:{origin.server_address[1]}{path}"
+
+def test_get_through_proxy(proxy, origin):
+    conn = http.client.HTTPConnection('127.0.0.1', proxy, timeout=10)
+    conn.request('GET', origin_url(origin, '/videos/a.mp4?x=1'))
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.read() == f"path=/videos/a.mp4?x=1 host=127.0.0.1:{origin.server_address[1]}".encode()
+    conn.close()
+
+def test_keep_alive_reuses_client_and_upstream_connections(proxy, origin):
+    conn = http.client.HTTPConnection('127.0.0.1', proxy, timeout=10)
+    before = origin.connections
+    for index in range(3):
+        conn.request('GET', origin_url(origin, f'/{index}'))
+        response = conn.getresponse()
+        assert response.read().startswith(f"path=/{index} ".encode())
+        assert not response.will_close
+    # 第一次请求可能复用之前测试留在池里的连接，最多新建一个上游连接
+    assert origin.connections - before <= 1
+    conn.close()
+
+def test_chunked_response_is_relayed(proxy, origin):
+    conn = http.client.HTTPConnection('127.0.0.1', proxy, timeout=10)
+    conn.request('GET', origin_url(origin, '/chunked'))
+    assert conn.getresponse().read() == b'hello chunked world'
+    conn.close()
+
+def test_response_is_streamed_before_upstream_finishes(proxy, origin):
+    origin.first_chunk_seen.clear()
+    conn = http.client.HTTPConnection('127.0.0.1', proxy, timeout=10)
+    conn.request('GET', origin_url(origin, '/slow'))
+    response = conn.getresponse()
+    started = time.monotonic()
+    # 代理若缓冲整个响应，这里要等到源站 5 秒超时后才能读到
+    assert response.read1(5) == b'first'
+    assert time.monotonic() - started < 2
+    origin.first_chunk_seen.set()
+    assert response.read() == b'-last'
+    conn.close()
+
+def test_post_body_is_forwarded(proxy, origin):
+    body = os.urandom(200000)
+    conn = http.client.HTTPConnection('127.0.0.1', proxy, timeout=10)
+    conn.request('POST', origin_url(origin, '/upload'), body=body)
+    assert conn.getresponse().read() == body
+    conn.close()
+
+def test_local_request_is_answered_by_proxy(proxy):
+    conn = http.client.HTTPConnection('127.0.0.1', proxy, timeout=10)
+    conn.request('GET', '/')
+    assert conn.getresponse().read() == LOCAL_RESPONSE_BODY
+    conn.close()
+
+def fetch_stats(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/stats?connections=1')
+    data = json.loads(conn.getresponse().read())
+    conn.close()
+    return data
+
+def test_stats_count_proxied_traffic_but_not_local_requests(proxy, origin):
+    before = fetch_stats(proxy)
+    conn = http.client.HTTPConnection('127.0.0.1', proxy, timeout=10)
+    conn.request('GET', origin_url(origin, '/counted'))
+    body = conn.getresponse().read()
+    conn.close()
+
+    after = fetch_stats(proxy)
+    assert after['requests_total'] - before['requests_total'] == 1
+    assert after['bytes_out'] - before['bytes_out'] > len(body)
+    assert after['local_requests'] - before['local_requests'] == 1
+    assert after['idle_seconds'] < 5
+    # 本机请求可以看到连接明细
+    assert 'connections' in after
+
+def read_head(sock):
+    data = b''
+    while b'\r\n\r\n' not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    head, _, rest = data.partition(b'\r\n\r\n')
+    return head, rest
+
+def test_connect_tunnel(proxy, echo):
+    target = f"127.0.0.1:{echo.server_address[1]}"
+    with socket.create_connection(('127.0.0.1', proxy), timeout=10) as sock:
+        sock.sendall(f"CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n\r\n".encode())
+        head, rest = read_head(sock)
+        assert head.split(b' ')[1] == b'200'
+        assert rest == b''
+        payload = os.urandom(300000)
+        sock.sendall(payload)
+        received = b''
+        while len(received) < len(payload):
+            chunk = sock.recv(65536)
+            assert chunk
+            received += chunk
+        assert received == payload
+
+def test_connect_to_closed_port_returns_502(proxy):
+    target = f"127.0.0.1:{free_port()}"
+    with socket.create_connection(('127.0.0.1', proxy), timeout=10) as sock:
+        sock.sendall(f"CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n\r\n".encode())
+        head, _ = read_head(sock)
+        assert head.split(b' ')[1] == b'502'
+
+@pytest.mark.parametrize('value', ['abc', '-1', '1.5', '10, 10'])
+def test_invalid_content_length_returns_400(proxy, origin, value):
+    url = origin_url(origin, '/upload')
+    with socket.create_connection(('127.0.0.1', proxy), timeout=10) as sock:
+        sock.sendall(f"POST {url} HTTP/1.1\r\nHost: {url[7:].split('/')[0]}\r\n"
+                     f"Content-Length: {value}\r\n\r\nbody".encode())
+        head, _ = read_head(sock)
+        assert head.split(b' ')[1] == b'400'
+    # 代理仍然正常工作
+    conn = http.client.HTTPConnection('127.0.0.1', proxy, timeout=10)
+    conn.request('POST', url, body=b'ok')
+    assert conn.getresponse().read() == b'ok'
+    conn.close()
+
+def admitted_connection(port, url, timeout=5):
+    """
+    返回已完成一次请求的 keep-alive 连接；之前的连接可能还未被代理释放，503 时重试
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        conn.request('GET', url)
+        response = conn.getresponse()
+        response.read()
+        if response.status == 200:
+            return conn
+        conn.close()
+        assert response.status == 503 and time.monotonic() < deadline
+        time.sleep(0.05)
+
+@pytest.mark.parametrize('engine', ['asyncio', 'threaded'])
+def test_per_ip_limit_returns_503(engine, origin):
+    process, port = run_proxy(engine, '--max-per-ip', '1')
+    try:
+        held = admitted_connection(port, origin_url(origin, '/held'))
+        rejected = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        rejected.request('GET', origin_url(origin, '/rejected'))
+        response = rejected.getresponse()
+        assert response.status == 503
+        assert response.getheader('X-Proxy-Limit') == 'per_ip'
+        assert response.getheader('Retry-After') == '1'
+        rejected.close()
+
+        held.close()
+        admitted_connection(port, origin_url(origin, '/retry')).close()
+    finally:
+        stop_proxy(process)
+
+@pytest.mark.parametrize('engine', ['asyncio', 'threaded'])
+def test_workers_share_port_and_aggregate_stats(engine, origin):
+    process, port = run_proxy(engine, '--workers', '2')
+    try:
+        for index in range(10):
+            admitted_connection(port, origin_url(origin, f'/w{index}')).close()
+        # 等待各 worker 把计数发布到共享内存
+        deadline = time.monotonic() + 5
+        while True:
+            stats = fetch_stats(port)
+            if stats['requests_total'] >= 10 or time.monotonic() > deadline:
+                break
+            time.sleep(0.1)
+        assert stats['requests_total'] >= 10
+        assert len(stats['workers']) == 2
+        assert len({worker['pid'] for worker in stats['workers']}) == 2
+    finally:
+        stop_proxy(process)
+
+def test_activator_starts_proxy_on_demand_and_restarts_after_idle_exit(origin):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, PROXY_ACTIVATOR, str(port), '--host', '127.0.0.1', '--idle-exit', '1'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, process)
+        admitted_connection(port, origin_url(origin, '/cold')).close()
+        first = fetch_stats(port)
+        assert first['requests_total'] == 1
+
+        # 只有本地请求（/stats）不算流量，代理空闲 1 秒后退出，端口仍由激活器持有
+        time.sleep(2.5)
+        admitted_connection(port, origin_url(origin, '/warm')).close()
+        second = fetch_stats(port)
+        assert second['started_at'] > first['started_at']
+        assert second['requests_total'] == 1
+    finally:
+        stop_proxy(process)
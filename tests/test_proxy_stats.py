@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+proxy_stats 流量统计的测试
+"""
+
+import io
+import time
+
+from proxy_stats import CountingFile, ProxyStats
+
+def test_counters_include_active_and_closed_connections():
+    stats = ProxyStats()
+    first = stats.open_connection(('192.168.31.20', 50000))
+    second = stats.open_connection(('192.168.31.21', 50001))
+    for conn, size in ((first, 100), (second, 7)):
+        conn.request_started()
+        conn.add_in(size)
+        conn.add_out(size * 2)
+        conn.request_finished()
+    stats.close_connection(first)
+    stats.close_connection(first)
+
+    data = stats.snapshot(include_connections=True)
+    assert (data['connections_total'], data['active_connections']) == (2, 1)
+    assert (data['requests_total'], data['bytes_in'], data['bytes_out']) == (2, 107, 214)
+    assert [conn['peer'] for conn in data['connections']] == ['192.168.31.21:50001']
+
+def test_idle_seconds_tracks_proxy_traffic_only():
+    stats = ProxyStats()
+    stats.started_at -= 100
+    assert stats.snapshot()['idle_seconds'] >= 100
+
+    # 本地请求（健康检查、/stats）不算流量
+    stats.local_request()
+    assert stats.snapshot()['idle_seconds'] >= 100
+    assert stats.snapshot()['local_requests'] == 1
+
+    conn = stats.open_connection(('127.0.0.1', 1))
+    conn.request_started()
+    time.sleep(0.05)
+    assert stats.snapshot()['idle_seconds'] == 0
+    conn.request_finished()
+    assert 0 <= stats.snapshot()['idle_seconds'] < 1
+
+def test_tunnel_bytes_refresh_activity():
+    stats = ProxyStats()
+    conn = stats.open_connection(('127.0.0.1', 1))
+    conn.tunnel_opened('example.com:443')
+    data = stats.snapshot()
+    assert (data['tunnels_total'], data['active_tunnels'], data['idle_seconds']) == (1, 1, 0)
+
+    conn.in_flight = False
+    stats.last_activity_at = time.time() - 50
+    conn.add_out(10)
+    assert stats.snapshot()['idle_seconds'] < 1
+    conn.tunnel_closed()
+    assert stats.snapshot()['active_tunnels'] == 0
+
+def test_counting_file_counts_reads_and_writes():
+    counted = []
+    wrapped = CountingFile(io.BytesIO(b'GET / HTTP/1.1\r\nHost: a\r\n\r\nbody'), counted.append)
+    assert wrapped.readline() == b'GET / HTTP/1.1\r\n'
+    assert wrapped.read(4) == b'Host'
+    assert sum(counted) == 20
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+r2_multipart 分段上传与检查点续传的测试（S3 客户端用内存实现代替）
+
+续传与放弃旧上传会用到 botocore 的 ClientError，未安装 botocore 时跳过这部分测试。
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from r2_multipart import MIN_PART_SIZE, UploadCheckpoint, multipart_upload, plan_part_size
+
+BUCKET = 'videos'
+KEY = 'static/videos/demo.mp4'
+
+class FakeS3:
+    """
+    记录调用的内存版 S3 分段上传接口；fail_parts 中的段号上传时抛出异常
+    """
+
+    def __init__(self, fail_parts=(), page_size=2):
+        self.fail_parts = set(fail_parts)
+        self.page_size = page_size
+        self.uploads = {}
+        self.created = []
+        self.uploaded = []
+        self.aborted = []
+        self.completed = []
+
+    def create_multipart_upload(self, Bucket, Key, **extra):
+        upload_id = f"upload-{len(self.created) + 1}"
+        self.created.append((Key, extra))
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber in self.fail_parts:
+            raise ConnectionError(f"part {PartNumber} failed")
+        etag = '"' + hashlib.md5(Body).hexdigest() + '"'
+        self.uploads[UploadId][PartNumber] = (etag, len(Body))
+        self.uploaded.append(PartNumber)
+        return {'ETag': etag}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        if UploadId not in self.uploads:
+            from botocore.exceptions import ClientError
+            raise ClientError({'Error': {'Code': 'NoSuchUpload'}}, 'ListParts')
+        numbers = sorted(number for number in self.uploads[UploadId] if number > PartNumberMarker)
+        page = numbers[:self.page_size]
+        response = {'Parts': [
+            {'PartNumber': number, 'ETag': self.uploads[UploadId][number][0],
+             'Size': self.uploads[UploadId][number][1]}
+            for number in page
+        ]}
+        if len(numbers) > len(page):
+            response['IsTruncated'] = True
+            response['NextPartNumberMarker'] = page[-1]
+        return response
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+        self.uploads.pop(UploadId, None)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed.append((UploadId, MultipartUpload['Parts']))
+
+@pytest.fixture
+def video(tmp_path):
+    """
+    3 个完整段加一个不满的尾段
+    """
+    path = tmp_path / 'demo.mp4'
+    data = os.urandom(3 * MIN_PART_SIZE + 12345)
+    path.write_bytes(data)
+    return str(path), hashlib.sha256(data).hexdigest()
+
+def upload(client, video, checkpoint_dir):
+    file_path, sha256 = video
+    return multipart_upload(client, BUCKET, KEY, file_path, sha256, 'video/mp4',
+                            part_size=MIN_PART_SIZE, part_workers=1, checkpoint_dir=str(checkpoint_dir))
+
+def interrupted_upload(video, checkpoint_dir, fail_parts=(3,)):
+    """
+    第一次上传时 fail_parts 中的段失败（其余段照常完成），返回保留着未完成上传的客户端
+    """
+    client = FakeS3(fail_parts=fail_parts)
+    with pytest.raises(ConnectionError):
+        upload(client, video, checkpoint_dir)
+    return client
+
+def test_plan_part_size_respects_limits():
+    assert plan_part_size(1, 1) == MIN_PART_SIZE
+    assert plan_part_size(100000 * MIN_PART_SIZE, MIN_PART_SIZE) == 10 * MIN_PART_SIZE
+
+def test_fresh_upload_completes_and_removes_checkpoint(video, tmp_path):
+    client = FakeS3()
+    assert upload(client, video, tmp_path / 'ckpt') == (4, 0)
+    upload_id, parts = client.completed[0]
+    assert [part['PartNumber'] for part in parts] == [1, 2, 3, 4]
+    assert [part['ETag'] for part in parts] == [client.uploads[upload_id][n][0] for n in (1, 2, 3, 4)]
+    assert client.created[0][1]['Metadata'] == {'sha256': video[1]}
+    assert os.listdir(tmp_path / 'ckpt') == []
+
+def test_failed_upload_keeps_checkpoint(video, tmp_path):
+    client = interrupted_upload(video, tmp_path / 'ckpt')
+    checkpoint = UploadCheckpoint(str(tmp_path / 'ckpt'), BUCKET, KEY)
+    assert checkpoint.upload_id == 'upload-1'
+    assert checkpoint.parts == {number: client.uploads['upload-1'][number][0] for number in (1, 2, 4)}
+    assert client.completed == []
+
+def test_resume_uploads_only_missing_parts(video, tmp_path):
+    pytest.importorskip('botocore')
+    client = interrupted_upload(video, tmp_path / 'ckpt')
+    client.fail_parts.clear()
+    client.uploaded.clear()
+
+    assert upload(client, video, tmp_path / 'ckpt') == (4, 3)
+    assert len(client.created) == 1
+    assert client.uploaded == [3]
+    upload_id, parts = client.completed[0]
+    assert upload_id == 'upload-1'
+    assert [part['PartNumber'] for part in parts] == [1, 2, 3, 4]
+    assert os.listdir(tmp_path / 'ckpt') == []
+
+def test_resume_reuploads_parts_missing_remotely(video, tmp_path):
+    pytest.importorskip('botocore')
+    client = interrupted_upload(video, tmp_path / 'ckpt')
+    client.fail_parts.clear()
+    client.uploaded.clear()
+    del client.uploads['upload-1'][2]
+
+    assert upload(client, video, tmp_path / 'ckpt') == (4, 2)
+    assert client.uploaded == [2, 3]
+    assert [part['PartNumber'] for part in client.completed[0][1]] == [1, 2, 3, 4]
+
+def test_resume_restarts_when_upload_expired(video, tmp_path):
+    pytest.importorskip('botocore')
+    client = interrupted_upload(video, tmp_path / 'ckpt')
+    client.fail_parts.clear()
+    client.uploaded.clear()
+    del client.uploads['upload-1']
+
+    assert upload(client, video, tmp_path / 'ckpt') == (4, 0)
+    assert sorted(client.uploaded) == [1, 2, 3, 4]
+    assert client.completed[0][0] == 'upload-2'
+
+def test_changed_content_aborts_stale_upload(video, tmp_path):
+    pytest.importorskip('botocore')
+    client = interrupted_upload(video, tmp_path / 'ckpt')
+    client.fail_parts.clear()
+    file_path, _ = video
+    with open(file_path, 'r+b') as f:
+        f.write(b'changed')
+    with open(file_path, 'rb') as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    assert upload(client, (file_path, sha256), tmp_path / 'ckpt') == (4, 0)
+    assert client.aborted == ['upload-1']
+    assert client.completed[0][0] == 'upload-2'
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+r2_upload 并发上传与内容哈希跳过的测试（S3 客户端用内存实现代替）
+"""
+
+import hashlib
+import os
+import struct
+import threading
+
+import pytest
+
+from r2_upload import FAILED, SKIPPED, UPLOADED, UploadManifest, collect_jobs, upload_all
+
+class FakeS3:
+    """
+    记录 put_object 的内存版客户端；fail_keys 中的对象上传时抛出异常
+    """
+
+    def __init__(self, fail_keys=()):
+        self.fail_keys = set(fail_keys)
+        self.lock = threading.Lock()
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **extra):
+        if Key in self.fail_keys:
+            raise ConnectionError(f"{Key} failed")
+        with self.lock:
+            self.objects[Key] = (Body.read(), extra)
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            from botocore.exceptions import ClientError
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        body, extra = self.objects[Key]
+        return {'ContentLength': len(body), 'ContentType': extra['ContentType'],
+                'ETag': f'"{hashlib.md5(body).hexdigest()}"', 'Metadata': extra['Metadata']}
+
+@pytest.fixture
+def site(tmp_path):
+    videos = tmp_path / 'static' / 'videos'
+    (videos / 'tian').mkdir(parents=True)
+    (videos / 'tian' / 'a.mp4').write_bytes(b'a' * 100)
+    (videos / 'b.webm').write_bytes(b'b' * 10)
+    (videos / 'notes.txt').write_text('不是视频', encoding='utf-8')
+    return tmp_path
+
+def jobs_for(site, **options):
+    return collect_jobs([str(site / 'static' / 'videos')], str(site / 'static'), 'media/',
+                        'https://cdn.example.com/', extensions=('mp4', 'webm'), **options)
+
+def test_collect_jobs_builds_keys_urls_and_types(site):
+    jobs = jobs_for(site)
+    assert [(job.key, job.mapping_key, job.content_type, job.size) for job in jobs] == [
+        ('media/videos/b.webm', 'videos/b.webm', 'video/webm', 10),
+        ('media/videos/tian/a.mp4', 'videos/tian/a.mp4', 'video/mp4', 100),
+    ]
+    assert jobs[1].public_url == 'https://cdn.example.com/media/videos/tian/a.mp4'
+
+def test_collect_jobs_expands_globs_and_path_mapping_keys(site):
+    jobs = collect_jobs([str(site / 'static' / '**' / '*.mp4')], str(site / 'static'), '',
+                        'https://cdn.example.com', mapping_key='path')
+    assert [job.mapping_key for job in jobs] == [str(site / 'static' / 'videos' / 'tian' / 'a.mp4')]
+
+def test_upload_all_uploads_concurrently_and_reports_failures(site):
+    client = FakeS3(fail_keys={'media/videos/b.webm'})
+    seen = []
+    results = upload_all(client, 'bucket', jobs_for(site), workers=4, acl='public-read', progress=seen.append)
+
+    statuses = {result.job.key: result.status for result in results}
+    assert statuses == {'media/videos/b.webm': FAILED, 'media/videos/tian/a.mp4': UPLOADED}
+    assert len(seen) == 2
+    body, extra = client.objects['media/videos/tian/a.mp4']
+    assert body == b'a' * 100
+    assert extra['ContentType'] == 'video/mp4'
+    assert extra['ACL'] == 'public-read'
+    assert len(extra['Metadata']['sha256']) == 64
+    failed = next(result for result in results if result.status == FAILED)
+    assert 'b.webm failed' in failed.error
+
+def upload_with_manifest(site, client, manifest_path, **options):
+    manifest = UploadManifest(manifest_path)
+    results = upload_all(client, 'bucket', jobs_for(site), workers=2, manifest=manifest, **options)
+    manifest.save()
+    return {result.job.key: result.status for result in results}
+
+def test_manifest_skips_unchanged_objects(site, tmp_path):
+    client = FakeS3()
+    manifest_path = str(tmp_path / 'manifest.json')
+    assert set(upload_with_manifest(site, client, manifest_path).values()) == {UPLOADED}
+    client.objects.clear()
+    assert set(upload_with_manifest(site, client, manifest_path).values()) == {SKIPPED}
+    assert client.objects == {}
+
+def test_manifest_uploads_changed_content_only(site, tmp_path):
+    client = FakeS3()
+    manifest_path = str(tmp_path / 'manifest.json')
+    upload_with_manifest(site, client, manifest_path)
+    (site / 'static' / 'videos' / 'b.webm').write_bytes(b'c' * 10)
+    # 只改修改时间不算变化
+    os.utime(site / 'static' / 'videos' / 'tian' / 'a.mp4', ns=(1, 1))
+    assert upload_with_manifest(site, client, manifest_path) == {
+        'media/videos/b.webm': UPLOADED,
+        'media/videos/tian/a.mp4': SKIPPED,
+    }
+
+def test_manifest_does_not_record_failed_uploads(site, tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    upload_with_manifest(site, FakeS3(fail_keys={'media/videos/b.webm'}), manifest_path)
+    assert upload_with_manifest(site, FakeS3(), manifest_path) == {
+        'media/videos/b.webm': UPLOADED,
+        'media/videos/tian/a.mp4': SKIPPED,
+    }
+
+def test_manifest_keyed_by_bucket_and_faststart(site, tmp_path):
+    client = FakeS3()
+    manifest_path = str(tmp_path / 'manifest.json')
+    upload_with_manifest(site, client, manifest_path)
+    manifest = UploadManifest(manifest_path)
+    results = upload_all(client, 'other-bucket', jobs_for(site), workers=2, manifest=manifest)
+    assert {result.status for result in results} == {UPLOADED}
+    # 开启 faststart 后需要重新上传（非 moov 在末尾的文件原样上传）
+    statuses = upload_with_manifest(site, client, manifest_path, faststart_cache=str(tmp_path / 'faststart'))
+    assert set(statuses.values()) == {UPLOADED}
+
+def atom(kind, payload):
+    return struct.pack('>I4s', len(payload) + 8, kind) + payload
+
+def moov_last_mp4():
+    """
+    moov 在 mdat 之后、需要 faststart 处理的最小 MP4
+    """
+    ftyp = atom(b'ftyp', b'isom' + bytes(4))
+    stco = atom(b'stco', struct.pack('>III', 0, 1, len(ftyp) + 8))
+    moov = atom(b'moov', atom(b'trak', atom(b'mdia', atom(b'minf', atom(b'stbl', stco)))))
+    return ftyp + atom(b'mdat', b'frame' * 20) + moov
+
+def test_remote_check_skips_matching_objects(site):
+    pytest.importorskip('botocore')
+    client = FakeS3()
+    upload_all(client, 'bucket', jobs_for(site), workers=2)
+    # 没有 sha256 元数据的对象（旧脚本上传）按大小与 ETag 比较
+    for _, extra in client.objects.values():
+        extra['Metadata'] = {}
+    client.objects['media/videos/b.webm'] = (b'x' * 10, client.objects['media/videos/b.webm'][1])
+    results = upload_all(client, 'bucket', jobs_for(site), workers=2, remote_check=True)
+    assert {result.job.key: result.status for result in results} == {
+        'media/videos/b.webm': UPLOADED,
+        'media/videos/tian/a.mp4': SKIPPED,
+    }
+
+def test_remote_check_compares_faststart_output(site, tmp_path):
+    pytest.importorskip('botocore')
+    source = site / 'static' / 'videos' / 'tian' / 'a.mp4'
+    source.write_bytes(moov_last_mp4())
+    cache = str(tmp_path / 'faststart')
+    client = FakeS3()
+    upload_all(client, 'bucket', jobs_for(site), workers=2, faststart_cache=cache)
+    body, extra = client.objects['media/videos/tian/a.mp4']
+    assert body != source.read_bytes()
+
+    for _, extra in client.objects.values():
+        extra['Metadata'] = {}
+    results = upload_all(client, 'bucket', jobs_for(site), workers=2, remote_check=True, faststart_cache=cache)
+    assert {result.status for result in results} == {SKIPPED}